@@ -1,13 +1,16 @@
 import os
+import asyncio
 import logging
-from typing import List, Dict, Optional, Any
+from functools import partial
+from typing import List, Dict, Optional, Any, Tuple
 from abc import ABC, abstractmethod
 
 from KnowledgeManager.Dependencies.compat import get_langchain_text_splitter
 RecursiveCharacterTextSplitter = get_langchain_text_splitter('RecursiveCharacterTextSplitter')
 
 from Config.model_config import RAG_CONFIG
-from KnowledgeManager.Dependencies.Embeddings import LocalEmbeddings
+from KnowledgeManager.Dependencies.Embeddings import get_local_embeddings
+from KnowledgeManager.Dependencies.token_counter import get_token_counter
 
 # 尝试导入混合文本分割器
 try:
@@ -18,6 +21,24 @@ except ImportError:
     logging.warning("混合文本分割器不可用，将使用默认的递归字符分割器")
 
 
+# 检索模式：向量 / BM25 / 混合
+SEARCH_MODES = ("vector", "bm25", "hybrid")
+
+
+def describe_source(metadata: Dict[str, Any]) -> str:
+    """检索结果中引用的来源：文件名，附带页码与章节"""
+    parts = [str(metadata.get("filename"))]
+    page_start, page_end = metadata.get("page_start"), metadata.get("page_end")
+    if page_start is not None:
+        if page_end is None or page_end == page_start:
+            parts.append(f"第{page_start}页")
+        else:
+            parts.append(f"第{page_start}-{page_end}页")
+    if metadata.get("section"):
+        parts.append(metadata["section"])
+    return ", ".join(parts)
+
+
 class BaseKnowledgeManager(ABC):
     """知识管理器抽象基类 (迁移自 report-26v0)"""
     
@@ -27,59 +48,115 @@ class BaseKnowledgeManager(ABC):
         self.knowledge_base_name = knowledge_base_name
         self.embedding_model = embedding_model or RAG_CONFIG["embeddings"]["default_model"]
         
-        # 初始化embedding服务
-        self.embeddings = LocalEmbeddings(self.embedding_model)
+        # embedding服务（同一模型的所有知识库共享一个客户端）
+        self.embeddings = get_local_embeddings(self.embedding_model)
         
         # 获取embedding维度
         model_config = RAG_CONFIG["embeddings"]["models"].get(self.embedding_model, {})
         self.dimension = model_config.get("dimension", 1024)
         
+        self._splitter_settings = None
+        self.set_text_splitter(chunk_size, chunk_overlap, use_hybrid_splitter)
+        
+        logging.info(f"初始化知识库管理器: {knowledge_base_name}")
+    
+    def set_text_splitter(self, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None,
+                          use_hybrid_splitter: bool = True):
+        """设置本实例默认的文本分割器；参数与当前一致时不重建"""
+        settings = (chunk_size, chunk_overlap, use_hybrid_splitter)
+        if settings == self._splitter_settings:
+            return
+        self.text_splitter, self.ingest_settings = self.build_text_splitter(chunk_size, chunk_overlap, use_hybrid_splitter)
+        self.actual_chunk_size = self.ingest_settings["chunk_size"]
+        self.actual_chunk_overlap = self.ingest_settings["chunk_overlap"]
+        self._splitter_settings = settings
+    
+    def build_text_splitter(self, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None,
+                            use_hybrid_splitter: bool = True) -> Tuple[Any, Dict[str, Any]]:
+        """按切分参数创建文本分割器，返回 (分割器, 入库设置)"""
+        model_config = RAG_CONFIG["embeddings"]["models"].get(self.embedding_model, {})
+        token_counter = get_token_counter(self.embedding_model)
+        
         # 文本分割器
         if chunk_size is not None and chunk_overlap is not None:
             actual_chunk_size = chunk_size
             actual_chunk_overlap = chunk_overlap
+        elif token_counter is not None:
+            actual_chunk_size = (model_config.get("chunk_tokens") or model_config.get("max_input_tokens")
+                                 or model_config.get("chunk_size", RAG_CONFIG["embeddings"]["chunk_size"]))
+            actual_chunk_overlap = model_config.get("chunk_overlap_tokens", actual_chunk_size // 10)
         else:
             actual_chunk_size = model_config.get("chunk_size", RAG_CONFIG["embeddings"]["chunk_size"])
             actual_chunk_overlap = RAG_CONFIG["embeddings"]["chunk_overlap"]
+        if token_counter is not None and model_config.get("max_input_tokens"):
+            actual_chunk_size = min(actual_chunk_size, model_config["max_input_tokens"])
+            actual_chunk_overlap = min(actual_chunk_overlap, actual_chunk_size // 2)
+        length_function = token_counter or len
         
+        text_splitter = None
         if use_hybrid_splitter and HYBRID_SPLITTER_AVAILABLE:
             try:
-                self.text_splitter = MarkdownHybridSplitter(
+                text_splitter = MarkdownHybridSplitter(
                     chunk_size=actual_chunk_size,
-                    chunk_overlap=actual_chunk_overlap
+                    chunk_overlap=actual_chunk_overlap,
+                    length_function=token_counter
                 )
                 logging.info("使用混合文本分割器")
             except Exception as e:
                 logging.warning(f"初始化混合文本分割器失败，回退到递归字符分割器: {e}")
-                self.text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=actual_chunk_size,
-                    chunk_overlap=actual_chunk_overlap,
-                    length_function=len,
-                    separators=["\n\n", "\n", "。", "！", "？", "；", "，", ""]
-                )
-        else:
-            self.text_splitter = RecursiveCharacterTextSplitter(
+        if text_splitter is None:
+            text_splitter = RecursiveCharacterTextSplitter(
                 chunk_size=actual_chunk_size,
                 chunk_overlap=actual_chunk_overlap,
-                length_function=len,
+                length_function=length_function,
                 separators=["\n\n", "\n", "。", "！", "？", "；", "，", ""]
             )
         
-        self.actual_chunk_size = actual_chunk_size
-        self.actual_chunk_overlap = actual_chunk_overlap
-        
-        logging.info(f"初始化知识库管理器: {knowledge_base_name}")
+        settings = {
+            "chunk_size": actual_chunk_size,
+            "chunk_overlap": actual_chunk_overlap,
+            "splitter": type(text_splitter).__name__,
+            "embedding_model": self.embedding_model
+        }
+        # 按字符数切分时不记录，已有知识库的设置指纹保持不变
+        if token_counter is not None:
+            settings["tokenizer"] = token_counter.spec
+        return text_splitter, settings
+    
+    def is_stale(self) -> bool:
+        """磁盘上的知识库是否已被其他实例或进程修改（需要重新加载）；子类按存储方式实现"""
+        return False
+    
+    def is_busy(self) -> bool:
+        """是否有正在进行的写入或后台维护；注册表不淘汰忙碌的实例"""
+        return False
+    
+    def memory_bytes(self) -> int:
+        """估算常驻内存，用于管理器注册表按内存预算淘汰"""
+        return 0
+    
+    def get_ingest_settings(self) -> Dict[str, Any]:
+        """影响切分与向量化结果的设置，任一项变化时已入库的文件需要重新处理"""
+        return dict(self.ingest_settings)
     
     @abstractmethod
     def initialize(self):
         pass
     
     @abstractmethod
-    def load_from_folder(self, folder_path: str) -> Dict[str, Any]:
+    def load_from_folder(self, folder_path: str, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+        pass
+    
+    @abstractmethod
+    def ingest_files(self, files: List[Dict[str, str]], tags: Optional[List[str]] = None,
+                     resume_key: Optional[str] = None, chunk_size: Optional[int] = None,
+                     chunk_overlap: Optional[int] = None, use_hybrid_splitter: Optional[bool] = None) -> Dict[str, Any]:
         pass
     
     @abstractmethod
-    def search(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3) -> Dict[str, Any]:
+    def search(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
         pass
     
     @abstractmethod
@@ -92,24 +169,94 @@ class BaseKnowledgeManager(ABC):
     
     @abstractmethod
     def search_hybrid(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None, 
-                      vector_weight: float = 0.7, keyword_weight: float = 0.3, score_threshold: float = 0.3) -> Dict[str, Any]:
+                      vector_weight: float = 0.7, keyword_weight: float = 0.3, score_threshold: float = 0.3,
+                      fusion: Optional[str] = None, query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
         pass
     
+    async def _run_blocking(self, func, *args, **kwargs):
+        """在线程池中执行阻塞调用（索引加载、FAISS扫描、读取片段），不阻塞事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args, **kwargs))
+    
+    async def asearch(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3,
+                      nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """search 的异步版本，默认整体放到线程池执行；子类可改用异步 embedding 请求"""
+        return await self._run_blocking(self.search, query, k=k, filters=filters, score_threshold=score_threshold,
+                                        nprobe=nprobe, ef_search=ef_search, query_embedding=query_embedding)
+    
+    async def asearch_bm25(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None,
+                           score_threshold: float = 0.3) -> Dict[str, Any]:
+        """search_bm25 的异步版本（纯本地计算，放到线程池执行）"""
+        return await self._run_blocking(self.search_bm25, query, k=k, filters=filters, score_threshold=score_threshold)
+    
+    async def asearch_hybrid(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None,
+                             vector_weight: float = 0.7, keyword_weight: float = 0.3, score_threshold: float = 0.3,
+                             fusion: Optional[str] = None, query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """search_hybrid 的异步版本"""
+        return await self._run_blocking(self.search_hybrid, query, k=k, filters=filters, vector_weight=vector_weight,
+                                        keyword_weight=keyword_weight, score_threshold=score_threshold, fusion=fusion,
+                                        query_embedding=query_embedding)
+    
+    def search_many(self, queries: List[str], k: int = 10, filters: Optional[Dict[str, Any]] = None,
+                    score_threshold: float = 0.3, search_mode: str = "vector", vector_weight: float = 0.7,
+                    keyword_weight: float = 0.3, fusion: Optional[str] = None,
+                    query_embeddings: Optional[List[List[float]]] = None) -> List[Dict[str, Any]]:
+        """批量检索，返回与 queries 对齐的结果列表"""
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"不支持的检索模式: {search_mode}，可选: {SEARCH_MODES}")
+        results = []
+        for i, query in enumerate(queries):
+            query_embedding = query_embeddings[i] if query_embeddings is not None else None
+            if search_mode == "bm25":
+                results.append(self.search_bm25(query, k=k, filters=filters, score_threshold=score_threshold))
+            elif search_mode == "hybrid":
+                results.append(self.search_hybrid(query, k=k, filters=filters, vector_weight=vector_weight,
+                                                  keyword_weight=keyword_weight, score_threshold=score_threshold,
+                                                  fusion=fusion, query_embedding=query_embedding))
+            else:
+                results.append(self.search(query, k=k, filters=filters, score_threshold=score_threshold,
+                                           query_embedding=query_embedding))
+        return results
+    
+    async def asearch_many(self, queries: List[str], k: int = 10, filters: Optional[Dict[str, Any]] = None,
+                           score_threshold: float = 0.3, search_mode: str = "vector", vector_weight: float = 0.7,
+                           keyword_weight: float = 0.3, fusion: Optional[str] = None,
+                           query_embeddings: Optional[List[List[float]]] = None) -> List[Dict[str, Any]]:
+        """search_many 的异步版本，默认整体放到线程池执行"""
+        return await self._run_blocking(self.search_many, queries, k=k, filters=filters, score_threshold=score_threshold,
+                                        search_mode=search_mode, vector_weight=vector_weight,
+                                        keyword_weight=keyword_weight, fusion=fusion, query_embeddings=query_embeddings)
+    
     def search_with_rerank(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None, 
-                          use_rerank: bool = True, score_threshold: float = 0.3) -> Dict[str, Any]:
+                          use_rerank: bool = True, score_threshold: float = 0.3,
+                          budget_ms: Optional[float] = None) -> Dict[str, Any]:
         search_results = self.search(query, k=k, filters=filters, score_threshold=score_threshold)
         if use_rerank and search_results.get("success", False):
             from KnowledgeManager.KnowledgeManagerFactory import KnowledgeManagerFactory
-            reranked_results = KnowledgeManagerFactory.apply_rerank(query, search_results, k)
+            reranked_results = KnowledgeManagerFactory.apply_rerank(query, search_results, k, budget_ms=budget_ms)
             return reranked_results
         return search_results
     
+    async def asearch_with_rerank(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None,
+                                  use_rerank: bool = True, score_threshold: float = 0.3,
+                                  budget_ms: Optional[float] = None) -> Dict[str, Any]:
+        """search_with_rerank 的异步版本"""
+        search_results = await self.asearch(query, k=k, filters=filters, score_threshold=score_threshold)
+        if use_rerank and search_results.get("success", False):
+            from KnowledgeManager.KnowledgeManagerFactory import KnowledgeManagerFactory
+            return await KnowledgeManagerFactory.aapply_rerank(query, search_results, k, budget_ms=budget_ms)
+        return search_results
+    
     @abstractmethod
     def search_with_details(self, query: str, k: int = 5, filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3) -> Dict[str, Any]:
         pass
     
     @abstractmethod
-    def add_text(self, content: str, source: str = "user_input") -> Dict[str, Any]:
+    def add_text(self, content: str, source: str = "user_input", tags: Optional[List[str]] = None) -> Dict[str, Any]:
+        pass
+    
+    @abstractmethod
+    def add_chunks(self, chunks: List[str], metadatas: List[Dict[str, Any]]) -> Dict[str, Any]:
         pass
     
     @staticmethod
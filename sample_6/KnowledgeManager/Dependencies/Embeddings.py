@@ -1,8 +1,41 @@
 import os
+import time
 import logging
-from typing import List, Optional
-from openai import OpenAI
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Callable, Tuple
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError
 from Config.model_config import RAG_CONFIG
+from KnowledgeManager.Dependencies.embedding_cache import get_embedding_cache
+from KnowledgeManager.Dependencies.token_counter import estimate_tokens, get_token_counter
+
+# 同一模型所有实例共享的在途请求上限
+_inflight_limits: Dict[str, threading.BoundedSemaphore] = {}
+_inflight_lock = threading.Lock()
+
+
+def _is_retryable(error: Exception) -> bool:
+    """连接错误、超时、429 与 5xx 可重试，其余 4xx 错误不重试"""
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _inflight_limit(model_name: str, max_concurrency: int) -> threading.BoundedSemaphore:
+    with _inflight_lock:
+        if model_name not in _inflight_limits:
+            _inflight_limits[model_name] = threading.BoundedSemaphore(max_concurrency)
+        return _inflight_limits[model_name]
+
+
+async def _acquire_async(limit: threading.BoundedSemaphore, interval: float = 0.005):
+    """在事件循环中获取与同步调用共享的在途请求上限：不阻塞事件循环，等待期间可以取消"""
+    while not limit.acquire(blocking=False):
+        await asyncio.sleep(interval)
 
 class LocalEmbeddings:
     """本地embedding服务包装器 (迁移自 report-26v0)"""
@@ -21,6 +54,16 @@ class LocalEmbeddings:
         self.dimension = model_config["dimension"]
         self.model_name = model_name
         
+        # 批量请求设置：按条数和 token 预算切批，多批并发请求，失败的批次单独重试
+        embeddings_config = RAG_CONFIG["embeddings"]
+        self.batch_size = int(model_config.get("batch_size", embeddings_config.get("batch_size", 64)))
+        self.max_batch_tokens = int(model_config.get("max_batch_tokens", embeddings_config.get("max_batch_tokens", 8000)))
+        self.max_concurrency = int(model_config.get("max_concurrency", embeddings_config.get("max_concurrency", 4)))
+        self.max_retries = int(embeddings_config.get("max_retries", 3))
+        self.retry_backoff = float(embeddings_config.get("retry_backoff", 1.0))
+        # 配置了分词器时按实际 token 数切批，否则按字符类别估算
+        self.count_tokens = get_token_counter(model_name) or estimate_tokens
+        
         logging.info(f"初始化embedding服务: {self.base_url}, 模型: {self.model}")
         
         try:
@@ -32,21 +75,184 @@ class LocalEmbeddings:
         except Exception as e:
             logging.error(f"Embedding服务初始化失败: {str(e)}")
             raise
+        
+        # 按模型共享的持久化缓存，命中的文本不再请求embedding服务
+        self.cache = get_embedding_cache(model_name, self.model, self.base_url)
+        # 异步客户端的连接池绑定事件循环，按循环分别创建
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+    
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+            self._async_clients[loop] = client
+        return client
+    
+    def _lookup_cache(self, texts: List[str]) -> Tuple[List[Any], Dict[bytes, List[int]]]:
+        """查询缓存，返回 (与 texts 对齐的缓存结果, {未命中文本的键: 位置})"""
+        cached, keys = self.cache.get_many(texts)
+        missing: Dict[bytes, List[int]] = {}
+        for i, vector in enumerate(cached):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+        return cached, missing
+    
+    def _cache_writer(self, missing_keys: List[bytes]) -> Callable[[int, List[List[float]]], None]:
+        # 每完成一批立即写入缓存，中途失败时已完成的批次下次不再请求
+        return lambda start, batch: self.cache.put_many(missing_keys[start:start + len(batch)], batch)
+    
+    @staticmethod
+    def _merge_results(cached: List[Any], missing: Dict[bytes, List[int]],
+                       embeddings: List[List[float]]) -> List[List[float]]:
+        results = [None if vector is None else vector.tolist() for vector in cached]
+        for positions, embedding in zip(missing.values(), embeddings):
+            for i in positions:
+                results[i] = embedding
+        return results
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """批量嵌入文档"""
-        try:
-            response = self.client.embeddings.create(
-                input=texts,
-                model=self.model
-            )
-            return [item.embedding for item in response.data]
-        except Exception as e:
-            logging.error(f"批量嵌入文档失败: {str(e)}")
-            raise
+        """批量嵌入文档，只对缓存未命中的文本（批内去重后）请求embedding服务"""
+        if self.cache is None:
+            return self._request_embeddings(texts)
+        cached, missing = self._lookup_cache(texts)
+        if not missing:
+            return [vector.tolist() for vector in cached]
+        missing_keys = list(missing)
+        embeddings = self._request_embeddings([texts[positions[0]] for positions in missing.values()],
+                                              on_batch=self._cache_writer(missing_keys))
+        return self._merge_results(cached, missing, embeddings)
     
     def embed_query(self, text: str) -> List[float]:
         """嵌入查询"""
+        return self.embed_documents([text])[0] if self.cache is not None else self._request_query(text)
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """embed_documents 的异步版本：请求走异步客户端，等待期间不占用事件循环"""
+        if self.cache is None:
+            return await self._arequest_embeddings(texts)
+        # 缓存读写涉及磁盘，放到线程池执行
+        loop = asyncio.get_running_loop()
+        cached, missing = await loop.run_in_executor(None, self._lookup_cache, texts)
+        if not missing:
+            return [vector.tolist() for vector in cached]
+        missing_keys = list(missing)
+        embeddings = await self._arequest_embeddings([texts[positions[0]] for positions in missing.values()],
+                                                     on_batch=self._cache_writer(missing_keys))
+        return self._merge_results(cached, missing, embeddings)
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        """embed_query 的异步版本"""
+        return (await self.aembed_documents([text]))[0]
+    
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """缓存命中/未命中计数（同一模型的所有实例共享），未启用缓存时返回 None"""
+        return self.cache.stats() if self.cache is not None else None
+    
+    def _plan_batches(self, texts: List[str]) -> List[Tuple[int, int]]:
+        """按条数和 token 数切分为连续区间 [(start, end)]"""
+        batches = []
+        start, tokens = 0, 0
+        for i, text in enumerate(texts):
+            text_tokens = self.count_tokens(text)
+            if i > start and (i - start >= self.batch_size or tokens + text_tokens > self.max_batch_tokens):
+                batches.append((start, i))
+                start, tokens = i, 0
+            tokens += text_tokens
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+    
+    def _request_embeddings(self, texts: List[str],
+                            on_batch: Optional[Callable[[int, List[List[float]]], None]] = None) -> List[List[float]]:
+        """分批并发请求embedding服务，结果按输入顺序拼回"""
+        if not texts:
+            return []
+        batches = self._plan_batches(texts)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        limit = _inflight_limit(self.model_name, self.max_concurrency)
+        
+        def run(batch: Tuple[int, int]):
+            start, end = batch
+            with limit:
+                embeddings = self._request_batch(texts[start:end])
+            results[start:end] = embeddings
+            if on_batch:
+                on_batch(start, embeddings)
+        
+        if len(batches) == 1:
+            run(batches[0])
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches)),
+                                    thread_name_prefix="embedding") as executor:
+                # list() 使任一批次最终失败时在这里抛出
+                list(executor.map(run, batches))
+        return results
+    
+    async def _arequest_embeddings(self, texts: List[str],
+                                   on_batch: Optional[Callable[[int, List[List[float]]], None]] = None) -> List[List[float]]:
+        """_request_embeddings 的异步版本"""
+        if not texts:
+            return []
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        limit = _inflight_limit(self.model_name, self.max_concurrency)
+        
+        async def run(batch: Tuple[int, int]):
+            start, end = batch
+            await _acquire_async(limit)
+            try:
+                embeddings = await self._arequest_batch(texts[start:end])
+            finally:
+                limit.release()
+            results[start:end] = embeddings
+            if on_batch:
+                await asyncio.get_running_loop().run_in_executor(None, on_batch, start, embeddings)
+        
+        await asyncio.gather(*(run(batch) for batch in self._plan_batches(texts)))
+        return results
+    
+    @staticmethod
+    def _parse_response(response: Any, count: int) -> List[List[float]]:
+        data = sorted(response.data, key=lambda item: getattr(item, "index", 0))
+        if len(data) != count:
+            raise ValueError(f"embedding服务返回 {len(data)} 条结果，请求 {count} 条")
+        return [item.embedding for item in data]
+    
+    def _retry_delay(self, texts: List[str], attempt: int, error: Exception) -> float:
+        """返回重试前的等待秒数；不可重试的错误或已达重试上限时记录错误并重新抛出"""
+        if attempt >= self.max_retries or not _is_retryable(error):
+            logging.error(f"批量嵌入文档失败: {str(error)}")
+            raise error
+        delay = self.retry_backoff * 2 ** attempt
+        logging.warning(f"批量嵌入 {len(texts)} 条失败，{delay:.1f} 秒后重试 ({attempt + 1}/{self.max_retries}): {str(error)}")
+        return delay
+    
+    def _request_batch(self, texts: List[str]) -> List[List[float]]:
+        """请求单个批次，失败时按指数退避重试 max_retries 次"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.embeddings.create(
+                    input=texts,
+                    model=self.model
+                )
+                return self._parse_response(response, len(texts))
+            except Exception as e:
+                time.sleep(self._retry_delay(texts, attempt, e))
+    
+    async def _arequest_batch(self, texts: List[str]) -> List[List[float]]:
+        """_request_batch 的异步版本"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.async_client.embeddings.create(
+                    input=texts,
+                    model=self.model
+                )
+                return self._parse_response(response, len(texts))
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(texts, attempt, e))
+    
+    def _request_query(self, text: str) -> List[float]:
         try:
             response = self.client.embeddings.create(
                 input=[text],
@@ -59,3 +265,18 @@ class LocalEmbeddings:
     
     def get_embedding_model(self) -> str:
         return self.model
+
+
+_shared_embeddings: Dict[str, LocalEmbeddings] = {}
+_shared_embeddings_lock = threading.Lock()
+
+
+def get_local_embeddings(model_name: Optional[str] = None) -> LocalEmbeddings:
+    """按模型返回进程内共享的 LocalEmbeddings"""
+    model_name = model_name or RAG_CONFIG["embeddings"]["default_model"]
+    with _shared_embeddings_lock:
+        embeddings = _shared_embeddings.get(model_name)
+        if embeddings is None:
+            embeddings = LocalEmbeddings(model_name)
+            _shared_embeddings[model_name] = embeddings
+        return embeddings
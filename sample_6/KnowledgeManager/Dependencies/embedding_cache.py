@@ -0,0 +1,220 @@
+"""
+embedding 持久化缓存
+按模型分命名空间、以文本哈希为键缓存向量，重复文本不再调用 embedding 服务
+"""
+
+import re
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Dict, Optional, Any, Tuple
+
+import numpy as np  # pyright: ignore[reportMissingImports]
+
+from Config.model_config import RAG_CONFIG
+from KnowledgeManager.Dependencies.file_lock import FileLock
+
+KEY_BYTES = 16
+
+DEFAULT_CACHE_CONFIG = {
+    "enabled": True,
+    "directory": None,        # None 时放在知识库根目录同级的 embedding_cache 目录
+    "memory_items": 10000,    # LRU 内存缓存的向量条数上限
+    "merge_threshold": 50000  # 本进程新写入的条目超过该数时合并进排序查找表
+}
+
+
+def get_cache_config() -> Dict[str, Any]:
+    config = dict(DEFAULT_CACHE_CONFIG)
+    config.update(RAG_CONFIG["embeddings"].get("cache", {}))
+    if not config["directory"]:
+        base_directory = Path(RAG_CONFIG["vector_store"]["faiss"]["base_directory"])
+        config["directory"] = str(base_directory.parent / "embedding_cache")
+    return config
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingCache:
+    """单个 embedding 模型的向量缓存，同一进程内按命名空间共享，线程安全；多个进程可同时追加写入"""
+
+    def __init__(self, directory: Path, memory_items: int = 10000, merge_threshold: int = 50000):
+        self.directory = Path(directory)
+        self.vectors_file = self.directory / "vectors.f32"
+        self.keys_file = self.directory / "keys.bin"
+        self.meta_file = self.directory / "meta.json"
+        self._file_lock = FileLock(self.directory / "cache.lock")
+        self.memory_items = memory_items
+        self.merge_threshold = merge_threshold
+        self.dimension: Optional[int] = None
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._sorted_hi = np.empty(0, dtype=np.uint64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+        self._recent: Dict[bytes, int] = {}
+        self._vectors = None
+        self._keys = None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._open()
+
+    def _open(self):
+        if not self.meta_file.exists():
+            return
+        with self._file_lock:
+            self._read_meta()
+            self.rows = self._disk_rows()
+        self._rebuild_lookup()
+
+    def _read_meta(self):
+        with open(self.meta_file, 'r', encoding='utf-8') as f:
+            self.dimension = int(json.load(f)["dimension"])
+
+    def _disk_rows(self) -> int:
+        """缓存文件锁内调用：磁盘上完整的行数；追加写入中断时两个文件的行数可能不一致，截断到较短者"""
+        key_rows = self.keys_file.stat().st_size // KEY_BYTES if self.keys_file.exists() else 0
+        vector_rows = self.vectors_file.stat().st_size // (self.dimension * 4) if self.vectors_file.exists() else 0
+        rows = min(key_rows, vector_rows)
+        for file_path, row_bytes in ((self.keys_file, KEY_BYTES), (self.vectors_file, self.dimension * 4)):
+            if file_path.exists() and file_path.stat().st_size > rows * row_bytes:
+                with open(file_path, 'r+b') as f:
+                    f.truncate(rows * row_bytes)
+        return rows
+
+    def _rebuild_lookup(self):
+        """按哈希高 64 位排序建立磁盘查找表；同一文本重复写入时保留任一行即可"""
+        self._map_files()
+        if self.rows == 0:
+            return
+        hi = self._keys[:, :8].copy().view(np.uint64).ravel()
+        order = np.argsort(hi, kind="stable")
+        self._sorted_hi = hi[order]
+        self._sorted_rows = order.astype(np.int64)
+        self._recent = {}
+
+    def _map_files(self):
+        if self.rows == 0:
+            self._vectors, self._keys = None, None
+            return
+        self._vectors = np.memmap(self.vectors_file, dtype=np.float32, mode='r', shape=(self.rows, self.dimension))
+        self._keys = np.memmap(self.keys_file, dtype=np.uint8, mode='r', shape=(self.rows, KEY_BYTES))
+
+    def _lookup_disk(self, keys: List[bytes]) -> List[int]:
+        """返回每个键在磁盘上的行号，未命中为 -1；行号对应的键与查询的键一致才算命中"""
+        rows = [self._recent.get(key, -1) for key in keys]
+        rows = [row if row >= 0 and self._keys[row].tobytes() == key else -1 for row, key in zip(rows, keys)]
+        if len(self._sorted_hi) == 0:
+            return rows
+        pending = [i for i, row in enumerate(rows) if row < 0]
+        if not pending:
+            return rows
+        hi = np.frombuffer(b"".join(keys[i][:8] for i in pending), dtype=np.uint64)
+        positions = np.minimum(np.searchsorted(self._sorted_hi, hi), len(self._sorted_hi) - 1)
+        for i, position, value in zip(pending, positions, hi):
+            if self._sorted_hi[position] != value:
+                continue
+            row = int(self._sorted_rows[position])
+            # 高 64 位相同再核对完整哈希
+            if self._keys[row].tobytes() == keys[i]:
+                rows[i] = row
+        return rows
+
+    def get_many(self, texts: List[str]) -> Tuple[List[Optional[np.ndarray]], List[bytes]]:
+        """批量查询，返回 (与 texts 对齐的向量或 None, 供 put_many 复用的键)"""
+        keys = [text_key(text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            disk_positions = []
+            for i, key in enumerate(keys):
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    results[i] = vector
+                    self.counters["memory_hits"] += 1
+                else:
+                    disk_positions.append(i)
+            if disk_positions and self.rows:
+                rows = self._lookup_disk([keys[i] for i in disk_positions])
+                for i, row in zip(disk_positions, rows):
+                    if row >= 0:
+                        vector = np.array(self._vectors[row])
+                        results[i] = vector
+                        self._remember(keys[i], vector)
+                        self.counters["disk_hits"] += 1
+            self.counters["misses"] += sum(1 for vector in results if vector is None)
+        return results, keys
+
+    def put_many(self, keys: List[bytes], vectors: List[List[float]]):
+        """追加写入新向量：在缓存文件锁内先写向量再写键，起始行号取磁盘上的实际行数（其他进程也会追加）"""
+        if not keys:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock:
+            if self.dimension is None and self.meta_file.exists():
+                self._read_meta()
+            if self.dimension is None:
+                self.dimension = int(array.shape[1])
+                self.directory.mkdir(parents=True, exist_ok=True)
+                with open(self.meta_file, 'w', encoding='utf-8') as f:
+                    json.dump({"dimension": self.dimension}, f)
+            elif array.shape[1] != self.dimension:
+                logging.warning(f"embedding 维度 {array.shape[1]} 与缓存维度 {self.dimension} 不一致，不写入缓存")
+                return
+            start = self._disk_rows()
+            with open(self.vectors_file, 'ab') as f:
+                f.write(array.tobytes())
+            with open(self.keys_file, 'ab') as f:
+                f.write(b"".join(keys))
+            for offset, key in enumerate(keys):
+                self._recent[key] = start + offset
+                self._remember(key, array[offset])
+            self.rows = start + len(keys)
+            if len(self._recent) > self.merge_threshold:
+                self._rebuild_lookup()
+            else:
+                self._map_files()
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.memory_items:
+            self._lru.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        total = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(hits / total, 4) if total else None,
+            "cached_vectors": self.rows,
+            "memory_vectors": len(self._lru),
+            "disk_mb": round(self.rows * ((self.dimension or 0) * 4 + KEY_BYTES) / 2 ** 20, 2)
+        }
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str, model: str, base_url: str) -> Optional[EmbeddingCache]:
+    """按模型返回进程内共享的缓存实例；配置关闭时返回 None"""
+    config = get_cache_config()
+    if not config["enabled"]:
+        return None
+    digest = hashlib.sha1(f"{model}|{base_url}".encode('utf-8')).hexdigest()[:8]
+    namespace = f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)}-{digest}"
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = EmbeddingCache(
+                Path(config["directory"]) / namespace,
+                memory_items=int(config["memory_items"]),
+                merge_threshold=int(config["merge_threshold"])
+            )
+            _caches[namespace] = cache
+        return cache
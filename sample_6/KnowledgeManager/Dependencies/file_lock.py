@@ -0,0 +1,57 @@
+"""
+跨进程文件锁
+fcntl.flock 排他锁，同一实例在同一线程内可重复获取；不支持 fcntl 的平台上只在进程内互斥
+"""
+
+import os
+import logging
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    logging.warning("当前平台不支持 fcntl，文件锁只在进程内生效，不要在多个进程中写入同一知识库或 embedding 缓存")
+
+
+class FileLock:
+    """排他文件锁，用 with 语句获取；释放时关闭文件描述符"""
+
+    def __init__(self, file_path: Path):
+        self.file_path = Path(file_path)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self.file_path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(fd, fcntl.LOCK_EX)
+                except BaseException:
+                    os.close(fd)
+                    raise
+                self._fd = fd
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            os.close(fd)
+        self._lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,100 @@
+"""
+按 embedding 模型的分词器计算文本长度
+带 LRU 缓存的 TokenCounter 作为分割器的长度函数，片段大小按 token 计
+
+配置 RAG_CONFIG["embeddings"]["models"][模型名]: tokenizer（"tiktoken:<编码>" / "huggingface:<名称或路径>" / "estimate"）、
+max_input_tokens、chunk_tokens、chunk_overlap_tokens、token_cache_size
+"""
+
+import re
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+from Config.model_config import RAG_CONFIG
+
+_CJK_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]')
+
+# 超过该字符数的文本（整章、整篇）一般只测量一次，不放入缓存，避免缓存占用大量内存
+_MAX_CACHED_CHARS = 65536
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符按 1 个计，其余按 4 个字符 1 个计"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _load_tokenizer(spec: str) -> Callable[[str], int]:
+    """按 "类型:名称" 加载分词器，返回 文本 -> token 数"""
+    kind, _, name = spec.partition(":")
+    if kind == "estimate":
+        return estimate_tokens
+    if kind == "tiktoken":
+        import tiktoken  # pyright: ignore[reportMissingImports]
+        encoding = tiktoken.get_encoding(name)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    if kind == "huggingface":
+        from tokenizers import Tokenizer  # pyright: ignore[reportMissingImports]
+        tokenizer = Tokenizer.from_file(name) if name.endswith(".json") else Tokenizer.from_pretrained(name)
+        # 只需要 token 数，关闭截断与补齐
+        tokenizer.no_truncation()
+        tokenizer.no_padding()
+        return lambda text: len(tokenizer.encode(text).ids)
+    raise ValueError(f"未知的分词器类型: {spec}")
+
+
+class TokenCounter:
+    """带 LRU 缓存的 token 计数器，可直接作为文本分割器的长度函数"""
+
+    def __init__(self, spec: str, cache_size: int = 16384):
+        self.spec = spec
+        self.cache_size = cache_size
+        self._count: Optional[Callable[[str], int]] = None
+        self._uncached: Callable[[str], int] = estimate_tokens
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"spec": self.spec, "cache_size": self.cache_size}
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__init__(state["spec"], state["cache_size"])
+
+    def _load(self) -> Callable[[str], int]:
+        with self._lock:
+            if self._count is None:
+                try:
+                    count = _load_tokenizer(self.spec)
+                except Exception as e:
+                    logging.warning(f"加载分词器 {self.spec} 失败，按字符类别估算 token 数: {e}")
+                    count = estimate_tokens
+                self._uncached = count
+                self._count = lru_cache(maxsize=self.cache_size)(count)
+        return self._count
+
+    def __call__(self, text: str) -> int:
+        count = self._count or self._load()
+        if len(text) > _MAX_CACHED_CHARS:
+            return self._uncached(text)
+        return count(text)
+
+    def cache_info(self) -> Any:
+        """缓存命中/未命中计数，尚未计数时返回 None"""
+        return self._count.cache_info() if self._count is not None else None
+
+
+_counters: Dict[str, Optional[TokenCounter]] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model_name: Optional[str] = None) -> Optional[TokenCounter]:
+    """按模型返回进程内共享的 TokenCounter，未配置分词器时返回 None"""
+    model_name = model_name or RAG_CONFIG["embeddings"]["default_model"]
+    with _counters_lock:
+        if model_name not in _counters:
+            model_config = RAG_CONFIG["embeddings"]["models"].get(model_name, {})
+            spec = model_config.get("tokenizer")
+            _counters[model_name] = (TokenCounter(spec, int(model_config.get("token_cache_size", 16384)))
+                                     if spec else None)
+        return _counters[model_name]
@@ -1,14 +1,36 @@
 import os
+import json
 import pickle
 import logging
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
 from pathlib import Path
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Callable, Tuple, Iterable, Iterator
 import faiss  # pyright: ignore[reportMissingImports]
 import numpy as np  # pyright: ignore[reportMissingImports]
 
 from Config.model_config import RAG_CONFIG
-from KnowledgeManager.BaseKnowledgeManager import BaseKnowledgeManager
+from KnowledgeManager.BaseKnowledgeManager import BaseKnowledgeManager, SEARCH_MODES, describe_source
 from KnowledgeManager.knowledge_extractor import knowledge_extractor
+from KnowledgeManager.extraction_pool import ExtractionPool
+from KnowledgeManager.bm25_index import BM25Index, search_segments
+from KnowledgeManager.hybrid_fusion import fuse_results
+from KnowledgeManager.index_factory import (
+    get_index_config, validate_encoding, create_index, min_train_size, reservoir_sample,
+    iter_index_vectors, iter_id_vectors, merge_into, describe_index, describe_encoding, estimate_index_bytes,
+    needs_promotion, supports_selector, make_search_params, new_staging_index, empty_like
+)
+from KnowledgeManager.vector_store import RawVectorStore
+from KnowledgeManager.chunk_store import ChunkStore
+from KnowledgeManager.metadata_index import MetadataIndex, mask_to_selector
+from KnowledgeManager.ingest_manifest import IngestManifest, settings_fingerprint
+from KnowledgeManager.ingest_pipeline import IngestCursor, background
+from KnowledgeManager.near_duplicate import ChunkSignatures, DuplicateFilter, get_dedup_config, max_distance
+from KnowledgeManager.segment_store import SegmentStore, SegmentCorruptedError
+from KnowledgeManager.Dependencies.file_lock import FileLock
+from KnowledgeManager.index_snapshot import IndexSnapshot
 
 # 尝试导入混合文本分割器
 try:
@@ -18,12 +40,35 @@ except ImportError:
     HYBRID_SPLITTER_AVAILABLE = False
     logging.warning("混合文本分割器不可用，将使用默认的递归字符分割器")
 
+HYBRID_CONFIG = RAG_CONFIG.get("hybrid_search", {})
+INGESTION_CONFIG = RAG_CONFIG.get("ingestion", {})
+
+# 混合检索时向量一路(embedding请求 + FAISS扫描)在该线程池中执行，与BM25一路并发
+_search_executor = ThreadPoolExecutor(
+    max_workers=HYBRID_CONFIG.get("max_workers", 8),
+    thread_name_prefix="kb_search"
+)
+
+def _tracks_writes(method: Callable) -> Callable:
+    """写入方法执行期间计入 _active_writes，注册表不会淘汰写入中的实例"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._active_writes_lock:
+            self._active_writes += 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            with self._active_writes_lock:
+                self._active_writes -= 1
+    return wrapper
+
+
 class FAISSKnowledgeManager(BaseKnowledgeManager):
     """FAISS向量数据库知识管理器 (迁移自 report-26v0)"""
     
     def __init__(self, knowledge_base_name: str, embedding_model: Optional[str] = None,
                  chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None,
-                 use_hybrid_splitter: bool = True):
+                 use_hybrid_splitter: bool = True, vector_encoding: Optional[str] = None):
         super().__init__(knowledge_base_name, embedding_model, chunk_size, chunk_overlap, use_hybrid_splitter)
         
         vector_config = RAG_CONFIG["vector_store"]
@@ -32,160 +77,925 @@ class FAISSKnowledgeManager(BaseKnowledgeManager):
         
         self.index_file = self.kb_directory / f"{vector_config['faiss']['index_prefix']}{knowledge_base_name}.faiss"
         self.metadata_file = self.kb_directory / f"{vector_config['faiss']['metadata_prefix']}{knowledge_base_name}.json"
+        self.bm25_file = self.kb_directory / f"{vector_config['faiss']['index_prefix']}{knowledge_base_name}.bm25.npz"
+        self.vectors_file = self.kb_directory / f"{vector_config['faiss']['index_prefix']}{knowledge_base_name}.vectors.f32"
+        self.tombstone_file = self.kb_directory / f"{vector_config['faiss']['index_prefix']}{knowledge_base_name}.tombstones.npz"
+        self.settings_file = self.kb_directory / "kb_settings.json"
+        self.manifest_file = self.kb_directory / "ingest_manifest.json"
+        self.cursor_file = self.kb_directory / "ingest_cursor.json"
+        self.index_config = get_index_config()
+        # 入库时的近重复片段检测：片段签名与片段编号对齐，首次去重时加载
+        self.dedup_config = get_dedup_config()
+        self.chunk_signatures = ChunkSignatures(self.kb_directory / "simhash.u64",
+                                                max_distance(self.dedup_config["similarity"]),
+                                                self.dedup_config["shingle_chars"])
+        # 向量编码是知识库级别的设置：首次创建时确定并持久化到 kb_settings.json
+        self.requested_encoding = validate_encoding(vector_encoding) if vector_encoding else None
         
-        self.index = None
-        self.metadata = []
-        self.texts = []
+        self._open_chunk_store()
+        self.raw_vectors = RawVectorStore(self.vectors_file, self.dimension)
+        self._recall_cache = None
+        # 当前发布的检索快照（各段索引、BM25倒排、墓碑位图），未加载时为 None；
+        # 墓碑位图按片段编号标记已删除的片段，检索时跳过，后台压缩时从索引中清除
+        self._snapshot: Optional[IndexSnapshot] = None
+        # 写入、删除与后台维护结果的发布互斥；检索只读取快照，不加锁
+        self._write_lock = threading.Lock()
+        self._active_writes = 0
+        self._active_writes_lock = threading.Lock()
+        self._maintenance_thread = None
+        # 多个进程可能同时打开同一知识库：清单的加载与提交在知识库文件锁内进行，后台维护同时只在一个进程中执行；
+        # 只有写入过本知识库的实例才启动后台维护
+        self._kb_lock = FileLock(self.kb_directory / "kb.lock")
+        self._maintenance_lock = FileLock(self.kb_directory / "maintenance.lock")
+        self._has_written = False
+        self.segment_store = SegmentStore(self.kb_directory / "segments")
+        # 加载或本实例最后一次写入后的磁盘签名，用于判断是否被其他实例修改
+        self._loaded_signature = None
         
         logging.info(f"初始化FAISS知识库管理器: {knowledge_base_name}")
     
     def initialize(self):
+        """加载知识库；分段清单或段文件损坏时抛出 SegmentCorruptedError"""
         try:
             self.kb_directory.mkdir(parents=True, exist_ok=True)
-            if self.index_file.exists() and self.metadata_file.exists():
-                self._load_index()
-            else:
-                self.index = faiss.IndexFlatIP(self.dimension)
-                self.metadata = []
-                self.texts = []
+            with self._kb_lock:
+                self._load_settings()
+                self._load()
+                self._loaded_signature = self.disk_signature()
         except Exception as e:
             logging.error(f"初始化知识库失败: {str(e)}")
-            self.index = faiss.IndexFlatIP(self.dimension)
-            self.metadata = []
-            self.texts = []
+            self._snapshot = None
+            raise
+        self._maybe_start_maintenance()
     
-    def _load_index(self):
-        try:
-            self.index = faiss.read_index(str(self.index_file))
-            with open(self.metadata_file, 'rb') as f:
-                data = pickle.load(f)
-                self.metadata = data.get('metadata', [])
-                self.texts = data.get('texts', [])
-        except Exception as e:
-            logging.error(f"加载索引失败: {str(e)}")
-            self.index = faiss.IndexFlatIP(self.dimension)
-            self.metadata = []
-            self.texts = []
+    def _load(self):
+        """知识库文件锁内调用：按磁盘上的清单加载（会截断其他写入中断留下的未提交片段）"""
+        self._open_chunk_store()
+        self.chunk_signatures.loaded = False
+        if self.segment_store.exists():
+            self._load_segments()
+        elif self.index_file.exists() and (self.chunk_store.exists() or self.metadata_file.exists()):
+            self._load_legacy_index()
+        elif self.segment_store.has_segment_files():
+            raise SegmentCorruptedError(f"知识库 {self.knowledge_base_name} 存在段文件但缺少分段清单")
+        else:
+            if len(self.chunk_store) > 0:
+                # 首次提交清单前中断：片段没有对应的已提交向量，丢弃
+                logging.warning(f"知识库 {self.knowledge_base_name} 缺少分段清单，丢弃 {len(self.chunk_store)} 个未提交的片段")
+                self.chunk_store.clear()
+                self.raw_vectors.clear()
+            self.segment_store = SegmentStore(self.segment_store.directory)
+            self._reset_index()
     
-    def _save_index(self):
-        try:
-            self.kb_directory.mkdir(parents=True, exist_ok=True)
-            faiss.write_index(self.index, str(self.index_file))
-            with open(self.metadata_file, 'wb') as f:
-                pickle.dump({
-                    'metadata': self.metadata,
-                    'texts': self.texts
-                }, f)
-        except Exception as e:
-            logging.error(f"保存索引失败: {str(e)}")
+    def _rebase(self):
+        """知识库文件锁内、写锁外调用：磁盘上的知识库被其他进程修改过时，先把本实例的状态更新为磁盘上的状态"""
+        if self._snapshot is None or self.disk_signature() == self._loaded_signature:
+            return
+        with self._write_lock:
+            snapshot = self._snapshot
+            files = [segment["index_file"] for segment in self.segment_store.segments]
+            disk = SegmentStore(self.segment_store.directory)
+            if disk.exists():
+                disk.load()
+            if (disk.exists() and [segment["index_file"] for segment in disk.segments] == files
+                    and disk.rows >= snapshot.rows and disk.dimension == snapshot.dimension):
+                # 其他进程只追加或删除了片段：各段不变，补上尾部片段的倒排并重新读取墓碑位图
+                self.segment_store = disk
+                self._open_chunk_store()
+                self.chunk_signatures.loaded = False
+                self._snapshot = snapshot.replace(
+                    rows=disk.rows, tombstones=self._load_tombstones(disk.rows),
+                    bm25_tail=snapshot.bm25_tail.extended(self.chunk_store.iter_texts(snapshot.rows, disk.rows)))
+                self._recall_cache = None
+            else:
+                logging.info(f"知识库 {self.knowledge_base_name} 的段已被其他进程修改，重新加载")
+                self.segment_store = disk
+                self._load()
+            self._loaded_signature = self.disk_signature()
     
-    def load_from_folder(self, folder_path: str) -> Dict[str, Any]:
-        if self.index is None:
-            self.initialize()
+    def disk_signature(self) -> tuple:
+        """分段清单、墓碑位图和片段存储提交文件的 (修改时间, 大小)"""
+        signature = []
+        for file_path in (self.segment_store.manifest_file, self.tombstone_file, self.chunk_store.manifest_file):
+            try:
+                stat = file_path.stat()
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+    
+    def is_stale(self) -> bool:
+        """磁盘文件在本实例加载或写入之后被其他实例/进程修改；本实例写入过程中不算"""
+        if self._snapshot is None or self._write_lock.locked():
+            return False
+        return self.disk_signature() != self._loaded_signature
+    
+    def is_busy(self) -> bool:
+        """有进行中的入库、写入、删除，或后台维护线程仍在运行"""
+        thread = self._maintenance_thread
+        return self._active_writes > 0 or self._write_lock.locked() or (thread is not None and thread.is_alive())
+    
+    def memory_bytes(self) -> int:
+        """各段索引、BM25倒排数组与墓碑位图的常驻内存估算（片段与全精度向量为内存映射，不计入）"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return 0
+        return (sum(estimate_index_bytes(segment, self.index_config) for segment in snapshot.segments)
+                + sum(bm25.memory_bytes() for _, bm25 in snapshot.bm25_parts) + snapshot.tombstones.nbytes * 2)
+    
+    def _reset_index(self):
+        """发布空快照；已有片段（无法加载其向量）标记为删除，新片段从现有编号之后继续编号"""
+        self._snapshot = IndexSnapshot.empty(new_staging_index(self.dimension), len(self.chunk_store))
+        self._recall_cache = None
+    
+    def _open_chunk_store(self):
+        self.chunk_store = ChunkStore(self.kb_directory / "chunks")
+        self.metadata_index = MetadataIndex(self.chunk_store)
+    
+    def _load_settings(self):
+        """读取知识库级别设置，不存在时按创建参数/全局配置生成"""
+        settings = {}
+        if self.settings_file.exists():
+            with open(self.settings_file, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+        encoding = settings.get("vector_encoding")
+        if encoding is None:
+            encoding = self.requested_encoding or self.index_config["encoding"]
+            settings["vector_encoding"] = encoding
+            with open(self.settings_file, 'w', encoding='utf-8') as f:
+                json.dump(settings, f, ensure_ascii=False, indent=2)
+        elif self.requested_encoding and self.requested_encoding != encoding:
+            logging.warning(f"知识库 {self.knowledge_base_name} 已使用 {encoding} 编码，忽略指定的 {self.requested_encoding}")
+        self.index_config["encoding"] = validate_encoding(encoding)
+    
+    def _read_segments(self) -> List[Any]:
+        """读取清单与各段并校验；读取期间清单被后台合并替换（旧段文件已删除）时按新清单重读"""
+        attempts = 3
+        for attempt in range(attempts):
+            self.segment_store.load()
+            try:
+                return [self.segment_store.read_segment(segment, self.index_config["verify_checksums"])
+                        for segment in self.segment_store.segments]
+            except SegmentCorruptedError:
+                if attempt == attempts - 1 or self.segment_store.read_generation() == self.segment_store.generation:
+                    raise
+        return []
+    
+    def _load_segments(self):
+        """加载各段索引与BM25倒排，尾部片段从片段文本建立倒排"""
+        parts = self._read_segments()
+        rows, sealed = self.segment_store.rows, self.segment_store.sealed_rows
+        if len(self.chunk_store) < rows:
+            raise SegmentCorruptedError(f"片段存储只有 {len(self.chunk_store)} 个片段，少于已提交的 {rows} 个")
+        # 片段与向量先于清单写入，中断时丢弃清单之外的尾部
+        if len(self.chunk_store) > rows:
+            self.chunk_store.truncate(rows)
+        
+        self.dimension = self.segment_store.dimension
+        segments = [index for index, _ in parts]
+        template = empty_like(segments[0]) if segments else new_staging_index(self.dimension)
+        tombstones = self._load_tombstones(rows)
+        if len(self.raw_vectors) < rows and rows > sealed:
+            raise SegmentCorruptedError(f"全精度向量只有 {len(self.raw_vectors)} 条，无法检索尚未封存的片段")
+        self._sync_raw_vectors(rows, segments)
+        
+        bm25_segments = []
+        for segment, (_, bm25) in zip(self.segment_store.segments, parts):
+            if bm25 is None:
+                logging.info(f"重建BM25倒排: {self.knowledge_base_name} 段 {segment['id']}")
+                bm25 = BM25Index().extended(self.chunk_store.iter_texts(segment["start"], segment["end"]))
+            bm25_segments.append((segment["start"], bm25))
+        bm25_tail = BM25Index().extended(self.chunk_store.iter_texts(sealed, rows))
+        self._snapshot = IndexSnapshot(template, segments, bm25_segments, sealed, rows, bm25_tail, tombstones)
+        self._recall_cache = None
+    
+    def _load_legacy_index(self):
+        """加载旧版单文件索引（每次写入整体重写），转存为单个段后删除旧的索引与BM25文件"""
+        logging.info(f"旧版索引转存为分段格式: {self.knowledge_base_name}")
+        index = faiss.read_index(str(self.index_file))
+        if not self.chunk_store.exists() and self.metadata_file.exists():
+            self._migrate_pickled_chunks()
+        if isinstance(index, faiss.IndexIDMap):
+            # 尾部片段被删除并压缩后索引中不再有其编号，片段数取墓碑文件记录值与最大编号 + 1 的较大者
+            ids = faiss.vector_to_array(index.id_map)
+            rows = max(int(ids.max()) + 1 if len(ids) else 0, len(self._read_tombstones()))
+            tombstones = self._load_tombstones(rows)
+        else:
+            rows = index.ntotal
+            tombstones = np.zeros(rows, dtype=bool)
+            index = self._wrap_legacy_index(index, tombstones)
+        if len(self.chunk_store) < rows:
+            raise SegmentCorruptedError(f"片段存储只有 {len(self.chunk_store)} 个片段，少于索引中的 {rows} 个")
+        if len(self.chunk_store) > rows:
+            self.chunk_store.truncate(rows)
+        self.dimension = index.d
+        self._sync_raw_vectors(rows, [index])
+        bm25 = self._load_bm25()
         
+        segment = self.segment_store.write_segment(index, bm25, 0, rows)
+        self.segment_store.commit(rows, index.d, [segment])
+        self._snapshot = IndexSnapshot(empty_like(index), (index,), ((0, bm25),), rows, rows, BM25Index(), tombstones)
+        self._recall_cache = None
+        for legacy_file in (self.index_file, self.bm25_file):
+            if legacy_file.exists():
+                legacy_file.unlink()
+    
+    def _read_tombstones(self) -> np.ndarray:
+        if not self.tombstone_file.exists():
+            return np.zeros(0, dtype=bool)
+        with np.load(self.tombstone_file, allow_pickle=False) as data:
+            saved_rows = int(data["rows"])
+            return np.unpackbits(data["bits"], count=saved_rows, bitorder='little').astype(bool)
+    
+    def _load_tombstones(self, rows: int) -> np.ndarray:
+        """读取墓碑位图并对齐到 rows 个片段（之后追加的片段未被删除）"""
+        saved = self._read_tombstones()
+        tombstones = np.zeros(rows, dtype=bool)
+        covered = min(rows, len(saved))
+        tombstones[:covered] = saved[:covered]
+        return tombstones
+    
+    def _save_tombstones(self, tombstones: np.ndarray):
+        """原子写入墓碑位图（按位打包）"""
+        tmp_path = Path(f"{self.tombstone_file}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, rows=np.int64(len(tombstones)), bits=np.packbits(tombstones, bitorder='little'))
+        os.replace(tmp_path, self.tombstone_file)
+        self._loaded_signature = self.disk_signature()
+    
+    def _wrap_legacy_index(self, index: Any, tombstones: np.ndarray) -> Any:
+        """旧版索引按插入位置编号，包装为 IndexIDMap（编号即原位置，保留训练结果）"""
+        logging.info(f"旧版索引包装为 IndexIDMap: {self.knowledge_base_name}")
+        if len(self.raw_vectors) == index.ntotal:
+            batches = self.raw_vectors.iter_batches()
+        else:
+            batches = iter_index_vectors(index)
+        wrapped = empty_like(index)
+        self._add_vectors(wrapped, batches, tombstones)
+        return wrapped
+    
+    @staticmethod
+    def _add_vectors(index: Any, batches: Any, tombstones: np.ndarray, start: int = 0):
+        """按片段编号（从 start 起连续）把向量批次写入 IndexIDMap，跳过已删除的片段"""
+        offset = start
+        for batch in batches:
+            ids = np.arange(offset, offset + len(batch), dtype=np.int64)
+            keep = ~tombstones[offset:offset + len(batch)]
+            if keep.all():
+                index.add_with_ids(batch, ids)
+            elif keep.any():
+                index.add_with_ids(np.ascontiguousarray(batch[keep]), ids[keep])
+            offset += len(batch)
+    
+    def _migrate_pickled_chunks(self):
+        """把旧版 pickle 保存的 texts/metadata 转存为列式片段存储"""
+        logging.info(f"迁移旧版片段数据到列式存储: {self.metadata_file}")
+        with open(self.metadata_file, 'rb') as f:
+            data = pickle.load(f)
+        self.chunk_store.append(data.get('texts', []), data.get('metadata', []))
+        os.replace(self.metadata_file, f"{self.metadata_file}.bak")
+    
+    def _sync_raw_vectors(self, rows: int, indexes: List[Any]):
+        """全精度向量文件与片段编号对齐：截断多余行，缺失的行从段索引回填"""
+        self.raw_vectors.dimension = self.dimension
+        stored = len(self.raw_vectors)
+        if stored > rows:
+            self.raw_vectors.truncate(rows)
+        elif stored < rows:
+            logging.info(f"从索引回填全精度向量: {self.knowledge_base_name}, {rows - stored} 条")
+            for begin in range(stored, rows, 10000):
+                self.raw_vectors.append(np.zeros((min(10000, rows - begin), self.dimension), dtype=np.float32))
+            for index in indexes:
+                for ids, vectors in iter_id_vectors(index):
+                    keep = (ids >= stored) & (ids < rows)
+                    if keep.any():
+                        self.raw_vectors.put(ids[keep], vectors[keep])
+    
+    def _load_bm25(self) -> BM25Index:
+        """加载旧版BM25倒排文件；文件缺失、分词器变化或与文本数不一致时从已存文本重建"""
+        bm25 = None
+        if self.bm25_file.exists():
+            try:
+                bm25 = BM25Index.load(self.bm25_file)
+            except Exception as e:
+                logging.warning(f"加载BM25索引失败，将重建: {str(e)}")
+        if bm25 is None or bm25.num_docs != len(self.chunk_store):
+            logging.info(f"重建BM25索引: {self.knowledge_base_name}, 共 {len(self.chunk_store)} 个片段")
+            bm25 = BM25Index()
+            bm25.add_documents(self.chunk_store.iter_texts())
+        return bm25.extended([])
+    
+    def _publish(self, snapshot: IndexSnapshot, segments: Optional[List[Dict[str, Any]]] = None):
+        """知识库文件锁与写锁内调用：提交分段清单并发布新快照"""
+        self.segment_store.commit(snapshot.rows, snapshot.dimension, segments)
+        self._has_written = True
+        self._snapshot = snapshot
+        self._recall_cache = None
+        self._loaded_signature = self.disk_signature()
+    
+    def load_from_folder(self, folder_path: str, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+        """流式入库文件夹中的全部文档；中断后再次入库同一文件夹时从上次提交的位置继续"""
+        folder = Path(folder_path)
+        if not folder.exists():
+            return {"success": False, "message": f"未找到文档"}
+        files = [
+            {"path": str(file_path), "source": str(file_path), "filename": file_path.name}
+            for file_path in folder.rglob('*')
+            if file_path.is_file() and file_path.suffix.lower() in knowledge_extractor.supported_formats
+        ]
+        if not files:
+            return {"success": False, "message": f"未找到文档"}
+        return self.ingest_files(files, tags, resume_key=str(folder.resolve()))
+    
+    @_tracks_writes
+    def ingest_files(self, files: List[Dict[str, str]], tags: Optional[List[str]] = None,
+                     resume_key: Optional[str] = None, chunk_size: Optional[int] = None,
+                     chunk_overlap: Optional[int] = None, use_hybrid_splitter: Optional[bool] = None) -> Dict[str, Any]:
+        """按内容哈希增量、流式入库；给定 resume_key 时中断后从游标处继续"""
+        stats = {"added": 0, "updated": 0, "skipped": 0, "failed": [], "chunks_count": 0, "duplicates": 0}
         try:
-            documents = knowledge_extractor.extract_from_folder(folder_path)
-            if not documents:
-                return {"success": False, "message": f"未找到文档"}
-            
-            all_chunks = []
-            all_metadata = []
-            for doc in documents:
-                chunks = self.text_splitter.split_text(doc["content"])
-                for chunk in chunks:
-                    if len(chunk) >= 3:
-                        all_chunks.append(chunk)
-                        all_metadata.append({
-                            "source": doc["source"],
-                            "filename": doc["filename"],
-                            "format": doc["format"],
-                            "knowledge_base": self.knowledge_base_name,
-                            "embedding_model": self.embedding_model
-                        })
-            
-            embeddings = self.embeddings.embed_documents(all_chunks)
-            embeddings_array = np.array(embeddings, dtype=np.float32)
-            faiss.normalize_L2(embeddings_array)
+            if self._snapshot is None:
+                self.initialize()
+            manifest = IngestManifest(self.manifest_file)
+            if chunk_size is None and chunk_overlap is None and use_hybrid_splitter is None:
+                splitter, settings = self.text_splitter, self.get_ingest_settings()
+            else:
+                splitter, settings = self.build_text_splitter(
+                    chunk_size, chunk_overlap, True if use_hybrid_splitter is None else use_hybrid_splitter)
+            fingerprint = settings_fingerprint(settings)
+            cursor = None
+            if resume_key is not None:
+                files = sorted(files, key=lambda file_info: file_info["source"])
+                cursor = IngestCursor(self.cursor_file, json.dumps([resume_key, tags or []], ensure_ascii=False), fingerprint)
+                if cursor.last_source is not None:
+                    stats.update(cursor.stats)
+                    files = [file_info for file_info in files if not cursor.is_done(file_info["source"])]
+                    logging.info(f"从上次中断处继续入库: {cursor.last_source} 之后还有 {len(files)} 个文件")
             
-            if self.index.ntotal == 0 and embeddings_array.shape[1] != self.dimension:
-                self.dimension = embeddings_array.shape[1]
-                self.index = faiss.IndexFlatIP(self.dimension)
-
-            self.index.add(embeddings_array)
-            self.texts.extend(all_chunks)
-            self.metadata.extend(all_metadata)
-            self._save_index()
+            queue_size = INGESTION_CONFIG.get("queue_size", 4)
+            dedup = self._duplicate_filter() if self.dedup_config["enabled"] else None
+            documents = background(self._extract_stage(files, manifest, fingerprint, tags, splitter), queue_size,
+                                   "ingest_extract")
+            batches = background(self._embed_stage(documents, INGESTION_CONFIG.get("batch_chunks", 512), dedup),
+                                 queue_size, "ingest_embed")
+            for batch, embeddings in batches:
+                self._commit_batch(batch, embeddings, manifest, fingerprint, stats)
+                if cursor is not None:
+                    cursor.advance(batch[-1]["source"], stats)
+            if cursor is not None:
+                cursor.finish()
             
-            return {"success": True, "message": f"已加载 {len(all_chunks)} 个片段"}
+            message = (f"新增 {stats['added']} 个文件，更新 {stats['updated']} 个，跳过 {stats['skipped']} 个未变化文件，"
+                       f"写入 {stats['chunks_count']} 个片段")
+            if stats["duplicates"]:
+                message += f"，跳过 {stats['duplicates']} 个近重复片段"
+            if stats["failed"]:
+                message += f"，{len(stats['failed'])} 个文件解析失败"
+            return {"success": True, **stats, "message": message}
         except Exception as e:
-            return {"success": False, "message": str(e)}
+            logging.error(f"入库中断: {str(e)}")
+            message = str(e)
+            if stats["chunks_count"]:
+                message += f"（已提交 {stats['chunks_count']} 个片段" + ("，重新入库时从中断处继续）" if resume_key is not None else "）")
+            return {"success": False, **stats, "message": message}
+    
+    def _extract_stage(self, files: List[Dict[str, str]], manifest: IngestManifest, fingerprint: str,
+                       tags: Optional[List[str]], splitter: Any) -> Iterator[Dict[str, Any]]:
+        """在解析进程池中哈希比对、解析并切分，按输入顺序产出文档"""
+        tasks = ((file_info, {"file_path": file_info["path"], "compute_hash": True,
+                              "known_hash": manifest.current_hash(file_info["source"], fingerprint)})
+                 for file_info in files)
+        with ExtractionPool(splitter) as pool:
+            for file_info, result in pool.imap(tasks, ordered=True):
+                source = file_info["source"]
+                document = {"source": source, "filename": file_info["filename"], "hash": result["hash"],
+                            "status": "failed", "chunks": [], "metadatas": []}
+                doc = result["document"]
+                if result["unchanged"]:
+                    document["status"] = "skipped"
+                elif not doc:
+                    logging.error(f"提取文件 {file_info['path']} 失败: {result['error']}")
+                else:
+                    document["status"] = "added" if manifest.get(source) is None else "updated"
+                    metadata = {
+                        "source": source,
+                        "filename": file_info["filename"],
+                        "format": doc["format"],
+                        "knowledge_base": self.knowledge_base_name,
+                        "embedding_model": self.embedding_model,
+                        **({"tags": tags} if tags else {})
+                    }
+                    # 片段记录起止页码（PDF）、在原文中的字符区间与所属章节，检索结果可以引用到页和章节
+                    chunk_metadatas = doc.get("chunk_metadatas") or [{} for _ in doc["chunks"]]
+                    for chunk, chunk_metadata in zip(doc["chunks"], chunk_metadatas):
+                        if len(chunk) < 3:
+                            continue
+                        document["chunks"].append(chunk)
+                        document["metadatas"].append({**metadata, **chunk_metadata})
+                yield document
+    
+    def _duplicate_filter(self) -> DuplicateFilter:
+        """本次入库任务的近重复过滤器；首次使用时加载（必要时补算）已有片段的签名"""
+        with self._write_lock:
+            if not self.chunk_signatures.loaded:
+                self.chunk_signatures.load(self._snapshot.rows, self.chunk_store.iter_texts)
+        return DuplicateFilter(self.chunk_signatures, self.dedup_config["min_chars"],
+                               is_live=lambda row: not self._snapshot.is_deleted(row),
+                               source_of=lambda row: self.chunk_store.get_metadata(row).get("source"))
+    
+    def _embed_stage(self, documents: Iterable[Dict[str, Any]], batch_chunks: int,
+                     dedup: Optional[DuplicateFilter] = None) -> Iterator[Tuple[List[Dict[str, Any]], Optional[np.ndarray]]]:
+        """把文档攒成约 batch_chunks 个片段的批次并向量化，产出 (批次, 向量)"""
+        def embed(batch: List[Dict[str, Any]]):
+            chunks = [chunk for document in batch for chunk in document["chunks"]]
+            return batch, (self._embed_chunks(chunks) if chunks else None)
+        
+        batch, chunk_count = [], 0
+        for document in documents:
+            if dedup is not None and document["chunks"]:
+                dedup.apply(document)
+            batch.append(document)
+            chunk_count += len(document["chunks"])
+            if chunk_count >= batch_chunks or len(batch) >= batch_chunks:
+                yield embed(batch)
+                batch, chunk_count = [], 0
+        if batch:
+            yield embed(batch)
     
-    def search(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3) -> Dict[str, Any]:
-        if self.index is None or self.index.ntotal == 0:
+    def _commit_batch(self, batch: List[Dict[str, Any]], embeddings: Optional[np.ndarray],
+                      manifest: IngestManifest, fingerprint: str, stats: Dict[str, Any]):
+        """写入一批片段并保存入库清单，更新 stats"""
+        ingested = [document for document in batch if document["status"] in ("added", "updated")]
+        chunk_count = 0
+        if ingested:
+            # 新片段与同一来源旧片段的删除在同一个快照中发布，检索不会同时看到新旧两个版本或都看不到；
+            # 新文件若有中断前残留的片段也一并清理
+            sources = [document["source"] for document in ingested]
+            chunks = [chunk for document in ingested for chunk in document["chunks"]]
+            chunk_count = len(chunks)
+            if chunks:
+                metadatas = [metadata for document in ingested for metadata in document["metadatas"]]
+                signatures = (np.concatenate([document["signatures"] for document in ingested])
+                              if all("signatures" in document for document in ingested) else None)
+                self._append_chunks(chunks, metadatas, embeddings, supersede_sources=sources, signatures=signatures)
+            else:
+                self._tombstone(lambda: self.metadata_index.build_mask({"source": sources}))
+            # 更新的文件替换了旧片段，此前链接到这些片段的重复片段需要随其文件重新入库
+            relinked = manifest.remove_linked([document["source"] for document in ingested if document["status"] == "updated"])
+            if relinked:
+                logging.info(f"{len(relinked)} 个文件的重复片段引用了已更新的来源，重新入库时将重新处理")
+            for document in ingested:
+                manifest.record(document["source"], document["hash"], fingerprint, document["filename"],
+                                len(document["chunks"]), document.get("duplicates", 0), document.get("duplicate_of"))
+                stats["duplicates"] += document.get("duplicates", 0)
+            manifest.save()
+        for document in batch:
+            if document["status"] == "failed":
+                stats["failed"].append(document["filename"])
+            else:
+                stats[document["status"]] += 1
+        stats["chunks_count"] += chunk_count
+    
+    @_tracks_writes
+    def add_chunks(self, chunks: List[str], metadatas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """向量化已切分的片段并追加写入；封存、合并与索引升级在后台进行"""
+        if self._snapshot is None:
             self.initialize()
-            if self.index.ntotal == 0:
-                return {"success": True, "context": "", "context_list": []}
-            
-        try:
-            query_embedding = self.embeddings.embed_query(query)
-            query_vector = np.array([query_embedding], dtype=np.float32)
-            faiss.normalize_L2(query_vector)
-            
-            search_k = min(k, self.index.ntotal)
-            scores, indices = self.index.search(query_vector, search_k)
-            
-            context_parts = []
-            context_list = []
-            for i, idx in enumerate(indices[0]):
-                if idx >= 0 and idx < len(self.texts):
-                    text = self.texts[idx]
-                    metadata = self.metadata[idx]
-                    score = float(scores[0][i])
-                    if score >= score_threshold:
-                        context_list.append({
-                            "source": metadata.get("filename", "未知"),
-                            "metadata": metadata,
-                            "score": score,
-                            "content": text
-                        })
-                        context_parts.append(f"[来源: {metadata.get('filename')}, 相似度: {score:.3f}]\n{text}")
-            
-            return {
-                "success": True,
-                "context": "\n\n".join(context_parts),
-                "context_list": context_list,
-                "docs_count": len(context_list)
+        self._add_chunks(chunks, metadatas)
+        return {"success": True, "chunks_count": len(chunks)}
+    
+    def _add_chunks(self, chunks: List[str], metadatas: List[Dict[str, Any]],
+                    supersede_sources: Optional[List[str]] = None):
+        """向量化并写入片段；supersede_sources 的旧片段同时标记删除"""
+        if not chunks:
+            return
+        self._append_chunks(chunks, metadatas, self._embed_chunks(chunks), supersede_sources)
+    
+    def _embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        embeddings_array = np.array(self.embeddings.embed_documents(chunks), dtype=np.float32)
+        faiss.normalize_L2(embeddings_array)
+        return embeddings_array
+    
+    def _append_chunks(self, chunks: List[str], metadatas: List[Dict[str, Any]], embeddings_array: np.ndarray,
+                       supersede_sources: Optional[List[str]] = None, signatures: Optional[np.ndarray] = None):
+        """写入已向量化的片段并发布新快照；已加载片段签名时同时追加签名（未给定时在此计算）"""
+        if signatures is None and self.chunk_signatures.loaded:
+            signatures = self.chunk_signatures.compute(chunks)
+        with self._kb_lock:
+            self._rebase()
+            with self._write_lock:
+                snapshot = self._snapshot
+                if snapshot.rows == 0 and embeddings_array.shape[1] != snapshot.dimension:
+                    self.dimension = embeddings_array.shape[1]
+                    self.raw_vectors.clear()
+                    self.raw_vectors.dimension = self.dimension
+                    self._reset_index()
+                    snapshot = self._snapshot
+        
+                # 先写全精度向量和片段再提交清单，中断时加载阶段会截断清单之外的部分；片段编号即向量的外部 id。
+                # 之前的写入在发布前失败时，先丢弃其留下的未发布片段
+                start = snapshot.rows
+                if len(self.chunk_store) > start:
+                    self.chunk_store.truncate(start)
+                if len(self.raw_vectors) > start:
+                    self.raw_vectors.truncate(start)
+                self.raw_vectors.append(embeddings_array)
+                self.chunk_store.append(chunks, metadatas)
+                self.chunk_signatures.append(start, signatures)
+                tombstones = np.concatenate([snapshot.tombstones, np.zeros(len(chunks), dtype=bool)])
+                if supersede_sources:
+                    stale = self.metadata_index.build_mask({"source": supersede_sources})
+                    if stale is not None:
+                        tombstones[:start] |= stale[:start]
+                new_snapshot = snapshot.replace(rows=start + len(chunks), tombstones=tombstones,
+                                                bm25_tail=snapshot.bm25_tail.extended(chunks))
+                if new_snapshot.deleted_count != snapshot.deleted_count:
+                    self._save_tombstones(tombstones)
+                self._publish(new_snapshot)
+        self._maybe_start_maintenance()
+    
+    def _promotion_due(self, snapshot: IndexSnapshot) -> bool:
+        """Flat 索引是否需要升级为配置的目标索引类型与向量编码"""
+        if not needs_promotion(snapshot.template, self.index_config):
+            return False
+        target = self.index_config["type"]
+        num_vectors = snapshot.ntotal
+        required = min_train_size(target, num_vectors, self.index_config)
+        # 仅改变向量编码的 Flat 目标在可训练时立即升级；IVF/HNSW 等到 promote_threshold
+        threshold = required if target == "flat" else max(self.index_config["promote_threshold"], required)
+        if num_vectors < threshold:
+            return False
+        if len(self.raw_vectors) < snapshot.rows:
+            logging.warning(f"知识库 {self.knowledge_base_name} 缺少全精度向量，暂不升级索引")
+            return False
+        return True
+    
+    def _build_search_result(self, snapshot: IndexSnapshot, hits: List[Any], score_threshold: float,
+                             score_label: str = "相似度") -> Dict[str, Any]:
+        """把 [(片段编号, 分数[, 分数明细])] 组装成统一的检索结果结构"""
+        context_parts = []
+        context_list = []
+        for hit in hits:
+            idx, score = hit[0], hit[1]
+            if idx < 0 or idx >= snapshot.rows or score < score_threshold or snapshot.is_deleted(idx):
+                continue
+            text = self.chunk_store.get_text(idx)
+            metadata = self.chunk_store.get_metadata(idx)
+            item = {
+                "source": metadata.get("filename", "未知"),
+                "metadata": metadata,
+                "score": score,
+                "content": text,
+                # 片段编号入库后不变（压缩段不重新编号），rerank 分数缓存按它区分片段
+                "chunk_id": f"{self.knowledge_base_name}:{idx}"
             }
+            if len(hit) > 2:
+                item.update(hit[2])
+            context_list.append(item)
+            context_parts.append(f"[来源: {describe_source(metadata)}, {score_label}: {score:.3f}]\n{text}")
+        
+        return {
+            "success": True,
+            "context": "\n\n".join(context_parts),
+            "context_list": context_list,
+            "docs_count": len(context_list)
+        }
+    
+    def _current_snapshot(self) -> IndexSnapshot:
+        """检索开始时取一次快照引用，之后的写入发布新快照，不影响本次检索"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.initialize()
+            snapshot = self._snapshot
+        return snapshot
+    
+    def _search_mask(self, snapshot: IndexSnapshot, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """过滤条件位图与未删除片段位图求交（截取到快照的片段数）；既无过滤也无删除时返回 None"""
+        mask = self.metadata_index.build_mask(filters)
+        if mask is not None:
+            mask = mask[:snapshot.rows]
+        if snapshot.deleted_count == 0:
+            return mask
+        live = snapshot.live_mask()
+        return live if mask is None else mask & live
+    
+    def search(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """向量检索；nprobe / ef_search 仅对本次查询生效，过滤条件下推到索引扫描中"""
+        try:
+            snapshot = self._current_snapshot()
+            if snapshot.ntotal == 0:
+                return {"success": True, "context": "", "context_list": []}
+            mask = self._search_mask(snapshot, filters)
+            hits = self._vector_hits(snapshot, query, k, nprobe=nprobe, ef_search=ef_search, mask=mask,
+                                     query_embedding=query_embedding)
+            return self._build_search_result(snapshot, hits, score_threshold)
         except Exception as e:
             return {"success": False, "message": str(e)}
+    
+    def _vector_hits(self, snapshot: IndexSnapshot, query: str, k: int, nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None, mask: Optional[np.ndarray] = None,
+                     query_embedding: Optional[List[float]] = None) -> List[Any]:
+        """向量检索，返回 [(片段编号, 余弦相似度)]"""
+        if not self._has_vector_candidates(snapshot, mask):
+            return []
+        if query_embedding is None:
+            query_embedding = self.embeddings.embed_query(query)
+        query_vector = self._to_query_vector(query_embedding)
+        return self._search_vectors(snapshot, query_vector, k, nprobe=nprobe, ef_search=ef_search, mask=mask)[0]
+    
+    async def _avector_hits(self, snapshot: IndexSnapshot, query: str, k: int, nprobe: Optional[int] = None,
+                            ef_search: Optional[int] = None, mask: Optional[np.ndarray] = None,
+                            query_embedding: Optional[List[float]] = None) -> List[Any]:
+        """_vector_hits 的异步版本"""
+        if not self._has_vector_candidates(snapshot, mask):
+            return []
+        if query_embedding is None:
+            query_embedding = await self.embeddings.aembed_query(query)
+        query_vector = self._to_query_vector(query_embedding)
+        results = await asyncio.get_running_loop().run_in_executor(
+            _search_executor,
+            partial(self._search_vectors, snapshot, query_vector, k, nprobe=nprobe, ef_search=ef_search, mask=mask)
+        )
+        return results[0]
+    
+    @staticmethod
+    def _has_vector_candidates(snapshot: IndexSnapshot, mask: Optional[np.ndarray]) -> bool:
+        return snapshot.ntotal > 0 and (mask is None or mask.any())
+    
+    @staticmethod
+    def _to_query_vector(query_embedding: List[float]) -> np.ndarray:
+        return FAISSKnowledgeManager._to_query_vectors([query_embedding])
+    
+    @staticmethod
+    def _to_query_vectors(query_embeddings: List[List[float]]) -> np.ndarray:
+        query_vectors = np.array(query_embeddings, dtype=np.float32)
+        faiss.normalize_L2(query_vectors)
+        return query_vectors
+    
+    def _can_rescore(self, snapshot: IndexSnapshot) -> bool:
+        return describe_encoding(snapshot.template) != "fp32" and len(self.raw_vectors) >= snapshot.rows
+    
+    def _search_vectors(self, snapshot: IndexSnapshot, query_vectors: np.ndarray, k: int, nprobe: Optional[int] = None,
+                        ef_search: Optional[int] = None, rescore: bool = True,
+                        mask: Optional[np.ndarray] = None) -> List[List[Any]]:
+        """批量向量检索，返回每个查询的 [(片段编号, 分数)]；压缩编码的索引用全精度向量重排"""
+        rescore = rescore and self._can_rescore(snapshot)
+        fetch_k = k * self.index_config["rescore_factor"] if rescore else k
+        selector, bits, post_filter, segment_k = None, None, False, fetch_k
+        if mask is not None:
+            if supports_selector(snapshot.template):
+                # bits 为 selector 引用的位图内存，需在检索结束前保持引用
+                selector, bits = mask_to_selector(mask)
+            else:
+                post_filter = True
+                segment_k *= max(1, len(mask) // max(int(mask.sum()), 1))
+        params = make_search_params(snapshot.template, nprobe=nprobe, ef_search=ef_search, selector=selector)
+        
+        candidates: List[List[Tuple[np.ndarray, np.ndarray]]] = [[] for _ in range(len(query_vectors))]
+        for segment in snapshot.segments:
+            if segment.ntotal == 0:
+                continue
+            scores, indices = segment.search(query_vectors, min(segment_k, segment.ntotal), params=params)
+            for qi in range(len(query_vectors)):
+                valid = indices[qi] >= 0
+                if post_filter:
+                    valid &= mask[np.clip(indices[qi], 0, len(mask) - 1)]
+                candidates[qi].append((indices[qi][valid], scores[qi][valid]))
+        if snapshot.rows > snapshot.sealed_rows:
+            for qi, tail_hits in enumerate(self._search_tail(snapshot, query_vectors, fetch_k, mask)):
+                candidates[qi].append(tail_hits)
+        
+        results = []
+        for qi, parts in enumerate(candidates):
+            if not parts:
+                results.append([])
+                continue
+            ids = np.concatenate([part_ids for part_ids, _ in parts])
+            scores = np.concatenate([part_scores for _, part_scores in parts])
+            if rescore and len(ids):
+                # 各段与尾部分别召回的候选一起精确重排
+                order = np.argsort(-scores, kind="stable")[:fetch_k]
+                ids = ids[order]
+                scores = self.raw_vectors.get(ids) @ query_vectors[qi]
+            order = np.argsort(-scores, kind="stable")[:k]
+            results.append([(int(ids[o]), float(scores[o])) for o in order])
+        return results
+    
+    def _search_tail(self, snapshot: IndexSnapshot, query_vectors: np.ndarray, k: int,
+                     mask: Optional[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """尾部片段在全精度向量上暴力检索，返回每个查询的 (片段编号, 内积)"""
+        start, stop = snapshot.sealed_rows, snapshot.rows
+        keep = ~snapshot.tombstones[start:stop]
+        if mask is not None:
+            keep &= mask[start:stop]
+        scores = np.full((len(query_vectors), stop - start), -np.inf, dtype=np.float32)
+        offset = 0
+        for batch in self.raw_vectors.iter_batches(start=start, stop=stop):
+            scores[:, offset:offset + len(batch)] = query_vectors @ batch.T
+            offset += len(batch)
+        scores[:, ~keep] = -np.inf
+        k = min(k, int(keep.sum()))
+        if k == 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))] * len(query_vectors)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        hits = []
+        for qi in range(len(query_vectors)):
+            top_scores = scores[qi, top[qi]]
+            valid = np.isfinite(top_scores)
+            hits.append((top[qi][valid] + start, top_scores[valid]))
+        return hits
+    
+    def _estimate_recall(self, snapshot: IndexSnapshot, k: int = 10, num_queries: int = 32) -> Optional[Dict[str, float]]:
+        """以已存向量为查询样本评估 recall@k（压缩索引直接检索与重排后），按向量数缓存"""
+        rows = snapshot.rows
+        if snapshot.ntotal == 0 or len(self.raw_vectors) < rows:
+            return None
+        cache_key = (rows, snapshot.ntotal, snapshot.deleted_count, len(snapshot.segments))
+        recall_cache = self._recall_cache
+        if recall_cache and recall_cache[0] == cache_key:
+            return recall_cache[1]
+        
+        live_mask = self._search_mask(snapshot, None)
+        live_ids = np.arange(rows) if live_mask is None else np.flatnonzero(live_mask)
+        if len(live_ids) == 0:
+            return None
+        k = min(k, len(live_ids))
+        rng = np.random.default_rng(0)
+        queries = self.raw_vectors.get(rng.choice(live_ids, size=min(num_queries, len(live_ids)), replace=False))
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        offset = 0
+        for batch in self.raw_vectors.iter_batches(stop=rows):
+            batch_scores = queries @ batch.T
+            if live_mask is not None:
+                batch_scores[:, ~live_mask[offset:offset + len(batch)]] = -np.inf
+            scores = np.hstack([best_scores, batch_scores])
+            ids = np.hstack([best_ids, np.broadcast_to(np.arange(offset, offset + len(batch)), (len(queries), len(batch)))])
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_ids = np.take_along_axis(ids, top, axis=1)
+            offset += len(batch)
+        
+        def recall(results):
+            return float(np.mean([len({i for i, _ in hits} & set(truth.tolist())) / k
+                                  for hits, truth in zip(results, best_ids)]))
+        
+        figures = {
+            "recall_at_10": round(recall(self._search_vectors(snapshot, queries, k, rescore=False, mask=live_mask)), 4),
+            "recall_at_10_rescored": round(recall(self._search_vectors(snapshot, queries, k, mask=live_mask)), 4)
+        }
+        self._recall_cache = (cache_key, figures)
+        return figures
 
     def search_with_details(self, query: str, k: int = 5, filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3) -> Dict[str, Any]:
         return self.search(query, k, filters, score_threshold)
 
     def search_bm25(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3) -> Dict[str, Any]:
-        # 简化版 BM25 模拟
-        return self.search(query, k, filters, score_threshold)
+        """基于本地倒排索引的BM25检索，不调用embedding服务"""
+        try:
+            snapshot = self._current_snapshot()
+            hits = search_segments(snapshot.bm25_parts, query, k, mask=self._search_mask(snapshot, filters))
+            return self._build_search_result(snapshot, hits, score_threshold, score_label="BM25")
+        except Exception as e:
+            return {"success": False, "message": str(e)}
 
     def search_keywords(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3) -> Dict[str, Any]:
         return self.search_bm25(query, k, filters, score_threshold)
 
     def search_hybrid(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None, 
-                      vector_weight: float = 0.7, keyword_weight: float = 0.3, score_threshold: float = 0.3) -> Dict[str, Any]:
-        return self.search(query, k, filters, score_threshold)
+                      vector_weight: float = 0.7, keyword_weight: float = 0.3, score_threshold: float = 0.3,
+                      fusion: Optional[str] = None, query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """混合检索：向量与BM25两路并发，按 fusion（weighted / rrf）融合"""
+        fusion = fusion or HYBRID_CONFIG.get("fusion", "weighted")
+        fetch_k = k * HYBRID_CONFIG.get("candidate_multiplier", 3)
+        
+        try:
+            snapshot = self._current_snapshot()
+            mask = self._search_mask(snapshot, filters)
+            vector_future = (_search_executor.submit(self._vector_hits, snapshot, query, fetch_k, mask=mask,
+                                                     query_embedding=query_embedding)
+                             if vector_weight > 0 else None)
+            keyword_hits = search_segments(snapshot.bm25_parts, query, fetch_k, mask=mask) if keyword_weight > 0 else []
+            vector_hits = vector_future.result() if vector_future else []
+            return self._fuse_hits(snapshot, vector_hits, keyword_hits, k, vector_weight, keyword_weight, fusion,
+                                   score_threshold)
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def search_many(self, queries: List[str], k: int = 10, filters: Optional[Dict[str, Any]] = None,
+                    score_threshold: float = 0.3, search_mode: str = "vector", vector_weight: float = 0.7,
+                    keyword_weight: float = 0.3, fusion: Optional[str] = None,
+                    query_embeddings: Optional[List[List[float]]] = None) -> List[Dict[str, Any]]:
+        """批量检索：全部 query 一次向量化，返回与 queries 对齐的结果"""
+        try:
+            if search_mode not in SEARCH_MODES:
+                raise ValueError(f"不支持的检索模式: {search_mode}，可选: {SEARCH_MODES}")
+            if not queries:
+                return []
+            fusion = fusion or HYBRID_CONFIG.get("fusion", "weighted")
+            fetch_k = k * HYBRID_CONFIG.get("candidate_multiplier", 3) if search_mode == "hybrid" else k
+            use_vector = search_mode == "vector" or (search_mode == "hybrid" and vector_weight > 0)
+            use_keyword = search_mode == "bm25" or (search_mode == "hybrid" and keyword_weight > 0)
+            
+            snapshot = self._current_snapshot()
+            mask = self._search_mask(snapshot, filters)
+            
+            def batch_vector_hits() -> List[List[Any]]:
+                embeddings = query_embeddings if query_embeddings is not None else self.embeddings.embed_documents(queries)
+                return self._search_vectors(snapshot, self._to_query_vectors(embeddings), fetch_k, mask=mask)
+            
+            # 向量一路（批量向量化 + 批量扫描）在线程池中执行，与BM25一路并发
+            vector_future = (_search_executor.submit(batch_vector_hits)
+                             if use_vector and self._has_vector_candidates(snapshot, mask) else None)
+            keyword_hits = [search_segments(snapshot.bm25_parts, query, fetch_k, mask=mask) if use_keyword else []
+                            for query in queries]
+            vector_hits = vector_future.result() if vector_future else [[] for _ in queries]
+            
+            if search_mode == "hybrid":
+                return [self._fuse_hits(snapshot, v_hits, kw_hits, k, vector_weight, keyword_weight, fusion, score_threshold)
+                        for v_hits, kw_hits in zip(vector_hits, keyword_hits)]
+            if search_mode == "bm25":
+                return [self._build_search_result(snapshot, hits, score_threshold, score_label="BM25") for hits in keyword_hits]
+            return [self._build_search_result(snapshot, hits, score_threshold) for hits in vector_hits]
+        except Exception as e:
+            return [{"success": False, "message": str(e)} for _ in queries]
+
+    async def asearch_many(self, queries: List[str], k: int = 10, filters: Optional[Dict[str, Any]] = None,
+                           score_threshold: float = 0.3, search_mode: str = "vector", vector_weight: float = 0.7,
+                           keyword_weight: float = 0.3, fusion: Optional[str] = None,
+                           query_embeddings: Optional[List[List[float]]] = None) -> List[Dict[str, Any]]:
+        """search_many 的异步版本：向量化走异步客户端，批量检索在线程池执行"""
+        use_vector = search_mode == "vector" or (search_mode == "hybrid" and vector_weight > 0)
+        if use_vector and query_embeddings is None and queries:
+            try:
+                query_embeddings = await self.embeddings.aembed_documents(queries)
+            except Exception as e:
+                return [{"success": False, "message": str(e)} for _ in queries]
+        return await self._run_blocking(self.search_many, queries, k=k, filters=filters, score_threshold=score_threshold,
+                                        search_mode=search_mode, vector_weight=vector_weight,
+                                        keyword_weight=keyword_weight, fusion=fusion, query_embeddings=query_embeddings)
+
+    def _fuse_hits(self, snapshot: IndexSnapshot, vector_hits: List[Any], keyword_hits: List[Any], k: int,
+                   vector_weight: float, keyword_weight: float, fusion: str, score_threshold: float) -> Dict[str, Any]:
+        hits = fuse_results(
+            vector_hits, keyword_hits, k,
+            vector_weight=vector_weight,
+            keyword_weight=keyword_weight,
+            method=fusion,
+            rrf_k=HYBRID_CONFIG.get("rrf_k", 60)
+        )
+        return self._build_search_result(snapshot, hits, score_threshold, score_label="混合得分")
+
+    async def asearch(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3,
+                      nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """search 的异步版本"""
+        try:
+            snapshot = await self._run_blocking(self._current_snapshot)
+            if snapshot.ntotal == 0:
+                return {"success": True, "context": "", "context_list": []}
+            mask = await self._run_blocking(self._search_mask, snapshot, filters)
+            hits = await self._avector_hits(snapshot, query, k, nprobe=nprobe, ef_search=ef_search, mask=mask,
+                                            query_embedding=query_embedding)
+            return await self._run_blocking(self._build_search_result, snapshot, hits, score_threshold)
+        except Exception as e:
+            return {"success": False, "message": str(e)}
 
-    def add_text(self, content: str, source: str = "user_input") -> Dict[str, Any]:
-        if self.index is None: self.initialize()
+    async def asearch_hybrid(self, query: str, k: int = 10, filters: Optional[Dict[str, Any]] = None,
+                             vector_weight: float = 0.7, keyword_weight: float = 0.3, score_threshold: float = 0.3,
+                             fusion: Optional[str] = None, query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """search_hybrid 的异步版本"""
+        fusion = fusion or HYBRID_CONFIG.get("fusion", "weighted")
+        fetch_k = k * HYBRID_CONFIG.get("candidate_multiplier", 3)
+        
+        async def no_hits():
+            return []
+        
+        try:
+            snapshot = await self._run_blocking(self._current_snapshot)
+            mask = await self._run_blocking(self._search_mask, snapshot, filters)
+            vector_hits, keyword_hits = await asyncio.gather(
+                self._avector_hits(snapshot, query, fetch_k, mask=mask, query_embedding=query_embedding)
+                if vector_weight > 0 else no_hits(),
+                self._run_blocking(search_segments, snapshot.bm25_parts, query, fetch_k, mask)
+                if keyword_weight > 0 else no_hits()
+            )
+            return await self._run_blocking(self._fuse_hits, snapshot, vector_hits, keyword_hits, k,
+                                            vector_weight, keyword_weight, fusion, score_threshold)
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def add_text(self, content: str, source: str = "user_input", tags: Optional[List[str]] = None) -> Dict[str, Any]:
         try:
+            if self._snapshot is None: self.initialize()
             chunks = self.text_splitter.split_text(content)
-            embeddings = self.embeddings.embed_documents(chunks)
-            embeddings_array = np.array(embeddings, dtype=np.float32)
-            faiss.normalize_L2(embeddings_array)
-            self.index.add(embeddings_array)
-            self.texts.extend(chunks)
-            for _ in chunks:
-                self.metadata.append({"source": source, "knowledge_base": self.knowledge_base_name})
-            self._save_index()
-            return {"success": True, "chunks_count": len(chunks)}
+            metadata = {"source": source, "knowledge_base": self.knowledge_base_name}
+            if tags:
+                metadata["tags"] = tags
+            metadatas = [dict(metadata) for _ in chunks]
+            return self.add_chunks(chunks, metadatas)
         except Exception as e:
             return {"success": False, "message": str(e)}
 
@@ -196,11 +1006,33 @@ class FAISSKnowledgeManager(BaseKnowledgeManager):
         return [d.name for d in base_dir.iterdir() if d.is_dir()]
 
     def get_stats(self) -> Dict[str, Any]:
-        return {
+        snapshot = self._current_snapshot()
+        stats = {
             "knowledge_base": self.knowledge_base_name,
-            "total_vectors": self.index.ntotal if self.index else 0,
-            "total_texts": len(self.texts)
+            "total_vectors": snapshot.ntotal,
+            "index_type": describe_index(snapshot.template),
+            "vector_encoding": describe_encoding(snapshot.template),
+            "total_texts": snapshot.rows - snapshot.deleted_count,
+            "deleted_texts": snapshot.deleted_count,
+            "segments": len(snapshot.segments),
+            "unsealed_texts": snapshot.rows - snapshot.sealed_rows,
+            "text_store_mb": round(self.chunk_store.text_bytes / 2 ** 20, 2),
+            "bm25_terms": len(set().union(*(bm25.vocab for _, bm25 in snapshot.bm25_parts))),
+            "embedding_cache": self.embeddings.cache_stats()
         }
+        if snapshot.ntotal > 0:
+            # 内存占用与召回率对照：压缩编码节省的内存和付出的召回代价（尾部片段按全精度计）
+            index_bytes = (sum(estimate_index_bytes(segment, self.index_config) for segment in snapshot.segments)
+                           + (snapshot.rows - snapshot.sealed_rows) * snapshot.dimension * 4)
+            fp32_bytes = snapshot.ntotal * snapshot.dimension * 4
+            stats.update({
+                "pending_compaction": self._pending_deletes(snapshot),
+                "index_memory_mb": round(index_bytes / 2 ** 20, 2),
+                "fp32_memory_mb": round(fp32_bytes / 2 ** 20, 2),
+                "compression_ratio": round(fp32_bytes / index_bytes, 2) if index_bytes else None
+            })
+            stats.update(self._estimate_recall(snapshot) or {})
+        return stats
 
     def delete_knowledge_base(self) -> Dict[str, Any]:
         import shutil
@@ -219,13 +1051,255 @@ class FAISSKnowledgeManager(BaseKnowledgeManager):
             return {"success": True}
         return {"success": False}
 
+    @_tracks_writes
     def clear_knowledge_base(self) -> Dict[str, Any]:
-        if self.index_file.exists(): self.index_file.unlink()
-        if self.metadata_file.exists(): self.metadata_file.unlink()
-        self.index = faiss.IndexFlatIP(self.dimension)
-        self.metadata = []
-        self.texts = []
+        with self._kb_lock, self._write_lock:
+            if self.index_file.exists(): self.index_file.unlink()
+            if self.metadata_file.exists(): self.metadata_file.unlink()
+            if self.bm25_file.exists(): self.bm25_file.unlink()
+            if self.tombstone_file.exists(): self.tombstone_file.unlink()
+            if self.manifest_file.exists(): self.manifest_file.unlink()
+            if self.cursor_file.exists(): self.cursor_file.unlink()
+            self.segment_store.clear()
+            self.raw_vectors.clear()
+            self.chunk_store.clear()
+            self.chunk_signatures.clear()
+            self._reset_index()
+            self._loaded_signature = self.disk_signature()
         return {"success": True}
 
+    @_tracks_writes
     def remove_by_source(self, source_pattern: str) -> Dict[str, Any]:
-        return {"success": False, "message": "未实现"}
+        """按来源删除片段（支持通配符）：标记墓碑，删除较多时后台压缩"""
+        try:
+            if self._snapshot is None:
+                self.initialize()
+            removed_count = self._tombstone(
+                lambda: self.metadata_index.match_pattern(("source", "filename"), source_pattern))
+            # 删除入库记录，之后重新上传同一文件会重新入库；
+            # 重复片段链接到被删除来源的文件同样删除记录，重新入库时补回这些片段
+            manifest = IngestManifest(self.manifest_file)
+            removed_sources = manifest.remove_matching(source_pattern)
+            relinked = manifest.remove_linked(removed_sources)
+            if removed_sources or relinked:
+                manifest.save()
+            if relinked:
+                logging.info(f"{len(relinked)} 个文件的重复片段引用了被删除的来源，重新入库时将重新处理")
+            # 未完成的入库任务从头重新比对（已入库且未删除的文件仍按入库清单跳过）
+            if self.cursor_file.exists():
+                self.cursor_file.unlink()
+            if removed_count == 0:
+                return {"success": False, "message": f"未找到来源匹配 {source_pattern} 的片段"}
+            logging.info(f"知识库 {self.knowledge_base_name} 删除来源 {source_pattern}: {removed_count} 个片段")
+            message = f"已删除 {removed_count} 个片段"
+            if relinked:
+                message += f"，{len(relinked)} 个文件有重复片段保留在被删除的来源中，需要重新入库"
+            return {"success": True, "removed_count": removed_count, "relinked": relinked, "message": message}
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    def _tombstone(self, select: Callable[[], Optional[np.ndarray]]) -> int:
+        """把 select() 位图中为 True 且尚未删除的片段标记为删除，落盘后发布新快照，返回新删除的片段数；
+        select 在更新为磁盘上的最新状态之后调用，其他进程新写入的片段同样参与匹配"""
+        with self._kb_lock:
+            self._rebase()
+            with self._write_lock:
+                snapshot = self._snapshot
+                mask = select()
+                if mask is None:
+                    return 0
+                covered = min(len(mask), snapshot.rows)
+                removed = mask[:covered] & ~snapshot.tombstones[:covered]
+                removed_count = int(removed.sum())
+                if removed_count == 0:
+                    return 0
+                tombstones = snapshot.tombstones.copy()
+                tombstones[:covered] |= removed
+                self._save_tombstones(tombstones)
+                self._has_written = True
+                self._snapshot = snapshot.replace(tombstones=tombstones)
+                self._recall_cache = None
+        self._maybe_start_maintenance()
+        return removed_count
+
+    @staticmethod
+    def _pending_deletes(snapshot: IndexSnapshot) -> int:
+        """已删除但仍在索引中的向量数（不在索引中的片段都是已压缩清除的删除）"""
+        return snapshot.deleted_count - (snapshot.rows - snapshot.ntotal)
+
+    def _compaction_due(self, snapshot: IndexSnapshot) -> bool:
+        """待清除的已删除向量占索引的比例是否超过 compaction_threshold"""
+        pending = self._pending_deletes(snapshot)
+        return pending > 0 and pending >= snapshot.ntotal * self.index_config["compaction_threshold"]
+
+    def _seal_due(self, snapshot: IndexSnapshot) -> bool:
+        """尚未封存的尾部片段是否达到 segment_rows"""
+        return snapshot.rows - snapshot.sealed_rows >= self.index_config["segment_rows"]
+
+    def _next_maintenance(self) -> Optional[Callable[[], bool]]:
+        """按优先级返回下一项后台维护工作：索引升级、压缩、封存尾部、合并段；无事可做时返回 None"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        if self._promotion_due(snapshot):
+            return partial(self._rebuild, promote=True)
+        if self._compaction_due(snapshot):
+            return self._rebuild
+        if self._seal_due(snapshot):
+            return self._seal_segment
+        merge_range = self.segment_store.pick_merge(self.index_config["segment_rows"], self.index_config["merge_factor"])
+        if merge_range is not None:
+            return partial(self._merge_segments, *merge_range)
+        return None
+
+    def _maybe_start_maintenance(self):
+        if not self._has_written or self._next_maintenance() is None:
+            return
+        if self._maintenance_thread is not None and self._maintenance_thread.is_alive():
+            return
+        self._maintenance_thread = threading.Thread(
+            target=self._run_maintenance, name=f"kb_maintain_{self.knowledge_base_name}", daemon=True
+        )
+        self._maintenance_thread.start()
+
+    def _run_maintenance(self):
+        # 维护期间的新写入和删除产生的工作继续处理；任一步失败时停止，等下次写入再触发。
+        # 同一知识库同时只有一个进程执行维护，每一步先更新为磁盘上的最新状态
+        try:
+            with self._maintenance_lock:
+                while True:
+                    with self._kb_lock:
+                        self._rebase()
+                    task = self._next_maintenance()
+                    if task is None or not task():
+                        break
+        except Exception as e:
+            logging.error(f"知识库 {self.knowledge_base_name} 后台维护失败: {str(e)}")
+
+    def _tail_bm25(self, start: int, built: Optional[Tuple[int, BM25Index]] = None) -> BM25Index:
+        """写锁内调用：返回片段 [start, 当前片段数) 的尾部倒排"""
+        end = self._snapshot.rows
+        stop, bm25 = built if built is not None else (start, BM25Index())
+        return bm25.extended(self.chunk_store.iter_texts(stop, end)) if end > stop else bm25
+
+    def _prebuild_tail_bm25(self, start: int) -> Tuple[int, BM25Index]:
+        """锁外先为 [start, 当前片段数) 建立倒排，缩短写锁内的分词工作"""
+        stop = self._snapshot.rows
+        return stop, BM25Index().extended(self.chunk_store.iter_texts(start, stop))
+
+    def _rebuild(self, promote: bool = False) -> bool:
+        """后台重建索引：清除已删除的向量（压缩）或把 Flat 索引升级为目标类型"""
+        try:
+            snapshot = self._snapshot
+            rows, tombstones, template = snapshot.rows, snapshot.tombstones, snapshot.template
+            if len(self.raw_vectors) < rows:
+                logging.warning(f"知识库 {self.knowledge_base_name} 缺少全精度向量，无法重建索引")
+                return False
+            if promote:
+                target = self.index_config["type"]
+                num_vectors = snapshot.ntotal
+                logging.info(f"知识库 {self.knowledge_base_name} 向量数 {num_vectors}，Flat 索引升级为 "
+                             f"{target}/{self.index_config['encoding']}")
+                new_index = create_index(target, snapshot.dimension, num_vectors, self.index_config)
+                if not new_index.is_trained:
+                    required = min_train_size(target, num_vectors, self.index_config)
+                    sample_size = min(rows, max(self.index_config["train_sample_size"], required))
+                    new_index.train(reservoir_sample(self.raw_vectors.iter_batches(stop=rows), sample_size))
+                template = faiss.clone_index(new_index)
+            else:
+                logging.info(f"开始压缩知识库 {self.knowledge_base_name}: 清除 {self._pending_deletes(snapshot)} 个已删除向量")
+                new_index = faiss.clone_index(template)
+            self._add_vectors(new_index, self.raw_vectors.iter_batches(stop=rows), tombstones)
+            new_bm25 = BM25Index().extended("" if deleted else text
+                                            for deleted, text in zip(tombstones, self.chunk_store.iter_texts(0, rows)))
+            segment = self.segment_store.write_segment(new_index, new_bm25, 0, rows)
+            tail = self._prebuild_tail_bm25(rows)
+            
+            with self._kb_lock:
+                self._rebase()
+                with self._write_lock:
+                    current = self._snapshot
+                    if current.template is not snapshot.template:
+                        logging.info(f"知识库 {self.knowledge_base_name} 重建期间索引已被替换，放弃本次结果")
+                        self.segment_store.discard(segment)
+                        return False
+                    self._publish(IndexSnapshot(template, (new_index,), ((0, new_bm25),), rows, current.rows,
+                                                self._tail_bm25(rows, tail), current.tombstones), [segment])
+            logging.info(f"知识库 {self.knowledge_base_name} 索引重建完成，索引向量数 {new_index.ntotal}")
+            return True
+        except Exception as e:
+            logging.error(f"重建索引失败: {str(e)}")
+            return False
+
+    def _seal_segment(self) -> bool:
+        """把尚未封存的尾部片段从全精度向量和片段文本构建为新段，不阻塞检索与写入；完成后在写锁内发布"""
+        try:
+            snapshot = self._snapshot
+            start, end = snapshot.sealed_rows, snapshot.rows
+            segment_index = faiss.clone_index(snapshot.template)
+            self._add_vectors(segment_index, self.raw_vectors.iter_batches(start=start, stop=end),
+                              snapshot.tombstones, start=start)
+            segment_bm25 = BM25Index().extended(self.chunk_store.iter_texts(start, end))
+            segment = self.segment_store.write_segment(segment_index, segment_bm25, start, end)
+            tail = self._prebuild_tail_bm25(end)
+            
+            with self._kb_lock:
+                self._rebase()
+                with self._write_lock:
+                    current = self._snapshot
+                    if current.template is not snapshot.template or current.sealed_rows != start:
+                        self.segment_store.discard(segment)
+                        return False
+                    self._publish(current.replace(segments=current.segments + (segment_index,),
+                                                  bm25_segments=current.bm25_segments + ((start, segment_bm25),),
+                                                  sealed_rows=end, bm25_tail=self._tail_bm25(end, tail)),
+                                  self.segment_store.segments + [segment])
+            logging.info(f"知识库 {self.knowledge_base_name} 封存片段 [{start}, {end}) 为段 {segment['id']}")
+            return True
+        except Exception as e:
+            logging.error(f"封存段失败: {str(e)}")
+            return False
+
+    def _merge_segments(self, first: int, last: int) -> bool:
+        """把 [first, last) 的相邻段合并为一段，完成后在写锁内替换"""
+        try:
+            with self._write_lock:
+                template = self._snapshot.template
+                run = self.segment_store.segments[first:last]
+            parts = [self.segment_store.read_segment(segment, self.index_config["verify_checksums"]) for segment in run]
+            start, end = run[0]["start"], run[-1]["end"]
+            if len(self.raw_vectors) >= end:
+                # 按各段的外部 id 从全精度向量重新编码，与封存时的编码一致
+                merged = faiss.clone_index(template)
+                for index, _ in parts:
+                    ids = faiss.vector_to_array(index.id_map)
+                    for begin in range(0, len(ids), 10000):
+                        batch = ids[begin:begin + 10000]
+                        merged.add_with_ids(self.raw_vectors.get(batch), batch)
+            else:
+                merged = parts[0][0]
+                for index, _ in parts[1:]:
+                    merge_into(merged, index)
+            if all(bm25 is not None for _, bm25 in parts):
+                merged_bm25 = BM25Index.concat([bm25 for _, bm25 in parts])
+            else:
+                merged_bm25 = BM25Index().extended(self.chunk_store.iter_texts(start, end))
+            segment = self.segment_store.write_segment(merged, merged_bm25, start, end)
+            
+            with self._kb_lock:
+                self._rebase()
+                with self._write_lock:
+                    current = self._snapshot
+                    segments = self.segment_store.segments
+                    if current.template is not template or [s["id"] for s in segments[first:last]] != [s["id"] for s in run]:
+                        self.segment_store.discard(segment)
+                        return False
+                    self._publish(current.replace(
+                        segments=current.segments[:first] + (merged,) + current.segments[last:],
+                        bm25_segments=current.bm25_segments[:first] + ((start, merged_bm25),) + current.bm25_segments[last:]
+                    ), segments[:first] + [segment] + segments[last:])
+            logging.info(f"知识库 {self.knowledge_base_name} 合并 {len(run)} 个段为段 {segment['id']}（片段 [{start}, {end})）")
+            return True
+        except Exception as e:
+            logging.error(f"合并段失败: {str(e)}")
+            return False
@@ -1,41 +1,123 @@
 import logging
-from typing import Dict, Any, Optional
+from functools import partial
+from typing import Dict, Any, Optional, List
 from Config.model_config import RAG_CONFIG
 from KnowledgeManager.FAISSKnowledgeManager import FAISSKnowledgeManager
-from KnowledgeManager.reranker import apply_rerank_to_search_results
+from KnowledgeManager.reranker import apply_rerank_to_search_results, aapply_rerank_to_search_results
+from KnowledgeManager.manager_registry import create_registry
+from KnowledgeManager import federated_search
+
+# 进程内共享的已加载知识管理器
+_registry = create_registry()
+
+# 共享实例使用默认切分参数，这些参数改为按次传给 ingest_files
+_PER_INGEST_SETTINGS = ("chunk_size", "chunk_overlap", "use_hybrid_splitter")
 
 class KnowledgeManagerFactory:
     """知识管理器工厂类 (迁移自 report-26v0)"""
     
     @staticmethod
     def create_knowledge_manager(knowledge_base_name: str, embedding_model: str = None, 
-                                vector_store_type: str = None, use_hybrid_splitter: bool = True,
-                                chunk_size: int = None, chunk_overlap: int = None, **kwargs) -> Any:
+                                vector_store_type: str = None, vector_encoding: Optional[str] = None, **kwargs) -> Any:
+        """返回已初始化的知识管理器，同一 (知识库, embedding模型) 在进程内共享"""
+        if kwargs:
+            per_ingest = [name for name in kwargs if name in _PER_INGEST_SETTINGS]
+            if per_ingest:
+                raise TypeError(f"create_knowledge_manager 不再接受 {', '.join(per_ingest)}，"
+                                f"请在入库时传给 ingest_files(chunk_size=..., chunk_overlap=..., use_hybrid_splitter=...)")
+            raise TypeError(f"create_knowledge_manager 不支持的参数: {', '.join(kwargs)}")
         if vector_store_type is None:
             vector_store_type = RAG_CONFIG.get("vector_store", {}).get("type", "faiss")
         
         vector_store_type = vector_store_type.lower()
-        logging.info(f"创建知识管理器: {knowledge_base_name}, 类型: {vector_store_type}")
-        
-        if vector_store_type == "faiss":
-            return FAISSKnowledgeManager(
-                knowledge_base_name=knowledge_base_name,
-                embedding_model=embedding_model,
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-                use_hybrid_splitter=use_hybrid_splitter
-            )
-        else:
+        if vector_store_type != "faiss":
             # 目前只支持 FAISS 迁移，其他返回 FAISS 作为兜底
             logging.warning(f"目前迁移版只支持 FAISS，使用默认 FAISS")
+        
+        embedding_model = embedding_model or RAG_CONFIG["embeddings"]["default_model"]
+        
+        def build():
+            logging.info(f"创建知识管理器: {knowledge_base_name}, 类型: {vector_store_type}")
             return FAISSKnowledgeManager(
                 knowledge_base_name=knowledge_base_name,
                 embedding_model=embedding_model,
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-                use_hybrid_splitter=use_hybrid_splitter
+                vector_encoding=vector_encoding
             )
+        
+        return _registry.get((knowledge_base_name, embedding_model), build)
+    
+    @staticmethod
+    def delete_knowledge_base(knowledge_base_name: str) -> Dict[str, Any]:
+        """删除知识库目录，并从注册表中移除已加载的实例"""
+        _registry.invalidate(knowledge_base_name)
+        return FAISSKnowledgeManager.delete_knowledge_base_by_name(knowledge_base_name)
+    
+    @staticmethod
+    def search_federated(knowledge_bases: List[str], query: str, k: int = 10, search_mode: str = "hybrid",
+                         filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3,
+                         vector_weight: float = 0.7, keyword_weight: float = 0.3, fusion: Optional[str] = None,
+                         embedding_model: Optional[str] = None) -> Dict[str, Any]:
+        """多知识库联合检索，按分数合并为全局 top-k"""
+        return KnowledgeManagerFactory.search_many_federated(
+            knowledge_bases, [query], k=k, search_mode=search_mode, filters=filters, score_threshold=score_threshold,
+            vector_weight=vector_weight, keyword_weight=keyword_weight, fusion=fusion, embedding_model=embedding_model
+        )[0]
+    
+    @staticmethod
+    def search_many_federated(knowledge_bases: List[str], queries: List[str], k: int = 10, search_mode: str = "hybrid",
+                              filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3,
+                              vector_weight: float = 0.7, keyword_weight: float = 0.3, fusion: Optional[str] = None,
+                              embedding_model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """多个 query 的多知识库联合检索"""
+        embedding_model = embedding_model or RAG_CONFIG["embeddings"]["default_model"]
+        load = partial(KnowledgeManagerFactory._load_for_search, embedding_model=embedding_model)
+        return federated_search.search_many_federated(
+            load, knowledge_bases, queries, k=k, search_mode=search_mode, filters=filters, score_threshold=score_threshold,
+            vector_weight=vector_weight, keyword_weight=keyword_weight, fusion=fusion, embedding_model=embedding_model
+        )
+    
+    @staticmethod
+    async def asearch_federated(knowledge_bases: List[str], query: str, k: int = 10, search_mode: str = "hybrid",
+                                filters: Optional[Dict[str, Any]] = None, score_threshold: float = 0.3,
+                                vector_weight: float = 0.7, keyword_weight: float = 0.3, fusion: Optional[str] = None,
+                                embedding_model: Optional[str] = None) -> Dict[str, Any]:
+        """search_federated 的异步版本"""
+        return (await KnowledgeManagerFactory.asearch_many_federated(
+            knowledge_bases, [query], k=k, search_mode=search_mode, filters=filters, score_threshold=score_threshold,
+            vector_weight=vector_weight, keyword_weight=keyword_weight, fusion=fusion, embedding_model=embedding_model
+        ))[0]
+    
+    @staticmethod
+    async def asearch_many_federated(knowledge_bases: List[str], queries: List[str], k: int = 10,
+                                     search_mode: str = "hybrid", filters: Optional[Dict[str, Any]] = None,
+                                     score_threshold: float = 0.3, vector_weight: float = 0.7,
+                                     keyword_weight: float = 0.3, fusion: Optional[str] = None,
+                                     embedding_model: Optional[str] = None) -> List[Dict[str, Any]]:
+        """search_many_federated 的异步版本"""
+        embedding_model = embedding_model or RAG_CONFIG["embeddings"]["default_model"]
+        load = partial(KnowledgeManagerFactory._load_for_search, embedding_model=embedding_model)
+        return await federated_search.asearch_many_federated(
+            load, knowledge_bases, queries, k=k, search_mode=search_mode, filters=filters, score_threshold=score_threshold,
+            vector_weight=vector_weight, keyword_weight=keyword_weight, fusion=fusion, embedding_model=embedding_model
+        )
+    
+    @staticmethod
+    def _load_for_search(knowledge_base_name: str, embedding_model: str) -> Any:
+        """联合检索只读取已存在的知识库，不为拼错的名称创建空库"""
+        if knowledge_base_name not in FAISSKnowledgeManager.list_knowledge_bases():
+            raise ValueError(f"知识库不存在: {knowledge_base_name}")
+        return KnowledgeManagerFactory.create_knowledge_manager(knowledge_base_name, embedding_model=embedding_model)
+    
+    @staticmethod
+    def get_registry_stats() -> Dict[str, Any]:
+        return _registry.stats()
+    
+    @staticmethod
+    def apply_rerank(query: str, search_results: Dict[str, Any], top_k: int = None,
+                     budget_ms: Optional[float] = None) -> Dict[str, Any]:
+        return apply_rerank_to_search_results(query, search_results, top_k, budget_ms=budget_ms)
     
     @staticmethod
-    def apply_rerank(query: str, search_results: Dict[str, Any], top_k: int = None) -> Dict[str, Any]:
-        return apply_rerank_to_search_results(query, search_results, top_k)
+    async def aapply_rerank(query: str, search_results: Dict[str, Any], top_k: int = None,
+                            budget_ms: Optional[float] = None) -> Dict[str, Any]:
+        return await aapply_rerank_to_search_results(query, search_results, top_k, budget_ms=budget_ms)
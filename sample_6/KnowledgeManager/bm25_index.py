@@ -0,0 +1,259 @@
+"""
+BM25倒排索引
+与向量索引一同持久化，关键词检索在进程内完成，无需调用embedding服务
+"""
+
+import os
+import re
+import math
+import logging
+from array import array
+from pathlib import Path
+from typing import List, Tuple, Dict, Optional
+
+import numpy as np  # pyright: ignore[reportMissingImports]
+
+try:
+    import jieba  # pyright: ignore[reportMissingImports]
+    jieba.setLogLevel(logging.WARNING)
+    JIEBA_AVAILABLE = True
+except ImportError:
+    JIEBA_AVAILABLE = False
+
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+_TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[A-Za-z0-9_]+(?:[.\-][A-Za-z0-9_]+)*")
+
+# tf 以 uint16 存储，超过上限直接截断（对BM25饱和项影响可以忽略）
+_MAX_TF = 65535
+
+
+def get_tokenizer_name() -> str:
+    """当前环境下使用的分词器名称，持久化时写入索引文件，用于检测分词器变化"""
+    return "jieba" if JIEBA_AVAILABLE else "cjk_bigram"
+
+
+def tokenize(text: str) -> List[str]:
+    """中英文混合分词：有 jieba 时按搜索引擎模式分词，否则中文按字二元组切分"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        piece = match.group(0)
+        if not _CJK_RE.match(piece):
+            tokens.append(piece.lower())
+        elif JIEBA_AVAILABLE:
+            tokens.extend(t for t in jieba.lcut_for_search(piece) if t.strip())
+        elif len(piece) == 1:
+            tokens.append(piece)
+        else:
+            tokens.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+    return tokens
+
+
+def search_segments(parts: List[Tuple[int, "BM25Index"]], query: str, k: int = 10,
+                    mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+    """在按文档编号区间切分的多个倒排上检索，分数与合并为单个索引时一致"""
+    parts = [(start, part) for start, part in parts if len(part.doc_lens)]
+    if not parts:
+        return []
+    num_docs = sum(len(part.doc_lens) for _, part in parts)
+    total_docs = max(start + len(part.doc_lens) for start, part in parts)
+
+    # 每个查询词在各分段中的倒排区间
+    postings: Dict[str, List[Tuple[int, "BM25Index", int, int]]] = {}
+    for token in set(tokenize(query)):
+        for start, part in parts:
+            term_id = part.vocab.get(token)
+            if term_id is None:
+                continue
+            begin, end = int(part.offsets[term_id]), int(part.offsets[term_id + 1])
+            if end > begin:
+                postings.setdefault(token, []).append((start, part, begin, end))
+    if not postings:
+        return []
+
+    k1, b = parts[0][1].k1, parts[0][1].b
+    avgdl = max(sum(part._total_len for _, part in parts) / num_docs, 1.0)
+    scores = np.zeros(total_docs, dtype=np.float32)
+    idf_sum = 0.0
+    for entries in postings.values():
+        df = sum(end - begin for _, _, begin, end in entries)
+        idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+        idf_sum += idf
+        for start, part, begin, end in entries:
+            ids = part.doc_ids[begin:end]
+            tf = part.tfs[begin:end].astype(np.float32)
+            norm = k1 * (1 - b + b * part.doc_lens[ids] / avgdl)
+            scores[start + ids] += idf * tf * (k1 + 1) / (tf + norm)
+
+    if mask is not None:
+        scores[~mask[:total_docs]] = 0
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+    # 单个词的得分上限为 idf·(k1+1)，按全部查询词的上限之和归一化，保持原有排序且不会截断到 1
+    upper = idf_sum * (k1 + 1)
+    return [(int(i), float(scores[i]) / upper) for i in candidates]
+
+
+class BM25Index:
+    """基于CSR压缩数组的BM25倒排索引，新增文档先写入缓冲再合并"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.tokenizer_name = get_tokenizer_name()
+        self.vocab: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.uint16)
+        self.doc_lens = np.zeros(0, dtype=np.int32)
+        self._total_len = 0
+        self._pending_docs: Dict[int, array] = {}
+        self._pending_tfs: Dict[int, array] = {}
+        self._pending_lens = array('i')
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lens) + len(self._pending_lens)
+
+    def memory_bytes(self) -> int:
+        """倒排数组占用的内存（不含词表字典）"""
+        return int(self.offsets.nbytes + self.doc_ids.nbytes + self.tfs.nbytes + self.doc_lens.nbytes)
+
+    def add_documents(self, texts: List[str]):
+        """追加文档，文档编号从当前文档数开始连续分配"""
+        doc_id = self.num_docs
+        for text in texts:
+            counts: Dict[str, int] = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                term_id = self.vocab.get(token)
+                if term_id is None:
+                    term_id = len(self.vocab)
+                    self.vocab[token] = term_id
+                if term_id not in self._pending_docs:
+                    self._pending_docs[term_id] = array('i')
+                    self._pending_tfs[term_id] = array('H')
+                self._pending_docs[term_id].append(doc_id)
+                self._pending_tfs[term_id].append(min(tf, _MAX_TF))
+            self._pending_lens.append(len(tokens))
+            self._total_len += len(tokens)
+            doc_id += 1
+
+    def _compact(self):
+        """把缓冲区中的新增倒排合并进CSR数组"""
+        if not self._pending_lens:
+            return
+        vocab_size = len(self.vocab)
+        old_counts = np.diff(self.offsets)
+        counts = np.zeros(vocab_size, dtype=np.int64)
+        counts[:len(old_counts)] = old_counts
+        for term_id, docs in self._pending_docs.items():
+            counts[term_id] += len(docs)
+
+        offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for term_id in range(vocab_size):
+            start = offsets[term_id]
+            pos = start
+            if term_id < len(old_counts):
+                old_start, old_end = self.offsets[term_id], self.offsets[term_id + 1]
+                pos = start + (old_end - old_start)
+                doc_ids[start:pos] = self.doc_ids[old_start:old_end]
+                tfs[start:pos] = self.tfs[old_start:old_end]
+            if term_id in self._pending_docs:
+                doc_ids[pos:offsets[term_id + 1]] = np.frombuffer(self._pending_docs[term_id], dtype=np.int32)
+                tfs[pos:offsets[term_id + 1]] = np.frombuffer(self._pending_tfs[term_id], dtype=np.uint16)
+
+        self.offsets, self.doc_ids, self.tfs = offsets, doc_ids, tfs
+        self.doc_lens = np.concatenate([self.doc_lens, np.frombuffer(self._pending_lens, dtype=np.int32)])
+        self._pending_docs, self._pending_tfs = {}, {}
+        self._pending_lens = array('i')
+
+    def search(self, query: str, k: int = 10, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """BM25检索，返回 [(文档编号, 归一化到 [0, 1] 的分数)]，mask 为 False 的文档不参与排序"""
+        self._compact()
+        return search_segments([(0, self)], query, k, mask)
+
+    def extended(self, texts: List[str]) -> "BM25Index":
+        """返回追加 texts 后的新索引，自身保持不变"""
+        self._compact()
+        index = BM25Index(k1=self.k1, b=self.b)
+        index.tokenizer_name = self.tokenizer_name
+        index.vocab = dict(self.vocab)
+        index.offsets, index.doc_ids, index.tfs, index.doc_lens = self.offsets, self.doc_ids, self.tfs, self.doc_lens
+        index._total_len = self._total_len
+        index.add_documents(texts)
+        index._compact()
+        return index
+
+    def save(self, file_path: Path):
+        """原子写入 .npz 文件"""
+        self._compact()
+        terms = [""] * len(self.vocab)
+        for term, term_id in self.vocab.items():
+            terms[term_id] = term
+        tmp_path = Path(f"{file_path}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                offsets=self.offsets,
+                doc_ids=self.doc_ids,
+                tfs=self.tfs,
+                doc_lens=self.doc_lens,
+                terms=np.array(terms, dtype=str),
+                params=np.array([self.k1, self.b], dtype=np.float64),
+                tokenizer=np.array(self.tokenizer_name)
+            )
+        os.replace(tmp_path, file_path)
+
+    @classmethod
+    def load(cls, file_path: Path) -> Optional["BM25Index"]:
+        """加载索引；分词器与当前环境不一致时返回 None，由调用方重建"""
+        with np.load(file_path, allow_pickle=False) as data:
+            if str(data["tokenizer"]) != get_tokenizer_name():
+                logging.info(f"BM25索引分词器({data['tokenizer']})与当前环境不一致，需要重建")
+                return None
+            k1, b = data["params"].tolist()
+            index = cls(k1=k1, b=b)
+            index.offsets = data["offsets"]
+            index.doc_ids = data["doc_ids"]
+            index.tfs = data["tfs"]
+            index.doc_lens = data["doc_lens"]
+            index.vocab = {term: i for i, term in enumerate(data["terms"].tolist())}
+        index._total_len = int(index.doc_lens.sum())
+        return index
+
+    @classmethod
+    def concat(cls, parts: List["BM25Index"]) -> "BM25Index":
+        """按顺序拼接多个索引，后一个的文档编号接在前一个之后（用于加载与合并分段保存的倒排）"""
+        index = cls(k1=parts[0].k1, b=parts[0].b) if parts else cls()
+        term_ids, doc_ids, tfs, doc_lens = [], [], [], []
+        offset = 0
+        for part in parts:
+            part._compact()
+            terms = [""] * len(part.vocab)
+            for term, term_id in part.vocab.items():
+                terms[term_id] = term
+            mapping = np.array([index.vocab.setdefault(term, len(index.vocab)) for term in terms], dtype=np.int64)
+            term_ids.append(np.repeat(mapping, np.diff(part.offsets)))
+            doc_ids.append(part.doc_ids + np.int32(offset))
+            tfs.append(part.tfs)
+            doc_lens.append(part.doc_lens)
+            offset += part.num_docs
+        if not parts:
+            return index
+        all_terms = np.concatenate(term_ids)
+        # 稳定排序保持同一词内文档编号递增
+        order = np.argsort(all_terms, kind="stable")
+        index.offsets = np.zeros(len(index.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_terms, minlength=len(index.vocab)), out=index.offsets[1:])
+        index.doc_ids = np.concatenate(doc_ids)[order].astype(np.int32)
+        index.tfs = np.concatenate(tfs)[order]
+        index.doc_lens = np.concatenate(doc_lens).astype(np.int32)
+        index._total_len = int(index.doc_lens.sum())
+        return index
@@ -0,0 +1,199 @@
+"""
+列式片段存储
+文本与按列字典编码的元数据追加写入、内存映射读取，columns.json 为提交点
+"""
+
+import os
+import json
+import shutil
+import logging
+from pathlib import Path
+from typing import List, Dict, Any, Iterator, Optional
+
+import numpy as np  # pyright: ignore[reportMissingImports]
+
+
+def _value_key(value: Any) -> str:
+    """字典编码使用的取值键（列表等不可哈希的值按 JSON 规范化）"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+class ChunkStore:
+    """追加写入的片段存储，行号即片段编号"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.manifest_file = self.directory / "columns.json"
+        self.text_file = self.directory / "text.bin"
+        self.offsets_file = self.directory / "offsets.i64"
+        self.count = 0
+        self.text_bytes = 0
+        self.columns: List[Dict[str, Any]] = []
+        self._column_lookup: Dict[str, int] = {}
+        self._value_codes: List[Dict[str, int]] = []
+        self._maps: Dict[str, Any] = {}
+        if self.manifest_file.exists():
+            self._load_manifest()
+
+    def exists(self) -> bool:
+        return self.manifest_file.exists()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _column_file(self, position: int) -> Path:
+        return self.directory / f"col_{position}.i32"
+
+    def _load_manifest(self):
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.count = manifest["count"]
+        self.text_bytes = manifest["text_bytes"]
+        self.columns = manifest["columns"]
+        self._column_lookup = {col["name"]: i for i, col in enumerate(self.columns)}
+        self._value_codes = [{_value_key(v): code for code, v in enumerate(col["values"])} for col in self.columns]
+        self._maps = {}
+
+    def _write_manifest(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.directory / "columns.json.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"count": self.count, "text_bytes": self.text_bytes, "columns": self.columns}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.manifest_file)
+
+    def _map(self, name: str, file_path: Path, dtype: Any, length: int) -> np.ndarray:
+        """按当前提交的长度内存映射数组文件，长度变化时重新映射"""
+        cached = self._maps.get(name)
+        if cached is not None and len(cached) == length:
+            return cached
+        if length == 0:
+            view = np.empty(0, dtype=dtype)
+        else:
+            view = np.memmap(file_path, dtype=dtype, mode='r', shape=(length,))
+        self._maps[name] = view
+        return view
+
+    def _offsets(self) -> np.ndarray:
+        return self._map("offsets", self.offsets_file, np.int64, self.count)
+
+    def _codes(self, position: int) -> np.ndarray:
+        return self._map(f"col_{position}", self._column_file(position), np.int32, self.count)
+
+    def _text_blob(self) -> np.ndarray:
+        return self._map("text", self.text_file, np.uint8, self.text_bytes)
+
+    @staticmethod
+    def _truncate_file(file_path: Path, size: int):
+        """丢弃提交点之后的残留数据（写入中断时产生）"""
+        if file_path.exists() and file_path.stat().st_size > size:
+            with open(file_path, 'r+b') as f:
+                f.truncate(size)
+
+    @staticmethod
+    def _append_file(file_path: Path, data: bytes):
+        """追加并刷盘，保证提交 columns.json 之前数据已落盘"""
+        with open(file_path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, texts: List[str], metadatas: List[Dict[str, Any]]):
+        """追加片段，写入成本与本批大小成正比（新增元数据列时需为历史片段回填一次）"""
+        if len(texts) != len(metadatas):
+            raise ValueError("texts 与 metadatas 数量不一致")
+        if not texts:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._maps = {}
+
+        encoded = [t.encode('utf-8') for t in texts]
+        ends = self.text_bytes + np.cumsum([len(b) for b in encoded], dtype=np.int64)
+        self._truncate_file(self.text_file, self.text_bytes)
+        self._append_file(self.text_file, b"".join(encoded))
+        self._truncate_file(self.offsets_file, self.count * 8)
+        self._append_file(self.offsets_file, ends.tobytes())
+
+        for key in {key for metadata in metadatas for key in metadata}:
+            if key not in self._column_lookup:
+                position = len(self.columns)
+                self.columns.append({"name": key, "values": []})
+                self._column_lookup[key] = position
+                self._value_codes.append({})
+                with open(self._column_file(position), 'wb') as f:
+                    f.write(np.full(self.count, -1, dtype=np.int32).tobytes())
+
+        for position, column in enumerate(self.columns):
+            lookup = self._value_codes[position]
+            codes = np.full(len(metadatas), -1, dtype=np.int32)
+            for row, metadata in enumerate(metadatas):
+                if column["name"] not in metadata:
+                    continue
+                value = metadata[column["name"]]
+                value_key = _value_key(value)
+                code = lookup.get(value_key)
+                if code is None:
+                    code = len(column["values"])
+                    column["values"].append(value)
+                    lookup[value_key] = code
+                codes[row] = code
+            self._truncate_file(self._column_file(position), self.count * 4)
+            self._append_file(self._column_file(position), codes.tobytes())
+
+        self.count += len(texts)
+        self.text_bytes = int(ends[-1])
+        self._write_manifest()
+
+    def truncate(self, count: int):
+        """回退到前 count 个片段（用于与向量索引对齐）"""
+        if count >= self.count:
+            return
+        self.text_bytes = int(self._offsets()[count - 1]) if count > 0 else 0
+        self.count = count
+        self._maps = {}
+        self._write_manifest()
+        logging.warning(f"片段存储已回退到 {count} 条: {self.directory}")
+
+    def get_text(self, idx: int) -> str:
+        offsets = self._offsets()
+        start = int(offsets[idx - 1]) if idx > 0 else 0
+        return self._text_blob()[start:int(offsets[idx])].tobytes().decode('utf-8')
+
+    def get_metadata(self, idx: int) -> Dict[str, Any]:
+        metadata = {}
+        for position, column in enumerate(self.columns):
+            code = int(self._codes(position)[idx])
+            if code >= 0:
+                metadata[column["name"]] = column["values"][code]
+        return metadata
+
+    def iter_texts(self, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """顺序读取 [start, stop) 的片段文本（用于重建BM25等离线操作）"""
+        offsets = self._offsets()
+        blob = self._text_blob()
+        stop = self.count if stop is None else min(stop, self.count)
+        begin = int(offsets[start - 1]) if 0 < start <= stop else 0
+        for idx in range(start, stop):
+            end = int(offsets[idx])
+            yield blob[begin:end].tobytes().decode('utf-8')
+            begin = end
+
+    def column_codes(self, name: str) -> Optional[np.ndarray]:
+        """返回某一元数据列的编码数组（内存映射），不存在时返回 None"""
+        position = self._column_lookup.get(name)
+        return None if position is None else self._codes(position)
+
+    def column_values(self, name: str) -> List[Any]:
+        position = self._column_lookup.get(name)
+        return [] if position is None else self.columns[position]["values"]
+
+    def clear(self):
+        self._maps = {}
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        self.count = 0
+        self.text_bytes = 0
+        self.columns = []
+        self._column_lookup = {}
+        self._value_codes = []
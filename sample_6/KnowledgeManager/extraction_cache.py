@@ -0,0 +1,134 @@
+"""
+解析结果缓存
+按文件内容哈希、扩展名和解析器版本缓存解析结果，配置见 RAG_CONFIG["extraction"]["cache"]
+"""
+
+import os
+import json
+import zlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from Config.model_config import RAG_CONFIG
+
+DEFAULT_CACHE_CONFIG = {
+    "enabled": True,
+    "directory": None,        # None 时放在知识库根目录同级的 extraction_cache 目录
+    "max_mb": 2048,           # 总大小上限，超出时删除最久未使用的条目
+    "formats": [".pdf", ".docx", ".doc", ".html", ".htm"]  # 纯文本直接读取不比读缓存慢
+}
+
+
+def get_cache_config() -> Dict[str, Any]:
+    config = dict(DEFAULT_CACHE_CONFIG)
+    config.update(RAG_CONFIG.get("extraction", {}).get("cache", {}))
+    if not config["directory"]:
+        base_directory = Path(RAG_CONFIG["vector_store"]["faiss"]["base_directory"])
+        config["directory"] = str(base_directory.parent / "extraction_cache")
+    return config
+
+
+class ExtractionCache:
+    """进程内单例；线程、进程间共享同一目录"""
+
+    def __init__(self, directory: Path, max_bytes: int, formats: List[str]):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.formats = {fmt.lower() for fmt in formats}
+        self._lock = threading.Lock()
+        # 本进程自上次清理以来写入的字节数，超过上限的 1/10 时检查总大小
+        self._written = 0
+        self.counters = {"hits": 0, "misses": 0}
+
+    def accepts(self, file_ext: str) -> bool:
+        return file_ext.lower() in self.formats
+
+    def _path(self, content_hash: str, file_ext: str, version: int) -> Path:
+        return self.directory / content_hash[:2] / f"{content_hash}{file_ext.lower()}.v{version}.z"
+
+    def get(self, content_hash: str, file_ext: str, version: int) -> Optional[Dict[str, Any]]:
+        path = self._path(content_hash, file_ext, version)
+        try:
+            with open(path, 'rb') as f:
+                extracted = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        except FileNotFoundError:
+            self.counters["misses"] += 1
+            return None
+        except (OSError, zlib.error, ValueError) as e:
+            logging.warning(f"解析缓存条目损坏，重新解析: {path.name} ({e})")
+            self.counters["misses"] += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.counters["hits"] += 1
+        return extracted
+
+    def put(self, content_hash: str, file_ext: str, version: int, extracted: Dict[str, Any]):
+        path = self._path(content_hash, file_ext, version)
+        data = zlib.compress(json.dumps(extracted, ensure_ascii=False).encode('utf-8'), 6)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"写入解析缓存失败: {e}")
+            return
+        with self._lock:
+            self._written += len(data)
+            if self._written < self.max_bytes // 10:
+                return
+            self._written = 0
+        self._prune()
+
+    def _prune(self):
+        """总大小超过上限时按修改时间从旧到新删除，直到低于上限的 90%"""
+        entries = []
+        total = 0
+        for path in self.directory.glob("*/*.z"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        logging.info(f"解析缓存超过 {self.max_bytes / 1024 / 1024:.0f}MB，删除 {removed} 个最久未使用的条目")
+
+
+_cache: Optional[ExtractionCache] = None
+_cache_loaded = False
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """进程内共享的解析结果缓存，未启用时返回 None"""
+    global _cache, _cache_loaded
+    if _cache_loaded:
+        return _cache
+    with _cache_lock:
+        if not _cache_loaded:
+            config = get_cache_config()
+            if config["enabled"]:
+                _cache = ExtractionCache(Path(config["directory"]), int(config["max_mb"] * 1024 * 1024),
+                                         config["formats"])
+            _cache_loaded = True
+    return _cache
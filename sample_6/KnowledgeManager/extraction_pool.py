@@ -0,0 +1,207 @@
+"""
+多进程文档解析
+在解析进程池中并行解析与切分，单个文件超时或崩溃只影响该文件
+
+配置 RAG_CONFIG["extraction"]: workers（默认 CPU 核数）、timeout（秒，默认 120）、start_method（默认 "spawn"）
+"""
+
+import os
+import time
+import logging
+import multiprocessing
+from itertools import chain, islice
+from multiprocessing.connection import wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from Config.model_config import RAG_CONFIG
+from KnowledgeManager.knowledge_extractor import knowledge_extractor
+from KnowledgeManager.ingest_manifest import file_sha256
+from KnowledgeManager.page_splitter import split_pages, split_document
+
+EXTRACTION_CONFIG = RAG_CONFIG.get("extraction", {})
+
+
+def extract_file(file_path: str, splitter: Any = None, known_hash: Optional[str] = None,
+                 compute_hash: bool = False) -> Dict[str, Any]:
+    """解析单个文件，给定 splitter 时同时切分；known_hash 与当前内容哈希相同时不解析"""
+    result = {"hash": None, "document": None, "unchanged": False, "error": None}
+    if compute_hash or known_hash is not None:
+        try:
+            result["hash"] = file_sha256(file_path)
+        except OSError as e:
+            result["error"] = f"读取文件失败: {e}"
+            return result
+        if result["hash"] == known_hash:
+            result["unchanged"] = True
+            return result
+    document = knowledge_extractor.extract_from_file(file_path, result["hash"])
+    if not document:
+        result["error"] = "解析失败或内容为空"
+        return result
+    if splitter is not None:
+        if document.get("pages"):
+            split = list(split_pages(splitter, knowledge_extractor.iter_pages(document)))
+            document["chunks"] = [chunk for chunk, _ in split]
+            document["chunk_metadatas"] = [metadata for _, metadata in split]
+        else:
+            document["chunks"], document["chunk_metadatas"] = split_document(splitter, document["content"])
+    result["document"] = document
+    return result
+
+
+def _worker_main(conn: Any, splitter: Any):
+    """工作进程：逐个接收 (任务编号, extract_file 参数)，返回 (任务编号, 结果)"""
+    conn.send(None)
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        task_id, kwargs = task
+        try:
+            result = extract_file(splitter=splitter, **kwargs)
+        except Exception as e:
+            result = {"hash": None, "document": None, "unchanged": False, "error": str(e)}
+        conn.send((task_id, result))
+
+
+class _Worker:
+    def __init__(self, context: Any, splitter: Any):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, splitter), daemon=True)
+        self.process.start()
+        child_conn.close()
+        # 收到就绪消息之前不分配任务，进程启动与模块导入的耗时不计入文件的解析超时
+        self.ready = False
+
+    def stop(self, timeout: float = 1.0):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1.0)
+        self.conn.close()
+
+
+class ExtractionPool:
+    """解析进程池；用作上下文管理器，退出时关闭全部工作进程"""
+
+    def __init__(self, splitter: Any = None, workers: Optional[int] = None, timeout: Optional[float] = None,
+                 start_method: Optional[str] = None):
+        self.splitter = splitter
+        self.workers = max(int(workers or EXTRACTION_CONFIG.get("workers") or os.cpu_count() or 1), 1)
+        self.timeout = float(timeout or EXTRACTION_CONFIG.get("timeout", 120))
+        self.context = multiprocessing.get_context(start_method or EXTRACTION_CONFIG.get("start_method", "spawn"))
+        self._workers: List[_Worker] = []
+
+    def __enter__(self) -> "ExtractionPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        new_worker = _Worker(self.context, self.splitter)
+        self._workers[self._workers.index(worker)] = new_worker
+        return new_worker
+
+    def imap(self, tasks: Iterable[Tuple[Any, Dict[str, Any]]], ordered: bool = False) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """并行执行 extract_file，产出 (任务标识, 结果)；ordered 时按输入顺序产出"""
+        # 先取出至多 workers 个任务：任务数少于进程数时只启动任务数个进程，只有一个任务时不启动进程
+        tasks = iter(tasks)
+        head = list(islice(tasks, self.workers))
+        workers = min(self.workers, len(head))
+        if workers <= 1:
+            for key, kwargs in chain(head, tasks):
+                try:
+                    yield key, extract_file(splitter=self.splitter, **kwargs)
+                except Exception as e:
+                    yield key, {"hash": None, "document": None, "unchanged": False, "error": str(e)}
+            return
+
+        while len(self._workers) < workers:
+            self._workers.append(_Worker(self.context, self.splitter))
+        pending = enumerate(chain(head, tasks))
+        window = len(self._workers) * 4
+        idle = [worker for worker in self._workers if worker.ready]
+        starting = {worker.conn: worker for worker in self._workers if not worker.ready}
+        # 连接 -> (工作进程, 任务编号, 任务标识, 开始时间)
+        busy: Dict[Any, Tuple[_Worker, int, Any, float]] = {}
+        finished: Dict[int, Tuple[Any, Dict[str, Any]]] = {}
+        next_id = 0
+        exhausted = False
+
+        def failure(message: str) -> Dict[str, Any]:
+            return {"hash": None, "document": None, "unchanged": False, "error": message}
+
+        while True:
+            while idle and not exhausted and (not ordered or len(busy) + len(finished) < window):
+                try:
+                    task_id, (key, kwargs) = next(pending)
+                except StopIteration:
+                    exhausted = True
+                    break
+                worker = idle.pop()
+                worker.conn.send((task_id, kwargs))
+                busy[worker.conn] = (worker, task_id, key, time.monotonic())
+            if not busy and exhausted:
+                return
+
+            timeout = None
+            if busy:
+                deadline = min(started for *_, started in busy.values()) + self.timeout
+                timeout = max(deadline - time.monotonic(), 0)
+            ready = wait(list(busy) + list(starting), timeout=timeout)
+            completed = []
+            for conn in ready:
+                if conn in starting:
+                    worker = starting.pop(conn)
+                    try:
+                        conn.recv()
+                    except (EOFError, OSError):
+                        raise RuntimeError("解析进程启动失败")
+                    worker.ready = True
+                    idle.append(worker)
+                    continue
+                worker, task_id, key, _ = busy.pop(conn)
+                try:
+                    _, result = conn.recv()
+                except (EOFError, OSError):
+                    completed.append((task_id, key, failure("解析进程异常退出")))
+                    worker = self._replace(worker)
+                    starting[worker.conn] = worker
+                    continue
+                completed.append((task_id, key, result))
+                idle.append(worker)
+            now = time.monotonic()
+            for conn, (worker, task_id, key, started) in list(busy.items()):
+                if now - started >= self.timeout:
+                    del busy[conn]
+                    logging.warning(f"解析超时（{self.timeout:.0f} 秒），终止解析进程: {key}")
+                    completed.append((task_id, key, failure(f"解析超时（{self.timeout:.0f} 秒）")))
+                    worker = self._replace(worker)
+                    starting[worker.conn] = worker
+
+            if not ordered:
+                for _, key, result in completed:
+                    yield key, result
+                continue
+            for task_id, key, result in completed:
+                finished[task_id] = (key, result)
+            while next_id in finished:
+                yield finished.pop(next_id)
+                next_id += 1
@@ -0,0 +1,148 @@
+"""
+多知识库联合检索
+并行检索多个知识库，按分数归并为全局 top-k，query 只向量化一次
+
+配置 RAG_CONFIG["federated_search"]: max_workers（默认 8）
+"""
+
+import heapq
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+from Config.model_config import RAG_CONFIG
+from KnowledgeManager.BaseKnowledgeManager import BaseKnowledgeManager, SEARCH_MODES, describe_source
+from KnowledgeManager.Dependencies.Embeddings import get_local_embeddings
+
+FEDERATED_CONFIG = RAG_CONFIG.get("federated_search", {})
+_SCORE_LABELS = {"vector": "相似度", "bm25": "BM25", "hybrid": "混合得分"}
+
+_federated_executor = ThreadPoolExecutor(
+    max_workers=FEDERATED_CONFIG.get("max_workers", 8),
+    thread_name_prefix="kb_federated"
+)
+
+ManagerLoader = Callable[[str], BaseKnowledgeManager]
+
+
+def _search_options(search_mode: str, k: int, filters: Optional[Dict[str, Any]], score_threshold: float,
+                    vector_weight: float, keyword_weight: float, fusion: Optional[str]) -> Dict[str, Any]:
+    if search_mode not in SEARCH_MODES:
+        raise ValueError(f"不支持的检索模式: {search_mode}，可选: {SEARCH_MODES}")
+    return {"k": k, "filters": filters, "score_threshold": score_threshold, "search_mode": search_mode,
+            "vector_weight": vector_weight, "keyword_weight": keyword_weight, "fusion": fusion}
+
+
+def _needs_embedding(search_mode: str, vector_weight: float) -> bool:
+    return search_mode == "vector" or (search_mode == "hybrid" and vector_weight > 0)
+
+
+def _failure(message: str, count: int) -> List[Dict[str, Any]]:
+    return [{"success": False, "message": message} for _ in range(count)]
+
+
+def merge_results(results: List[Tuple[str, Dict[str, Any]]], k: int, search_mode: str = "vector") -> Dict[str, Any]:
+    """把各知识库对同一个 query 的检索结果合并为全局 top-k，失败的库记录在 failed 中"""
+    failed = {kb: result.get("message", "未知错误") for kb, result in results if not result.get("success")}
+    streams = [[(kb, item) for item in result.get("context_list", [])] for kb, result in results if result.get("success")]
+    merged = islice(heapq.merge(*streams, key=lambda entry: -entry[1]["score"]), k)
+
+    score_label = _SCORE_LABELS.get(search_mode, "相似度")
+    context_parts = []
+    context_list = []
+    for kb, item in merged:
+        context_list.append({**item, "knowledge_base": kb})
+        context_parts.append(f"[知识库: {kb}, 来源: {describe_source(item['metadata'])}, "
+                             f"{score_label}: {item['score']:.3f}]\n{item['content']}")
+    if results and len(failed) == len(results):
+        return {"success": False, "message": "；".join(f"{kb}: {message}" for kb, message in failed.items()),
+                "failed": failed}
+    return {
+        "success": True,
+        "context": "\n\n".join(context_parts),
+        "context_list": context_list,
+        "docs_count": len(context_list),
+        "failed": failed
+    }
+
+
+def _merge_many(knowledge_bases: List[str], per_kb: List[List[Dict[str, Any]]], num_queries: int,
+                k: int, search_mode: str) -> List[Dict[str, Any]]:
+    return [merge_results([(kb, results[qi]) for kb, results in zip(knowledge_bases, per_kb)], k, search_mode)
+            for qi in range(num_queries)]
+
+
+def search_many_federated(load: ManagerLoader, knowledge_bases: List[str], queries: List[str], k: int = 10,
+                          search_mode: str = "hybrid", filters: Optional[Dict[str, Any]] = None,
+                          score_threshold: float = 0.3, vector_weight: float = 0.7, keyword_weight: float = 0.3,
+                          fusion: Optional[str] = None, embedding_model: Optional[str] = None) -> List[Dict[str, Any]]:
+    """并行检索多个知识库，按 query 分别合并为全局 top-k"""
+    knowledge_bases = list(dict.fromkeys(knowledge_bases))
+    if not queries:
+        return []
+    try:
+        options = _search_options(search_mode, k, filters, score_threshold, vector_weight, keyword_weight, fusion)
+        embedding_future = None
+        if _needs_embedding(search_mode, vector_weight):
+            # 全部 query 一次批量向量化，与各库的加载并行
+            embedding_future = _federated_executor.submit(get_local_embeddings(embedding_model).embed_documents, queries)
+        load_futures = {kb: _federated_executor.submit(load, kb) for kb in knowledge_bases}
+        query_embeddings = embedding_future.result() if embedding_future else None
+    except Exception as e:
+        return _failure(str(e), len(queries))
+
+    def load_and_search(kb: str) -> List[Dict[str, Any]]:
+        try:
+            manager = load_futures[kb].result()
+        except Exception as e:
+            logging.warning(f"联合检索加载知识库 {kb} 失败: {str(e)}")
+            return _failure(str(e), len(queries))
+        return manager.search_many(queries, query_embeddings=query_embeddings, **options)
+
+    search_futures = [_federated_executor.submit(load_and_search, kb) for kb in knowledge_bases]
+    per_kb = []
+    for future in search_futures:
+        try:
+            per_kb.append(future.result())
+        except Exception as e:
+            per_kb.append(_failure(str(e), len(queries)))
+    return _merge_many(knowledge_bases, per_kb, len(queries), k, search_mode)
+
+
+async def asearch_many_federated(load: ManagerLoader, knowledge_bases: List[str], queries: List[str], k: int = 10,
+                                 search_mode: str = "hybrid", filters: Optional[Dict[str, Any]] = None,
+                                 score_threshold: float = 0.3, vector_weight: float = 0.7, keyword_weight: float = 0.3,
+                                 fusion: Optional[str] = None,
+                                 embedding_model: Optional[str] = None) -> List[Dict[str, Any]]:
+    """search_many_federated 的异步版本"""
+    knowledge_bases = list(dict.fromkeys(knowledge_bases))
+    if not queries:
+        return []
+    try:
+        options = _search_options(search_mode, k, filters, score_threshold, vector_weight, keyword_weight, fusion)
+    except Exception as e:
+        return _failure(str(e), len(queries))
+
+    async def no_embedding():
+        return None
+
+    async def load_and_search(kb: str, embedding_task: "asyncio.Future") -> List[Dict[str, Any]]:
+        try:
+            manager = await asyncio.to_thread(load, kb)
+            return await manager.asearch_many(queries, query_embeddings=await embedding_task, **options)
+        except Exception as e:
+            logging.warning(f"联合检索知识库 {kb} 失败: {str(e)}")
+            return _failure(str(e), len(queries))
+
+    embedding_task = asyncio.ensure_future(
+        get_local_embeddings(embedding_model).aembed_documents(queries)
+        if _needs_embedding(search_mode, vector_weight) else no_embedding()
+    )
+    try:
+        per_kb = await asyncio.gather(*(load_and_search(kb, embedding_task) for kb in knowledge_bases))
+        await embedding_task
+    except Exception as e:
+        return _failure(str(e), len(queries))
+    return _merge_many(knowledge_bases, per_kb, len(queries), k, search_mode)
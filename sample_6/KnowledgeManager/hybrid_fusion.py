@@ -0,0 +1,55 @@
+"""
+混合检索分数融合
+向量与关键词两路结果各自在候选内归一化后加权求和，或按倒数排名融合(RRF)合并
+"""
+
+from typing import List, Tuple, Dict, Any
+
+FUSION_METHODS = ("weighted", "rrf")
+
+
+def _normalize(hits: List[Tuple[int, float]]) -> Dict[int, float]:
+    """单路候选内的 min-max 归一化；只有一个候选或分数都相同时记为 1"""
+    if not hits:
+        return {}
+    scores = [score for _, score in hits]
+    low, high = min(scores), max(scores)
+    span = high - low
+    return {idx: (score - low) / span if span > 0 else 1.0 for idx, score in hits}
+
+
+def fuse_results(vector_hits: List[Tuple[int, float]], keyword_hits: List[Tuple[int, float]],
+                 k: int, vector_weight: float = 0.7, keyword_weight: float = 0.3,
+                 method: str = "weighted", rrf_k: int = 60) -> List[Tuple[int, float, Dict[str, Any]]]:
+    """融合向量与关键词两路结果（weighted 加权求和 / rrf 倒数排名融合），返回 [(片段编号, 融合分数, 分数明细)]"""
+    if method not in FUSION_METHODS:
+        raise ValueError(f"不支持的融合方式: {method}，可选: {FUSION_METHODS}")
+
+    total_weight = vector_weight + keyword_weight
+    if total_weight <= 0:
+        raise ValueError("vector_weight 与 keyword_weight 之和必须大于0")
+
+    details: Dict[int, Dict[str, Any]] = {}
+    for leg, hits in (("vector", vector_hits), ("keyword", keyword_hits)):
+        for rank, (idx, score) in enumerate(hits, start=1):
+            entry = details.setdefault(idx, {})
+            entry[f"{leg}_score"] = score
+            entry[f"{leg}_rank"] = rank
+
+    # 两路分数的量纲不同（余弦相似度 / BM25），加权前各自归一化
+    vector_norm, keyword_norm = _normalize(vector_hits), _normalize(keyword_hits)
+    fused = []
+    for idx, entry in details.items():
+        if method == "weighted":
+            score = (vector_weight * vector_norm.get(idx, 0.0) + keyword_weight * keyword_norm.get(idx, 0.0)) / total_weight
+        else:
+            score = 0.0
+            if "vector_rank" in entry:
+                score += vector_weight / (rrf_k + entry["vector_rank"])
+            if "keyword_rank" in entry:
+                score += keyword_weight / (rrf_k + entry["keyword_rank"])
+            score = score * (rrf_k + 1) / total_weight
+        fused.append((idx, score, entry))
+
+    fused.sort(key=lambda item: item[1], reverse=True)
+    return fused[:k]
@@ -0,0 +1,293 @@
+"""
+FAISS索引构建工具
+按 RAG_CONFIG["vector_store"]["faiss"]["index"] 创建 Flat / IVF-Flat / IVF-PQ / HNSW 索引
+"""
+
+import math
+import logging
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+import faiss  # pyright: ignore[reportMissingImports]
+import numpy as np  # pyright: ignore[reportMissingImports]
+
+from Config.model_config import RAG_CONFIG
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+VECTOR_ENCODINGS = ("fp32", "fp16", "sq8", "pq")
+
+DEFAULT_INDEX_CONFIG = {
+    "type": "flat",               # 目标索引类型
+    "encoding": "fp32",           # 默认向量编码，可在创建知识库时单独指定
+    "rescore_factor": 4,          # 压缩编码时召回 k * rescore_factor 个候选，再用全精度向量精确重排
+    "promote_threshold": 20000,   # Flat 索引向量数达到该值后自动升级为目标类型
+    "train_sample_size": 50000,   # 训练集蓄水池采样大小上限
+    "nlist": None,                # IVF 聚类中心数，None 时按 4*sqrt(N) 自动估算
+    "nprobe": 16,                 # IVF 默认检索的聚类数
+    "pq_m": 16,                   # PQ 子空间数
+    "pq_nbits": 8,                # PQ 每个子空间的编码位数
+    "hnsw_m": 32,                 # HNSW 每个节点的邻居数
+    "ef_construction": 200,       # HNSW 构建时的候选队列长度
+    "ef_search": 64,              # HNSW 默认检索时的候选队列长度
+    "compaction_threshold": 0.2,  # 索引中已删除向量占比超过该值时后台重建索引
+    "segment_rows": 10000,        # 未封存的尾部片段达到该数量时后台封存为新段
+    "merge_factor": 4,            # 末尾同一层级的段达到该数量时后台合并为一段
+    "verify_checksums": True,     # 加载时校验段文件的 SHA-256（关闭时只校验文件大小）
+}
+
+
+def get_index_config() -> Dict[str, Any]:
+    """读取索引规格配置并补全默认值"""
+    config = dict(DEFAULT_INDEX_CONFIG)
+    config.update(RAG_CONFIG["vector_store"]["faiss"].get("index", {}))
+    config["type"] = config["type"].lower()
+    if config["type"] not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {config['type']}，可选: {INDEX_TYPES}")
+    validate_encoding(config["encoding"])
+    return config
+
+
+def validate_encoding(encoding: str) -> str:
+    if encoding not in VECTOR_ENCODINGS:
+        raise ValueError(f"不支持的向量编码: {encoding}，可选: {VECTOR_ENCODINGS}")
+    return encoding
+
+
+def _nlist(config: Dict[str, Any], num_vectors: int) -> int:
+    if config.get("nlist"):
+        return int(config["nlist"])
+    return int(min(max(4 * math.sqrt(max(num_vectors, 1)), 16), 65536))
+
+
+def _pq_m(config: Dict[str, Any], dimension: int) -> int:
+    """PQ 子空间数必须整除维度，取不超过配置值的最大约数"""
+    m = min(int(config["pq_m"]), dimension)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def _effective_encoding(index_type: str, config: Dict[str, Any]) -> str:
+    return "pq" if index_type == "ivf_pq" else config.get("encoding", "fp32")
+
+
+def _encoding_component(encoding: str, dimension: int, config: Dict[str, Any]) -> str:
+    if encoding == "fp16":
+        return "SQfp16"
+    if encoding == "sq8":
+        return "SQ8"
+    if encoding == "pq":
+        return f"PQ{_pq_m(config, dimension)}x{config['pq_nbits']}"
+    return "Flat"
+
+
+def build_factory_string(index_type: str, dimension: int, num_vectors: int, config: Dict[str, Any]) -> str:
+    """生成 faiss.index_factory 规格字符串"""
+    encoding = _effective_encoding(index_type, config)
+    component = _encoding_component(encoding, dimension, config)
+    if index_type == "flat":
+        return component
+    if index_type == "hnsw":
+        return f"HNSW{config['hnsw_m']}" if encoding == "fp32" else f"HNSW{config['hnsw_m']}_{component}"
+    return f"IVF{_nlist(config, num_vectors)},{component}"
+
+
+def min_train_size(index_type: str, num_vectors: int, config: Dict[str, Any]) -> int:
+    """训练目标索引所需的最少向量数"""
+    encoding = _effective_encoding(index_type, config)
+    size = 0
+    if index_type in ("ivf_flat", "ivf_pq"):
+        size = _nlist(config, num_vectors)
+    if encoding == "pq":
+        size = max(size, 2 ** int(config["pq_nbits"]))
+    elif encoding == "sq8":
+        size = max(size, 1)
+    return size
+
+
+def unwrap_index(index: Any) -> Any:
+    """去掉 IndexIDMap 外壳，返回实际保存向量的索引"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def wrap_with_ids(index: Any) -> Any:
+    """用 IndexIDMap 包装空索引，外部 id 即片段编号"""
+    wrapped = faiss.IndexIDMap(index)
+    # 由外壳负责释放内层索引，避免 Python 侧先回收
+    index.this.disown()
+    wrapped.own_fields = True
+    return wrapped
+
+
+def new_staging_index(dimension: int) -> Any:
+    """知识库初始索引：全精度 IndexFlatIP"""
+    return wrap_with_ids(faiss.IndexFlatIP(dimension))
+
+
+def empty_like(index: Any) -> Any:
+    """复制索引结构与训练结果（IVF 聚类中心、PQ 码本等），不含向量，用于重建索引"""
+    inner = faiss.clone_index(unwrap_index(index))
+    inner.reset()
+    return wrap_with_ids(inner)
+
+
+def is_staging_index(index: Any) -> bool:
+    """是否为未升级的全精度 IndexFlat（知识库初始索引）"""
+    return type(unwrap_index(index)) in (faiss.IndexFlat, faiss.IndexFlatIP)
+
+
+def needs_promotion(index: Any, config: Dict[str, Any]) -> bool:
+    """当前为初始 Flat 索引，而配置的目标规格不是全精度 Flat 时需要升级"""
+    target_is_staging = config["type"] == "flat" and config.get("encoding", "fp32") == "fp32"
+    return is_staging_index(index) and not target_is_staging
+
+
+def create_index(index_type: str, dimension: int, num_vectors: int, config: Dict[str, Any]) -> Any:
+    """按规格创建空索引（内积度量，向量需事先 L2 归一化）"""
+    factory_string = build_factory_string(index_type, dimension, num_vectors, config)
+    index = faiss.index_factory(dimension, factory_string, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = int(config["ef_construction"])
+    logging.info(f"创建FAISS索引: {factory_string}, 维度: {dimension}")
+    return wrap_with_ids(index)
+
+
+def iter_index_vectors(index: Any, batch_size: int = 10000) -> Iterator[np.ndarray]:
+    """分批重建索引中的全部向量（按内部顺序，仅用于未包装的旧版索引），避免一次性物化"""
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+    for start in range(0, index.ntotal, batch_size):
+        yield index.reconstruct_n(start, min(batch_size, index.ntotal - start))
+
+
+def iter_id_vectors(index: Any, batch_size: int = 10000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """分批重建 IndexIDMap 中的 (外部 id, 向量)，压缩编码重建的是近似向量"""
+    inner = unwrap_index(index)
+    ids = faiss.vector_to_array(index.id_map)
+    try:
+        ivf = faiss.extract_index_ivf(inner)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        ivf.make_direct_map()
+    try:
+        for start in range(0, inner.ntotal, batch_size):
+            count = min(batch_size, inner.ntotal - start)
+            yield ids[start:start + count], inner.reconstruct_n(start, count)
+    finally:
+        if ivf is not None:
+            ivf.make_direct_map(False)
+
+
+def merge_into(target: Any, other: Any):
+    """把结构相同的 other 中的向量按外部 id 并入 target"""
+    inner = unwrap_index(target)
+    if isinstance(inner, (faiss.IndexFlat, faiss.IndexScalarQuantizer, faiss.IndexPQ)):
+        target.merge_from(other, 0)
+        return
+    for ids, vectors in iter_id_vectors(other):
+        target.add_with_ids(vectors, ids)
+
+
+def reservoir_sample(batches: Iterator[np.ndarray], sample_size: int, seed: int = 1234) -> np.ndarray:
+    """对分批到达的向量流做蓄水池采样，返回至多 sample_size 行"""
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    seen = 0
+    for batch in batches:
+        batch = np.asarray(batch, dtype=np.float32)
+        if reservoir is None:
+            reservoir = np.empty((sample_size, batch.shape[1]), dtype=np.float32)
+        fill = min(max(sample_size - seen, 0), len(batch))
+        reservoir[seen:seen + fill] = batch[:fill]
+        if fill < len(batch):
+            positions = np.arange(seen + fill, seen + len(batch))
+            slots = rng.integers(0, positions + 1)
+            keep = slots < sample_size
+            reservoir[slots[keep]] = batch[fill:][keep]
+        seen += len(batch)
+    if reservoir is None:
+        return np.empty((0, 0), dtype=np.float32)
+    return reservoir[:min(seen, sample_size)]
+
+
+def _code_holder(index: Any) -> Any:
+    """返回实际保存向量编码的索引对象"""
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.downcast_index(index.storage)
+    try:
+        return faiss.downcast_index(faiss.extract_index_ivf(index))
+    except RuntimeError:
+        return index
+
+
+def describe_encoding(index: Any) -> str:
+    """返回索引的向量编码名称"""
+    if index is None:
+        return "none"
+    holder = _code_holder(unwrap_index(index))
+    if isinstance(holder, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(holder, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if holder.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "fp32"
+
+
+def estimate_index_bytes(index: Any, config: Dict[str, Any]) -> int:
+    """估算索引常驻内存（向量编码 + 结构开销）"""
+    if index is None or index.ntotal == 0:
+        return 0
+    inner = unwrap_index(index)
+    holder = _code_holder(inner)
+    per_vector = holder.code_size
+    if isinstance(inner, faiss.IndexHNSW):
+        per_vector += int(config["hnsw_m"]) * 2 * 4
+    elif holder is not inner:
+        per_vector += 8
+    if inner is not index:
+        per_vector += 8
+    return int(per_vector * index.ntotal)
+
+
+def describe_index(index: Any) -> str:
+    """返回索引类型名称，用于统计展示"""
+    if index is None:
+        return "none"
+    index = unwrap_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        return "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+    return "flat"
+
+
+def supports_selector(index: Any) -> bool:
+    """索引是否支持通过 SearchParameters.sel 下推过滤（IndexPQ 不支持）"""
+    return not isinstance(unwrap_index(index), faiss.IndexPQ)
+
+
+def make_search_params(index: Any, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                       selector: Optional[Any] = None) -> Optional[Any]:
+    """构建单次查询的检索参数，不修改共享索引；Flat 索引且无 selector 时返回 None"""
+    config = get_index_config()
+    index_type = describe_index(index)
+    if index_type in ("ivf_flat", "ivf_pq"):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = int(nprobe or config["nprobe"])
+    elif index_type == "hnsw":
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = int(ef_search or config["ef_search"])
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
@@ -0,0 +1,68 @@
+"""
+检索快照
+已发布的只读索引视图，写入方构造新快照后整体替换，检索无需加锁
+"""
+
+from typing import Any, Optional, Tuple
+
+import numpy as np  # pyright: ignore[reportMissingImports]
+
+from KnowledgeManager.bm25_index import BM25Index
+
+
+class IndexSnapshot:
+    """不可变快照；用 replace 派生新快照"""
+
+    __slots__ = ("template", "segments", "bm25_segments", "sealed_rows", "rows", "bm25_tail",
+                 "tombstones", "deleted_count", "_live")
+
+    def __init__(self, template: Any, segments: Tuple[Any, ...], bm25_segments: Tuple[Tuple[int, BM25Index], ...],
+                 sealed_rows: int, rows: int, bm25_tail: BM25Index, tombstones: np.ndarray):
+        """segments 覆盖片段编号 [0, sealed_rows)，尾部片段 [sealed_rows, rows) 只在 bm25_tail 与全精度向量中"""
+        self.template = template
+        self.segments = tuple(segments)
+        self.bm25_segments = tuple(bm25_segments)
+        self.sealed_rows = sealed_rows
+        self.rows = rows
+        self.bm25_tail = bm25_tail
+        self.tombstones = tombstones
+        self.deleted_count = int(tombstones.sum())
+        self._live: Optional[np.ndarray] = None
+
+    @classmethod
+    def empty(cls, template: Any, rows: int = 0) -> "IndexSnapshot":
+        """空索引；已有的 rows 个片段（无法加载其向量）全部标记为删除"""
+        bm25_tail = BM25Index()
+        if rows:
+            bm25_tail.add_documents([""] * rows)
+        return cls(template, (), (), 0, rows, bm25_tail, np.ones(rows, dtype=bool))
+
+    def replace(self, **changes: Any) -> "IndexSnapshot":
+        values = {name: getattr(self, name) for name in
+                  ("template", "segments", "bm25_segments", "sealed_rows", "rows", "bm25_tail", "tombstones")}
+        values.update(changes)
+        return IndexSnapshot(**values)
+
+    @property
+    def dimension(self) -> int:
+        return self.template.d
+
+    @property
+    def ntotal(self) -> int:
+        """参与向量检索的向量数：各段中的向量 + 尾部片段（含已删除、尚未压缩清除的）"""
+        return sum(segment.ntotal for segment in self.segments) + (self.rows - self.sealed_rows)
+
+    @property
+    def bm25_parts(self) -> Tuple[Tuple[int, BM25Index], ...]:
+        return self.bm25_segments + ((self.sealed_rows, self.bm25_tail),)
+
+    def is_deleted(self, idx: int) -> bool:
+        return idx < len(self.tombstones) and bool(self.tombstones[idx])
+
+    def live_mask(self) -> np.ndarray:
+        """未删除片段位图；按需计算并缓存（并发计算多次结果相同，无需加锁）"""
+        live = self._live
+        if live is None:
+            live = ~self.tombstones
+            self._live = live
+        return live
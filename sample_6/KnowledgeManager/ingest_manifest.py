@@ -0,0 +1,91 @@
+"""
+入库清单
+按来源记录已入库文件的内容哈希与切分设置，重复入库时跳过未变化的文件
+"""
+
+import os
+import json
+import time
+import fnmatch
+import hashlib
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(file_path: str, block_size: int = 1 << 20) -> str:
+    """分块计算文件内容的 SHA-256，不读入整个文件"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def settings_fingerprint(settings: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(settings, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class IngestManifest:
+    """以来源（文件路径或上传时的原始文件名）为键的入库记录"""
+
+    def __init__(self, file_path: Path):
+        self.file_path = Path(file_path)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if self.file_path.exists():
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self.files = json.load(f).get("files", {})
+
+    def current_hash(self, source: str, fingerprint: str) -> Optional[str]:
+        """该来源按相同设置入库时的内容哈希，未入库或设置变化时为 None"""
+        entry = self.files.get(source)
+        return entry["hash"] if entry is not None and entry["settings"] == fingerprint else None
+
+    def record(self, source: str, content_hash: str, fingerprint: str, filename: str, chunks: int,
+               duplicates: int = 0, duplicate_of: Optional[List[str]] = None):
+        self.files[source] = {
+            "hash": content_hash,
+            "settings": fingerprint,
+            "filename": filename,
+            "chunks": chunks,
+            "ingested_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        if duplicates:
+            self.files[source]["duplicates"] = duplicates
+        if duplicate_of:
+            self.files[source]["duplicate_of"] = duplicate_of
+
+    def remove_linked(self, sources: List[str]) -> List[str]:
+        """删除重复片段链接到 sources 中任一来源的记录，返回被删除的来源"""
+        targets = set(sources)
+        removed = [source for source, entry in self.files.items()
+                   if source not in targets and targets.intersection(entry.get("duplicate_of", ()))]
+        for source in removed:
+            del self.files[source]
+        return removed
+
+    def remove_matching(self, pattern: str) -> List[str]:
+        """删除来源或文件名匹配 pattern 的记录，返回被删除的来源"""
+        removed = [source for source, entry in self.files.items()
+                   if any(value == pattern or fnmatch.fnmatchcase(value, pattern)
+                          for value in (source, entry.get("filename", "")))]
+        for source in removed:
+            del self.files[source]
+        return removed
+
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        return self.files.get(source)
+
+    def save(self):
+        """原子写入清单文件"""
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(f"{self.file_path}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.file_path)
+
+    def clear(self):
+        self.files = {}
+        if self.file_path.exists():
+            self.file_path.unlink()
@@ -0,0 +1,107 @@
+"""
+流式入库流水线
+解析切分、向量化、写入三个阶段以有界队列连接，入库游标记录已提交的位置
+
+配置 RAG_CONFIG["ingestion"]: batch_chunks（默认 512）、queue_size（默认 4）
+"""
+
+import os
+import json
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+CURSOR_VERSION = 1
+_DONE = object()
+
+
+class _Failure:
+    """后台线程中抛出的异常，转交给消费方重新抛出"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def background(iterable: Iterable[Any], queue_size: int, name: str = "ingest_stage") -> Iterator[Any]:
+    """在后台线程中迭代 iterable，经有界队列逐个产出；上游异常在消费方抛出，消费方退出时停止上游"""
+    items: "queue.Queue[Any]" = queue.Queue(maxsize=max(queue_size, 1))
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    break
+            else:
+                put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    worker = threading.Thread(target=run, name=name, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+class IngestCursor:
+    """入库任务的进度游标；同一知识库同时只记录一个未完成的任务"""
+
+    def __init__(self, file_path: Path, key: str, fingerprint: str):
+        self.file_path = Path(file_path)
+        self.key = key
+        self.fingerprint = fingerprint
+        self.last_source: Optional[str] = None
+        self.stats: Dict[str, Any] = {}
+        if self.file_path.exists():
+            try:
+                with open(self.file_path, 'r', encoding='utf-8') as f:
+                    cursor = json.load(f)
+            except (OSError, ValueError):
+                cursor = {}
+            # 任务不同或设置变化时从头开始（已入库且未变化的文件仍按入库清单跳过）
+            if (cursor.get("version") == CURSOR_VERSION and cursor.get("key") == key
+                    and cursor.get("settings") == fingerprint):
+                self.last_source = cursor.get("last_source")
+                self.stats = cursor.get("stats", {})
+
+    def is_done(self, source: str) -> bool:
+        """按来源排序处理时，该来源在上次中断前已提交"""
+        return self.last_source is not None and source <= self.last_source
+
+    def advance(self, last_source: str, stats: Dict[str, Any]):
+        """原子写入已提交的位置"""
+        self.last_source = last_source
+        self.stats = stats
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(f"{self.file_path}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": CURSOR_VERSION, "key": self.key, "settings": self.fingerprint,
+                       "last_source": last_source, "stats": stats}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.file_path)
+
+    def finish(self):
+        if self.file_path.exists():
+            self.file_path.unlink()
@@ -1,14 +1,20 @@
 import logging
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Any, Iterable, Iterator, Tuple
 import docx
 import pypdf
 import re
 from bs4 import BeautifulSoup
 
+from KnowledgeManager.extraction_cache import get_extraction_cache
+from KnowledgeManager.ingest_manifest import file_sha256
+
 class KnowledgeExtractor:
     """文档知识提取器 (迁移自 report-26v0)"""
     
+    # 解析逻辑（含各 _extract_* 与空行规整）变化时递增，使解析结果缓存失效
+    VERSION = 2
+    
     def __init__(self):
         self.supported_formats = {
             '.txt': self._extract_txt,
@@ -20,36 +26,67 @@ class KnowledgeExtractor:
             '.htm': self._extract_html
         }
     
-    def extract_from_folder(self, folder_path: str) -> List[Dict[str, str]]:
-        documents = []
+    def extract_from_folder(self, folder_path: str, splitter: Any = None) -> List[Dict[str, str]]:
         folder_path = Path(folder_path)
         if not folder_path.exists():
-            return documents
-        for file_path in folder_path.rglob('*'):
-            if file_path.is_file():
-                doc = self.extract_from_file(str(file_path))
-                if doc: documents.append(doc)
-        return documents
+            return []
+        file_paths = [str(file_path) for file_path in folder_path.rglob('*')
+                      if file_path.is_file() and file_path.suffix.lower() in self.supported_formats]
+        return list(self.extract_many(file_paths, splitter))
+    
+    def extract_many(self, file_paths: Iterable[str], splitter: Any = None, workers: Optional[int] = None,
+                     timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """在解析进程池中并行解析（给定 splitter 时同时切分），按完成顺序产出文档"""
+        from KnowledgeManager.extraction_pool import ExtractionPool
+        
+        with ExtractionPool(splitter, workers, timeout) as pool:
+            for file_path, result in pool.imap((path, {"file_path": path}) for path in file_paths):
+                if result["document"]:
+                    yield result["document"]
+                elif result["error"]:
+                    logging.error(f"提取文件 {file_path} 失败: {result['error']}")
     
-    def extract_from_file(self, file_path: str) -> Optional[Dict[str, str]]:
+    def extract_from_file(self, file_path: str, content_hash: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """解析单个文件；PDF/DOCX/HTML 的解析结果按内容哈希缓存"""
         file_path = Path(file_path)
         if not file_path.exists(): return None
         file_ext = file_path.suffix.lower()
         if file_ext not in self.supported_formats: return None
         try:
-            content = self.supported_formats[file_ext](file_path)
-            content = re.sub(r'\n{2,}', '\n\n', content)
-            if content:
+            cache = get_extraction_cache()
+            if cache is not None and not cache.accepts(file_ext):
+                cache = None
+            extracted = None
+            if cache is not None:
+                content_hash = content_hash or file_sha256(str(file_path))
+                extracted = cache.get(content_hash, file_ext, self.VERSION)
+            if extracted is None:
+                if file_ext == '.pdf':
+                    extracted = self._extract_pdf_pages(file_path)
+                else:
+                    extracted = {"content": re.sub(r'\n{2,}', '\n\n', self.supported_formats[file_ext](file_path))}
+                if cache is not None and extracted["content"]:
+                    cache.put(content_hash, file_ext, self.VERSION, extracted)
+            if extracted["content"]:
                 return {
-                    "content": content,
+                    "content": extracted["content"],
                     "source": str(file_path),
                     "filename": file_path.name,
-                    "format": file_ext
+                    "format": file_ext,
+                    **({"pages": extracted["pages"]} if "pages" in extracted else {})
                 }
         except Exception as e:
             logging.error(f"提取文件 {file_path} 时出错: {e}")
         return None
     
+    def iter_pages(self, document: Dict[str, Any]) -> Iterator[Tuple[int, str]]:
+        """按页产出已解析文档的 (页码, 页面文本)；没有分页信息的文档整体作为第 1 页"""
+        content = document["content"]
+        pages = document.get("pages") or [[1, 0]]
+        for i, (page_number, start) in enumerate(pages):
+            end = pages[i + 1][1] if i + 1 < len(pages) else len(content)
+            yield page_number, content[start:end]
+    
     def _extract_txt(self, file_path: Path) -> str:
         try:
             with open(file_path, 'r', encoding='utf-8') as f: return f.read()
@@ -59,13 +96,25 @@ class KnowledgeExtractor:
     def _extract_markdown(self, file_path: Path) -> str:
         with open(file_path, 'r', encoding='utf-8') as f: return f.read()
     
-    def _extract_pdf(self, file_path: Path) -> str:
-        text = ""
+    def iter_pdf_pages(self, file_path: Path) -> Iterator[Tuple[int, str]]:
+        """逐页解析 PDF，产出 (页码, 页面文本)，页码从 1 开始"""
         with open(file_path, 'rb') as f:
             pdf_reader = pypdf.PdfReader(f)
-            for page in pdf_reader.pages:
-                text += (page.extract_text() or "") + "\n"
-        return text
+            for page_number, page in enumerate(pdf_reader.pages, 1):
+                yield page_number, page.extract_text() or ""
+    
+    def _extract_pdf(self, file_path: Path) -> str:
+        return "".join(text + "\n" for _, text in self.iter_pdf_pages(file_path))
+    
+    def _extract_pdf_pages(self, file_path: Path) -> Dict[str, Any]:
+        """逐页解析 PDF，返回 {"content", "pages": [[页码, 起点], ...]}"""
+        parts, pages, offset = [], [], 0
+        for page_number, text in self.iter_pdf_pages(file_path):
+            text = re.sub(r'\n{2,}', '\n\n', text + "\n")
+            pages.append([page_number, offset])
+            parts.append(text)
+            offset += len(text)
+        return {"content": "".join(parts), "pages": pages}
     
     def _extract_docx(self, file_path: Path) -> str:
         doc = docx.Document(file_path)
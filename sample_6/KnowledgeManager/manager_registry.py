@@ -0,0 +1,100 @@
+"""
+知识管理器注册表
+进程内缓存已加载的管理器，磁盘变化时重新加载，超出内存预算时淘汰空闲实例
+
+配置 RAG_CONFIG["vector_store"]["registry"]: memory_budget_mb（默认 2048）
+"""
+
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Tuple
+
+from Config.model_config import RAG_CONFIG
+from KnowledgeManager.BaseKnowledgeManager import BaseKnowledgeManager
+
+RegistryKey = Tuple[str, str]
+
+
+class KnowledgeManagerRegistry:
+    """线程安全；同一知识库的加载串行执行，不同知识库可并行加载"""
+
+    def __init__(self, memory_budget_bytes: int):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._managers: "OrderedDict[RegistryKey, BaseKnowledgeManager]" = OrderedDict()
+        # 已淘汰但仍被调用方持有的实例，再次请求时继续使用，同一知识库不会同时存在两个写入者
+        self._retired: "weakref.WeakValueDictionary[RegistryKey, BaseKnowledgeManager]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[RegistryKey, threading.Lock] = {}
+        self.counters = {"hits": 0, "loads": 0, "reloads": 0, "evictions": 0}
+
+    def get(self, key: RegistryKey, build: Callable[[], BaseKnowledgeManager]) -> BaseKnowledgeManager:
+        """返回已加载的管理器；不存在或磁盘已变化时调用 build 创建并初始化"""
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                manager = self._managers.get(key)
+                if manager is None:
+                    manager = self._retired.pop(key, None)
+                    if manager is not None:
+                        self._managers[key] = manager
+                if manager is not None:
+                    self._managers.move_to_end(key)
+            if manager is not None and manager.is_stale():
+                logging.info(f"知识库 {key[0]} 已在磁盘上更新，重新加载")
+                with self._lock:
+                    self.counters["reloads"] += 1
+                manager = None
+            if manager is None:
+                # 正在使用旧实例的检索不受影响，新请求拿到重新加载的实例
+                manager = build()
+                manager.initialize()
+                with self._lock:
+                    self._managers[key] = manager
+                    self.counters["loads"] += 1
+            else:
+                with self._lock:
+                    self.counters["hits"] += 1
+        self._evict(keep=key)
+        return manager
+
+    def invalidate(self, knowledge_base_name: str):
+        """移除某个知识库的所有实例（删除知识库时调用）"""
+        with self._lock:
+            for key in [key for key in self._managers if key[0] == knowledge_base_name]:
+                del self._managers[key]
+            for key in [key for key in list(self._retired.keys()) if key[0] == knowledge_base_name]:
+                self._retired.pop(key, None)
+
+    def _evict(self, keep: RegistryKey):
+        """按最近最少使用淘汰空闲的实例；正在写入或后台维护的实例不淘汰"""
+        with self._lock:
+            sizes = {key: manager.memory_bytes() for key, manager in self._managers.items()}
+            total = sum(sizes.values())
+            for key in list(self._managers):
+                if total <= self.memory_budget_bytes:
+                    break
+                manager = self._managers[key]
+                if key == keep or manager.is_busy():
+                    continue
+                del self._managers[key]
+                self._retired[key] = manager
+                total -= sizes[key]
+                self.counters["evictions"] += 1
+                logging.info(f"内存预算不足，卸载知识库 {key[0]}（{sizes[key] / 2 ** 20:.1f} MB）")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.counters,
+                "loaded": [key[0] for key in self._managers],
+                "memory_mb": round(sum(m.memory_bytes() for m in self._managers.values()) / 2 ** 20, 2),
+                "memory_budget_mb": round(self.memory_budget_bytes / 2 ** 20, 2)
+            }
+
+
+def create_registry() -> KnowledgeManagerRegistry:
+    config = RAG_CONFIG.get("vector_store", {}).get("registry", {})
+    return KnowledgeManagerRegistry(int(config.get("memory_budget_mb", 2048)) * 2 ** 20)
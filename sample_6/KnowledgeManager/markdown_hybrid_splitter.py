@@ -3,32 +3,38 @@
 结合Markdown标题分割和递归字符分割的优势
 """
 
-from typing import List, Tuple
-import logging
-from KnowledgeManager.Dependencies.compat import get_langchain_text_splitter
+from typing import Callable, Iterator, List, Optional, Tuple
 
-RecursiveCharacterTextSplitter = get_langchain_text_splitter('RecursiveCharacterTextSplitter')
-MarkdownHeaderTextSplitter = get_langchain_text_splitter('MarkdownHeaderTextSplitter')
+# (起点, 终点, 标题路径)
+Span = Tuple[int, int, Tuple[str, ...]]
+# 某一位置所在的各级标题 ((级别, 标题), ...)，从外到内
+Outline = Tuple[Tuple[int, str], ...]
+
+_WHITESPACE = " \t\r\n\f\v"
 
 
 class MarkdownHybridSplitter:
     """混合Markdown文本分割器"""
-    
+
     def __init__(
         self,
         chunk_size: int = 1000,
         chunk_overlap: int = 50,
         min_chunk_size: int = 200,
         headers_to_split_on: List[Tuple[str, str]] = None,
+        separators: Optional[List[str]] = None,
+        length_function: Optional[Callable[[str], int]] = None,
     ):
         """
         初始化混合文本分割器
-        
+
         Args:
             chunk_size: 每个文本块的目标大小
             chunk_overlap: 文本块之间的重叠大小
             min_chunk_size: 最小文本块大小，小于该大小的块将被合并
             headers_to_split_on: 标题分割规则，格式为[("#", "Header 1"), ("##", "Header 2"), ...]
+            separators: 超长章节递归切分时依次尝试的分隔符，分隔符保留在前一块末尾
+            length_function: 文本长度函数，默认按字符数；应为单调的（文本越长结果不减小），且对重复文本有缓存
         """
         # 默认标题分割规则
         if headers_to_split_on is None:
@@ -37,202 +43,212 @@ class MarkdownHybridSplitter:
                 ("##", "Header 2"),
                 ("###", "Header 3"),
             ]
-        
+
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         if min_chunk_size > chunk_size:
             min_chunk_size = chunk_size // 5
         self.min_chunk_size = min_chunk_size
-        
-        # 初始化分割器，设置strip_headers=False以保留标题在内容中
-        self.markdown_splitter = MarkdownHeaderTextSplitter(
-            headers_to_split_on=headers_to_split_on,
-            strip_headers=False
-        )
-        self.recursive_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", "。", "！", "？", "；", "，", ""]
-        )
-    
+        # 参与分割的标题级别（# 的个数）
+        self.header_levels = {len(marker) for marker, _ in headers_to_split_on}
+        self.separators = separators or ["\n\n", "\n", "。", "！", "？", "；", "，", ""]
+        self.length_function = length_function
+
+    def _size(self, text: str, start: int, end: int) -> int:
+        """text[start:end] 的长度"""
+        if self.length_function is None:
+            return end - start
+        return self.length_function(text[start:end])
+
+    def _fit(self, text: str, start: int, end: int, limit: int) -> int:
+        """最大的 e 使 text[start:e] 的长度不超过 limit，至少为 start + 1"""
+        if self.length_function is None:
+            return min(start + max(limit, 1), end)
+        low, high = start + 1, end
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._size(text, start, middle) <= limit:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _fit_back(self, text: str, start: int, end: int, limit: int) -> int:
+        """最小的 s 使 text[s:end] 的长度不超过 limit"""
+        if self.length_function is None:
+            return max(end - limit, start + 1)
+        low, high = start + 1, end
+        while low < high:
+            middle = (low + high) // 2
+            if self._size(text, middle, end) <= limit:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
     def split_text(self, text: str) -> List[str]:
         """
         使用混合策略分割文本
-        
+
         Args:
             text: 待分割的Markdown文本
-            
+
         Returns:
             分割后的文本块列表
         """
-        # 检查输入是否为空
+        return [text[start:end] for start, end, _ in self.split_spans(text)]
+
+    def split_spans(self, text: str, outline: Outline = ()) -> List[Span]:
+        """分割文本，返回每个片段的 (起点, 终点, 标题路径)"""
         if not text or not text.strip():
             return []
-        
-        # 检查是否看起来像Markdown格式（包含Markdown标题标记）
-        if not self._looks_like_markdown(text):
-            # 对于非Markdown文本，直接使用递归字符分割器
-            return self.recursive_splitter.split_text(text)
-        
-        # 检查是否包含连续的标题（没有内容的标题）
-        if self._has_consecutive_headers_without_content(text):
-            # 对于这种特殊情况，使用递归字符分割器以避免丢失标题
-            return self.recursive_splitter.split_text(text)
-        
-        # 第一步：使用Markdown标题分割器按标题分割
-        try:
-            markdown_splits = self.markdown_splitter.split_text(text)
-        except Exception as e:
-            logging.warning(f"Markdown分割器处理失败，回退到递归字符分割器: {e}")
-            return self.recursive_splitter.split_text(text)
-        
-        # 第二步：处理每个标题分割块
-        processed_chunks = []
-        i = 0
-        while i < len(markdown_splits):
-            # 获取分割块的内容（标题已经包含在内容中）
-            split_doc = markdown_splits[i]
-            split_content = split_doc.page_content if hasattr(split_doc, 'page_content') else str(split_doc)
-            # 注意：由于strip_headers=False，标题已经包含在split_content中，不需要额外处理
-            
-            # 特殊处理：如果内容为空但有标题元数据（理论上不应该发生，因为strip_headers=False）
-            split_metadata = getattr(split_doc, 'metadata', {})
-            if not split_content.strip() and split_metadata:
-                # 即使内容为空，也要添加标题块
-                if split_content.strip():  # 确保标题块不为空
-                    processed_chunks.append(split_content)
-                i += 1
-                continue
-            
-            # 如果块太小，需要合并处理
-            if len(split_content) < self.min_chunk_size:
-                # 检查是否可以向后合并（与下一个块合并）
-                if i + 1 < len(markdown_splits):
-                    next_doc = markdown_splits[i + 1]
-                    next_content = next_doc.page_content if hasattr(next_doc, 'page_content') else str(next_doc)
-                    
-                    if len(split_content) + len(next_content) <= self.chunk_size:
-                        # 向后合并
-                        merged_chunk = split_content + "\n\n" + next_content
-                        processed_chunks.append(merged_chunk)
-                        i += 2  # 跳过已合并的下一个块
-                        continue
-                # 检查是否可以向前合并（与前一个块合并）
-                if processed_chunks and len(split_content) + len(processed_chunks[-1]) <= self.chunk_size:
-                    # 向前合并
-                    processed_chunks[-1] += "\n\n" + split_content
-                    i += 1
-                    continue
-                else:
-                    # 无法合并，单独添加
-                    processed_chunks.append(split_content)
-                    i += 1
-            # 如果块大小合适，直接添加
-            elif len(split_content) <= self.chunk_size:
-                processed_chunks.append(split_content)
-                i += 1
-            # 如果块太大，使用递归字符分割器进一步分割
+
+        pieces: List[Span] = []
+        for start, end, headings in self._sections(text, outline):
+            if self._size(text, start, end) <= self.chunk_size:
+                pieces.append((start, end, headings))
             else:
-                recursive_splits = self.recursive_splitter.split_text(split_content)
-                processed_chunks.extend(recursive_splits)
+                pieces.extend((s, e, headings) for s, e in self._split_recursive(text, start, end, 0))
+
+        trimmed = []
+        for start, end, headings in pieces:
+            while start < end and text[start] in _WHITESPACE:
+                start += 1
+            while end > start and text[end - 1] in _WHITESPACE:
+                end -= 1
+            if end > start:
+                trimmed.append((start, end, headings))
+        return self._merge_small_chunks(text, trimmed)
+
+    def outline_at(self, text: str, pos: int, outline: Outline = ()) -> Outline:
+        """text 中 pos 处所在的各级标题"""
+        for heading_pos, level, title in self._headings(text):
+            if heading_pos >= pos:
+                break
+            outline = tuple(item for item in outline if item[0] < level) + ((level, title),)
+        return outline
+
+    def _headings(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """逐行扫描，产出参与分割的标题行 (行起点, 级别, 标题)；代码块内的 # 不算标题"""
+        fence = None
+        pos = 0
+        length = len(text)
+        while pos < length:
+            line_end = text.find("\n", pos)
+            if line_end < 0:
+                line_end = length
+            i = pos
+            while i < line_end and text[i] in " \t":
                 i += 1
-        
-        # 第三步：后处理，确保没有过小的块（除了最后一个）
-        final_chunks = self._merge_small_chunks(processed_chunks)
-        return final_chunks
-    
-    def _has_consecutive_headers_without_content(self, text: str) -> bool:
-        """
-        检查文本是否包含连续的标题而中间没有足够的内容
-        
-        Args:
-            text: 要检查的文本
-            
-        Returns:
-            如果包含连续标题则返回True，否则返回False
-        """
-        lines = text.split('\n')
-        header_count = 0
-        content_lines = 0
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith('##') or line.startswith('#'):
-                header_count += 1
-            elif line:  # 非空行且不是标题
-                content_lines += 1
-                
-            # 如果有多个标题但内容很少，可能是连续标题的情况
-            if header_count >= 2 and content_lines < header_count:
-                return True
-                
-        return False
-    
-    def _looks_like_markdown(self, text: str) -> bool:
-        """
-        简单检查文本是否看起来像Markdown格式
-        
-        Args:
-            text: 要检查的文本
-            
-        Returns:
-            如果文本看起来像Markdown格式则返回True，否则返回False
-        """
-        # 检查是否包含常见的Markdown标记
-        markdown_indicators = ['# ', '## ', '### ', '**', '*', '`', '```', '>', '[', '](', '![', '![](']
-        text_lower = text.lower()
-        
-        # 如果包含至少两个Markdown指示符，则认为是Markdown格式
-        indicator_count = sum(1 for indicator in markdown_indicators if indicator in text_lower)
-        return indicator_count >= 2
-    
-    def _merge_small_chunks(self, chunks: List[str]) -> List[str]:
-        """
-        合并过小的文本块
-        
-        Args:
-            chunks: 待处理的文本块列表
-            
-        Returns:
-            处理后的文本块列表
-        """
+            if text.startswith(("```", "~~~"), i):
+                marker = text[i:i + 3]
+                if fence is None:
+                    fence = marker
+                elif marker == fence:
+                    fence = None
+            elif fence is None and i - pos < 4 and text.startswith("#", i):
+                j = i
+                while j < line_end and text[j] == "#":
+                    j += 1
+                level = j - i
+                if level in self.header_levels and (j == line_end or text[j] in " \t"):
+                    yield pos, level, text[j:line_end].strip(" \t\r#")
+            pos = line_end + 1
+
+    def _sections(self, text: str, outline: Outline = ()) -> List[Span]:
+        """在每个参与分割的标题行处开始新章节（标题保留在章节内容中）"""
+        sections = []
+        current = tuple(title for _, title in outline)
+        section_start = 0
+        for pos, level, title in self._headings(text):
+            if pos > section_start:
+                sections.append((section_start, pos, current))
+            section_start = pos
+            outline = tuple(item for item in outline if item[0] < level) + ((level, title),)
+            current = tuple(title for _, title in outline)
+        sections.append((section_start, len(text), current))
+        return sections
+
+    def _split_recursive(self, text: str, start: int, end: int, level: int) -> List[Tuple[int, int]]:
+        """按第一个出现在 [start, end) 中的分隔符切分，仍超长的部分用后续分隔符继续切分"""
+        while level < len(self.separators) - 1 and text.find(self.separators[level], start, end) < 0:
+            level += 1
+        separator = self.separators[level]
+        if not separator:
+            # 没有可用的分隔符：按固定长度切分，相邻块重叠 chunk_overlap
+            windows = []
+            window_start = start
+            while True:
+                window_end = self._fit(text, window_start, end, self.chunk_size)
+                windows.append((window_start, window_end))
+                if window_end >= end:
+                    return windows
+                window_start = self._fit_back(text, window_start, window_end, self.chunk_overlap)
+
+        pieces = []
+        pos = start
+        while pos < end:
+            found = text.find(separator, pos, end)
+            cut = end if found < 0 else found + len(separator)
+            pieces.append((pos, cut))
+            pos = cut
+
+        chunks = []
+        fitting = []
+        for piece_start, piece_end in pieces:
+            if self._size(text, piece_start, piece_end) <= self.chunk_size:
+                fitting.append((piece_start, piece_end))
+                continue
+            if fitting:
+                chunks.extend(self._merge_pieces(text, fitting))
+                fitting = []
+            chunks.extend(self._split_recursive(text, piece_start, piece_end, level + 1))
+        if fitting:
+            chunks.extend(self._merge_pieces(text, fitting))
+        return chunks
+
+    def _merge_pieces(self, text: str, pieces: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """把相邻的小段装入不超过 chunk_size 的块，保留重叠"""
+        chunks = []
+        first = 0
+        for j in range(1, len(pieces)):
+            if self._size(text, pieces[first][0], pieces[j][1]) <= self.chunk_size:
+                continue
+            chunks.append((pieces[first][0], pieces[j - 1][1]))
+            k = j
+            while (k - 1 > first and self._size(text, pieces[k - 1][0], pieces[j - 1][1]) <= self.chunk_overlap
+                   and self._size(text, pieces[k - 1][0], pieces[j][1]) <= self.chunk_size):
+                k -= 1
+            first = k
+        chunks.append((pieces[first][0], pieces[-1][1]))
+        return chunks
+
+    def _merge_small_chunks(self, text: str, chunks: List[Span]) -> List[Span]:
+        """合并过小的文本块，优先与下一块合并"""
         if len(chunks) <= 1:
             return chunks
-            
-        merged_chunks = []
+
+        merged_chunks: List[Span] = []
         i = 0
-        
         while i < len(chunks):
-            current_chunk = chunks[i]
-            
-            # 如果当前块太小，尝试合并
-            if len(current_chunk) < self.min_chunk_size:
-                # 优先向后合并（与下一个块合并）
-                if i + 1 < len(chunks) and len(current_chunk) + len(chunks[i + 1]) <= self.chunk_size:
-                    merged_chunk = current_chunk + "\n\n" + chunks[i + 1]
-                    merged_chunks.append(merged_chunk)
-                    i += 2  # 跳过已合并的下一个块
+            start, end, headings = chunks[i]
+            if self._size(text, start, end) < self.min_chunk_size:
+                if i + 1 < len(chunks) and self._size(text, start, chunks[i + 1][1]) <= self.chunk_size:
+                    merged_chunks.append((start, chunks[i + 1][1], headings))
+                    i += 2
                     continue
-                # 向前合并（与前一个块合并）
-                elif merged_chunks and len(current_chunk) + len(merged_chunks[-1]) <= self.chunk_size:
-                    merged_chunks[-1] += "\n\n" + current_chunk
+                if merged_chunks and self._size(text, merged_chunks[-1][0], end) <= self.chunk_size:
+                    merged_chunks[-1] = (merged_chunks[-1][0], end, merged_chunks[-1][2])
                     i += 1
                     continue
-                else:
-                    # 无法合并，单独添加
-                    merged_chunks.append(current_chunk)
-                    i += 1
-            else:
-                # 当前块大小合适，直接添加
-                merged_chunks.append(current_chunk)
-                i += 1
-        
+            merged_chunks.append((start, end, headings))
+            i += 1
+
         # 检查最后一个块是否太小，如果是且可以向前合并，则合并
-        if len(merged_chunks) > 1 and len(merged_chunks[-1]) < self.min_chunk_size:
-            if len(merged_chunks[-1]) + len(merged_chunks[-2]) <= self.chunk_size:
-                # 合并最后两个块
-                last_chunk = merged_chunks.pop()
-                merged_chunks[-1] += "\n\n" + last_chunk
-            
+        if len(merged_chunks) > 1:
+            start, end, _ = merged_chunks[-1]
+            if (self._size(text, start, end) < self.min_chunk_size
+                    and self._size(text, merged_chunks[-2][0], end) <= self.chunk_size):
+                merged_chunks.pop()
+                merged_chunks[-1] = (merged_chunks[-1][0], end, merged_chunks[-1][2])
         return merged_chunks
@@ -0,0 +1,89 @@
+"""
+元数据过滤索引
+在片段存储的编码列上计算过滤位图并转为 FAISS IDSelector
+
+filters 格式：{字段名: 取值 或 取值列表}，字段之间为"与"，取值之间为"或"，列表字段（如 tags）有交集即命中
+"""
+
+import json
+import fnmatch
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+import faiss  # pyright: ignore[reportMissingImports]
+import numpy as np  # pyright: ignore[reportMissingImports]
+
+from KnowledgeManager.chunk_store import ChunkStore
+
+
+def _normalize_filters(filters: Dict[str, Any]) -> Tuple:
+    """把 filters 规范化为可哈希的缓存键"""
+    items = []
+    for key, wanted in sorted(filters.items()):
+        if not isinstance(wanted, (list, tuple, set)):
+            wanted = [wanted]
+        items.append((key, tuple(sorted(json.dumps(w, ensure_ascii=False, sort_keys=True) for w in wanted))))
+    return tuple(items)
+
+
+def _value_matches(value: Any, wanted_keys: Tuple[str, ...]) -> bool:
+    if isinstance(value, list):
+        return any(json.dumps(v, ensure_ascii=False, sort_keys=True) in wanted_keys for v in value)
+    return json.dumps(value, ensure_ascii=False, sort_keys=True) in wanted_keys
+
+
+class MetadataIndex:
+    """在片段存储的编码列上求过滤位图，并按片段数缓存最近使用的过滤条件"""
+
+    def __init__(self, chunk_store: ChunkStore, cache_size: int = 32):
+        self.chunk_store = chunk_store
+        self.cache_size = cache_size
+        self._cache: Dict[Tuple, Tuple[int, np.ndarray]] = {}
+        # 检索并发调用，缓存的增删需互斥
+        self._cache_lock = threading.Lock()
+
+    def build_mask(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """计算过滤位图，filters 为空时返回 None"""
+        if not filters:
+            return None
+        cache_key = _normalize_filters(filters)
+        count = len(self.chunk_store)
+        cached = self._cache.get(cache_key)
+        if cached is not None and cached[0] == count:
+            return cached[1]
+
+        mask = np.ones(count, dtype=bool)
+        for key, wanted_keys in cache_key:
+            codes = self.chunk_store.column_codes(key)
+            if codes is None:
+                mask[:] = False
+                break
+            # 只在取值字典上做匹配，再用 isin 向量化地映射回所有片段
+            matching = [code for code, value in enumerate(self.chunk_store.column_values(key))
+                        if _value_matches(value, wanted_keys)]
+            mask &= np.isin(codes, np.array(matching, dtype=np.int32))
+
+        with self._cache_lock:
+            if len(self._cache) >= self.cache_size:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[cache_key] = (count, mask)
+        return mask
+
+    def match_pattern(self, names: Tuple[str, ...], pattern: str) -> np.ndarray:
+        """按通配符模式匹配字符串列，任一列命中即为 True"""
+        mask = np.zeros(len(self.chunk_store), dtype=bool)
+        for name in names:
+            codes = self.chunk_store.column_codes(name)
+            if codes is None:
+                continue
+            matching = [code for code, value in enumerate(self.chunk_store.column_values(name))
+                        if isinstance(value, str) and (value == pattern or fnmatch.fnmatchcase(value, pattern))]
+            if matching:
+                mask |= np.isin(codes, np.array(matching, dtype=np.int32))
+        return mask
+
+
+def mask_to_selector(mask: np.ndarray) -> Tuple[Any, np.ndarray]:
+    """布尔位图转换为 IDSelectorBitmap，返回 (selector, bits)，检索结束前需持有 bits"""
+    bits = np.packbits(mask, bitorder='little')
+    return faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bits)), bits
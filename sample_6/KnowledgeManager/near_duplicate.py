@@ -0,0 +1,247 @@
+"""
+入库时的近重复片段检测
+按 SimHash 签名跳过与已有片段近重复的片段，默认关闭
+
+启用：RAG_CONFIG["ingestion"]["dedup"] = {"enabled": True}，其余参数见 DEFAULT_DEDUP_CONFIG
+"""
+
+import os
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np  # pyright: ignore[reportMissingImports]
+
+from Config.model_config import RAG_CONFIG
+
+DEFAULT_DEDUP_CONFIG = {
+    "enabled": False,
+    "similarity": 0.9,      # 1 - 汉明距离 / 64，0.9 即距离不超过 6；越低查找越慢，建议不低于 0.85
+    "shingle_chars": 4,     # 签名特征的字符 n-gram 长度
+    "min_chars": 50         # 更短的片段签名不可靠，不参与去重
+}
+
+_SIGNATURE_BITS = 64
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_PRIME = np.uint64(0x100000001B3)
+
+
+def get_dedup_config() -> Dict[str, Any]:
+    config = dict(DEFAULT_DEDUP_CONFIG)
+    config.update(RAG_CONFIG.get("ingestion", {}).get("dedup", {}))
+    return config
+
+
+def max_distance(similarity: float) -> int:
+    """相似度阈值对应的最大汉明距离"""
+    return max(int((1.0 - similarity) * _SIGNATURE_BITS + 1e-9), 0)
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """splitmix64 终混函数，把多项式哈希打散为均匀分布的 64 位值"""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def simhash(text: str, shingle_chars: int = 4) -> int:
+    """文本的 64 位 SimHash（字符 n-gram 特征，与进程无关，可以持久化）"""
+    normalized = " ".join(text.lower().split())
+    codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) == 0:
+        return 0
+    width = min(shingle_chars, len(codes))
+    count = len(codes) - width + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(width):
+        hashes = hashes * _PRIME + codes[offset:offset + count]
+    bits = np.unpackbits(_mix(hashes).view(np.uint8)).reshape(count, _SIGNATURE_BITS)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > count
+    return int(np.packbits(votes).view(np.uint64)[0])
+
+
+def hamming(signatures: np.ndarray, signature: int) -> np.ndarray:
+    """一组签名与 signature 的汉明距离"""
+    xor = np.ascontiguousarray(signatures ^ np.uint64(signature), dtype=np.uint64)
+    return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class SignatureIndex:
+    """汉明距离近邻查找，状态整体替换，查找方不加锁也能读到一致的状态"""
+
+    def __init__(self, distance: int):
+        self.distance = distance
+        bands = distance + 1
+        widths = [_SIGNATURE_BITS // bands + (1 if i < _SIGNATURE_BITS % bands else 0) for i in range(bands)]
+        shifts = np.cumsum([0] + widths[:-1])
+        self._bands = [(np.uint64(shift), np.uint64((1 << width) - 1)) for shift, width in zip(shifts, widths)]
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self._state[0])
+
+    def add(self, signatures: np.ndarray, rows: np.ndarray):
+        """加入签名（调用方保证不与查找以外的操作并发）"""
+        _, _, tables, indexed = self._state
+        start = len(self)
+        end = start + len(signatures)
+        if end > len(self._signature_buffer):
+            capacity = max(end, len(self._signature_buffer) * 2, 1024)
+            signature_buffer = np.zeros(capacity, dtype=np.uint64)
+            row_buffer = np.zeros(capacity, dtype=np.int64)
+            signature_buffer[:start] = self._signature_buffer[:start]
+            row_buffer[:start] = self._row_buffer[:start]
+            self._signature_buffer, self._row_buffer = signature_buffer, row_buffer
+        # 只写入已用部分之后的位置，正在查找的线程持有的视图不受影响
+        self._signature_buffer[start:end] = signatures
+        self._row_buffer[start:end] = rows
+        signatures, rows = self._signature_buffer[:end], self._row_buffer[:end]
+        if end - indexed > max(4096, indexed // 8):
+            tables = tuple(self._build_table(signatures, shift, mask) for shift, mask in self._bands)
+            indexed = len(signatures)
+        self._state = (signatures, rows, tables, indexed)
+
+    @staticmethod
+    def _build_table(signatures: np.ndarray, shift: np.uint64, mask: np.uint64) -> Tuple[np.ndarray, np.ndarray]:
+        keys = (signatures >> shift) & mask
+        order = np.argsort(keys, kind="stable")
+        return keys[order], order
+
+    def clear(self):
+        self._signature_buffer = np.zeros(0, dtype=np.uint64)
+        self._row_buffer = np.zeros(0, dtype=np.int64)
+        # (签名, 行号, 各段的 (排序后的段值, 对应位置), 已建表的签名数)
+        self._state: Tuple[np.ndarray, np.ndarray, Tuple[Tuple[np.ndarray, np.ndarray], ...], int] = (
+            self._signature_buffer, self._row_buffer, (), 0)
+
+    def find(self, signature: int) -> np.ndarray:
+        """与 signature 的汉明距离不超过阈值的行号，按距离从近到远"""
+        signatures, rows, tables, indexed = self._state
+        if len(signatures) == 0:
+            return rows
+        value = np.uint64(signature)
+        positions = [np.arange(indexed, len(signatures))]
+        for (shift, mask), (keys, order) in zip(self._bands, tables):
+            key = (value >> shift) & mask
+            positions.append(order[np.searchsorted(keys, key, "left"):np.searchsorted(keys, key, "right")])
+        candidates = np.unique(np.concatenate(positions))
+        distances = hamming(signatures[candidates], signature)
+        close = distances <= self.distance
+        return rows[candidates[close][np.argsort(distances[close], kind="stable")]]
+
+
+class ChunkSignatures:
+    """知识库片段的签名文件与查找索引，行号即片段编号；首次去重前才加载"""
+
+    def __init__(self, file_path: Path, distance: int, shingle_chars: int):
+        self.file_path = Path(file_path)
+        self.shingle_chars = shingle_chars
+        self.index = SignatureIndex(distance)
+        self.loaded = False
+
+    def _rows_on_disk(self) -> int:
+        return self.file_path.stat().st_size // 8 if self.file_path.exists() else 0
+
+    def compute(self, texts: List[str]) -> np.ndarray:
+        return np.array([simhash(text, self.shingle_chars) for text in texts], dtype=np.uint64)
+
+    def load(self, rows: int, iter_texts: Callable[[int, int], Iterator[str]]):
+        """读取前 rows 个片段的签名，缺少的补算，多出的截断"""
+        stored = min(self._rows_on_disk(), rows)
+        signatures = np.fromfile(self.file_path, dtype=np.uint64, count=stored) if stored else np.zeros(0, dtype=np.uint64)
+        self._truncate(stored)
+        if stored < rows:
+            logging.info(f"补算 {rows - stored} 个片段的 SimHash 签名")
+            missing = np.array([simhash(text, self.shingle_chars) for text in iter_texts(stored, rows)], dtype=np.uint64)
+            self._write(missing)
+            signatures = np.concatenate([signatures, missing])
+        self.index.clear()
+        self.index.add(signatures, np.arange(len(signatures), dtype=np.int64))
+        self.loaded = True
+
+    def append(self, start: int, signatures: Optional[np.ndarray]):
+        """写入从片段编号 start 开始的签名，先截断之前写入失败留下的多余签名"""
+        if self._rows_on_disk() > start:
+            self._truncate(start)
+        if not self.loaded:
+            return
+        if len(self.index) != start or signatures is None:
+            # 与片段编号不再对齐（其他写入未带签名），下次去重时重新加载
+            self.loaded = False
+            return
+        self._write(signatures)
+        self.index.add(signatures, np.arange(start, start + len(signatures), dtype=np.int64))
+
+    def _write(self, signatures: np.ndarray):
+        if len(signatures) == 0:
+            return
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.file_path, 'ab') as f:
+            f.write(np.ascontiguousarray(signatures, dtype=np.uint64).tobytes())
+
+    def _truncate(self, rows: int):
+        if self.file_path.exists() and self._rows_on_disk() != rows:
+            with open(self.file_path, 'r+b') as f:
+                f.truncate(rows * 8)
+
+    def clear(self):
+        self.index.clear()
+        self.loaded = False
+        if self.file_path.exists():
+            os.remove(self.file_path)
+
+
+class DuplicateFilter:
+    """一次入库任务中的去重：与知识库中未删除的片段及本次已接受的片段比较"""
+
+    def __init__(self, signatures: ChunkSignatures, min_chars: int,
+                 is_live: Callable[[int], bool], source_of: Callable[[int], Optional[str]]):
+        self.signatures = signatures
+        self.min_chars = min_chars
+        self.is_live = is_live
+        self.source_of = source_of
+        self.accepted = SignatureIndex(signatures.index.distance)
+        self.accepted_sources: List[str] = []
+        self.superseded: Set[str] = set()
+
+    def _match(self, signature: int) -> Optional[str]:
+        """重复片段的保留来源，不重复时返回 None"""
+        rows = self.accepted.find(signature)
+        if len(rows):
+            return self.accepted_sources[rows[0]]
+        for row in self.signatures.index.find(signature):
+            if not self.is_live(int(row)):
+                continue
+            source = self.source_of(int(row))
+            if source not in self.superseded:
+                return source
+        return None
+
+    def apply(self, document: Dict[str, Any]):
+        """去掉 document 中的重复片段，设置 signatures、duplicates、duplicate_of"""
+        source = document["source"]
+        self.superseded.add(source)
+        chunks, metadatas = [], []
+        kept = np.zeros(len(document["chunks"]), dtype=np.uint64)
+        linked: Set[str] = set()
+        for chunk, metadata, signature in zip(document["chunks"], document["metadatas"],
+                                              self.signatures.compute(document["chunks"])):
+            if len(chunk) >= self.min_chars:
+                # 同一文件内部的重复直接与本文件已保留的片段比较
+                if len(chunks) and hamming(kept[:len(chunks)], int(signature)).min() <= self.accepted.distance:
+                    continue
+                kept_source = self._match(int(signature))
+                if kept_source is not None:
+                    if kept_source != source:
+                        linked.add(kept_source)
+                    continue
+            kept[len(chunks)] = signature
+            chunks.append(chunk)
+            metadatas.append(metadata)
+        signatures = kept[:len(chunks)]
+        self.accepted.add(signatures, np.full(len(chunks), len(self.accepted_sources), dtype=np.int64))
+        self.accepted_sources.append(source)
+        document["duplicates"] = len(document["chunks"]) - len(chunks)
+        document["duplicate_of"] = sorted(linked)
+        document["chunks"], document["metadatas"] = chunks, metadatas
+        document["signatures"] = signatures
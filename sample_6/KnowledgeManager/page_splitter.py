@@ -0,0 +1,118 @@
+"""
+按页增量切分
+逐页累积文本并按窗口切分，片段元数据记录起止页码（及字符区间与章节）
+"""
+
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 定位片段起止位置时用于匹配的首尾字符数
+_PROBE_CHARS = 32
+
+# 片段大小按 token 计时，换算窗口字符数所用的每个 token 的字符数上限（英文约 4 个字符 1 个 token）
+_CHARS_PER_TOKEN = 4
+
+
+def _window_chars(splitter: Any) -> int:
+    """默认窗口大小：8 倍片段大小（按 token 计时换算为字符数）"""
+    chunk_size = getattr(splitter, "chunk_size", None) or getattr(splitter, "_chunk_size", None) or 1000
+    length_function = getattr(splitter, "length_function", None) or getattr(splitter, "_length_function", None)
+    if length_function is not None and length_function is not len:
+        chunk_size *= _CHARS_PER_TOKEN
+    return chunk_size * 8
+
+
+def span_metadata(start: int, end: int, headings: Tuple[str, ...]) -> Dict[str, Any]:
+    """片段在原文中的字符区间与所属章节（标题路径）"""
+    metadata = {"char_start": start, "char_end": end}
+    if headings:
+        metadata["section"] = " > ".join(headings)
+    return metadata
+
+
+def split_document(splitter: Any, text: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """切分整篇文本，返回片段与对应的片段元数据"""
+    if hasattr(splitter, "split_spans"):
+        spans = splitter.split_spans(text)
+        return [text[start:end] for start, end, _ in spans], [span_metadata(*span) for span in spans]
+    chunks = splitter.split_text(text)
+    return chunks, [{} for _ in chunks]
+
+
+def _split(splitter: Any, text: str,
+           outline: Tuple = ()) -> Tuple[List[str], List[Tuple[int, int]], Optional[List[Tuple[str, ...]]]]:
+    if hasattr(splitter, "split_spans"):
+        spans = splitter.split_spans(text, outline) if outline else splitter.split_spans(text)
+        return ([text[start:end] for start, end, _ in spans], [(start, end) for start, end, _ in spans],
+                [headings for _, _, headings in spans])
+    chunks = splitter.split_text(text)
+    return chunks, _locate(text, chunks), None
+
+
+def _locate(text: str, chunks: List[str]) -> List[Tuple[int, int]]:
+    """片段在 text 中的 [起点, 终点)，按片段首尾字符向后查找，找不到时沿用上一个位置"""
+    spans = []
+    cursor = 0
+    for chunk in chunks:
+        stripped = chunk.strip()
+        head, tail = stripped[:_PROBE_CHARS], stripped[-_PROBE_CHARS:]
+        start = text.find(head, cursor) if head else -1
+        if start < 0:
+            start = min(cursor, len(text))
+        end = text.find(tail, max(start, start + len(stripped) - len(tail) - _PROBE_CHARS)) if tail else -1
+        if end < 0:
+            end = text.find(tail, start) if tail else -1
+        end = end + len(tail) if end >= 0 else min(start + len(stripped), len(text))
+        spans.append((start, max(end, start + 1)))
+        cursor = start + 1
+    return spans
+
+
+def split_pages(splitter: Any, pages: Iterable[Tuple[int, str]],
+                window_chars: Optional[int] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """增量切分逐页产出的 (页码, 页面文本)，产出 (片段, 片段元数据)，元数据含起止页码"""
+    window_chars = window_chars or _window_chars(splitter)
+    buffer = ""
+    # 缓冲区起点在全文中的偏移
+    base = 0
+    # 缓冲区中各页的起点与页码，按起点升序
+    offsets: List[int] = []
+    numbers: List[int] = []
+    # 缓冲区起点所在的各级标题
+    outline: Tuple = ()
+
+    def page_at(offset: int) -> int:
+        return numbers[max(bisect_right(offsets, offset) - 1, 0)]
+
+    def emit(chunks: List[str], spans: List[Tuple[int, int]],
+             headings: Optional[List[Tuple[str, ...]]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for i, (chunk, (start, end)) in enumerate(zip(chunks, spans)):
+            metadata = {"page_start": page_at(start), "page_end": page_at(end - 1)}
+            if headings is not None:
+                metadata.update(span_metadata(base + start, base + end, headings[i]))
+            yield chunk, metadata
+
+    for page_number, text in pages:
+        offsets.append(len(buffer))
+        numbers.append(page_number)
+        buffer += text
+        if len(buffer) < window_chars:
+            continue
+        chunks, spans, headings = _split(splitter, buffer, outline)
+        if len(chunks) < 2:
+            continue
+        cut = spans[-1][0]
+        if cut <= 0:
+            continue
+        yield from emit(chunks[:-1], spans[:-1], headings)
+        # 保留最后一块起点之后的文本和页码
+        first = max(bisect_right(offsets, cut) - 1, 0)
+        offsets = [0] + [offset - cut for offset in offsets[first + 1:]]
+        numbers = numbers[first:]
+        if hasattr(splitter, "outline_at"):
+            outline = splitter.outline_at(buffer, cut, outline)
+        buffer = buffer[cut:]
+        base += cut
+
+    if buffer.strip():
+        yield from emit(*_split(splitter, buffer, outline))
@@ -1,153 +1,475 @@
 #!/usr/bin/env python3
 """
 独立的rerank模块，用于对检索结果进行重排序
+
+配置 RAG_CONFIG["rerank"]: enabled、timeout、connect_timeout、max_connections、budget_ms、failure_threshold、cooldown，
+分数缓存见 DEFAULT_SCORE_CACHE_CONFIG
 """
 
+import os
+import time
+import struct
+import asyncio
+import hashlib
 import logging
-import requests
-import json
-from typing import List, Dict, Any, Optional
+import threading
+import unicodedata
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+import httpx
 from Config.model_config import RAG_CONFIG
 
+# rerank 接口返回的 [(文档序号, 相关性分数)]
+Scores = List[Tuple[int, float]]
+
+DEFAULT_SCORE_CACHE_CONFIG = {
+    "enabled": True,
+    "max_entries": 100000,    # LRU 条数上限
+    "persistent": False,      # 是否持久化到磁盘
+    "directory": None         # None 时放在知识库根目录同级的 rerank_cache 目录
+}
+
+# 持久化文件中每条记录：16 字节键 + float32 分数
+_RECORD = struct.Struct("<16sf")
+
+
+def get_score_cache_config() -> Dict[str, Any]:
+    config = dict(DEFAULT_SCORE_CACHE_CONFIG)
+    config.update(RAG_CONFIG["rerank"].get("cache", {}))
+    if not config["directory"]:
+        base_directory = Path(RAG_CONFIG["vector_store"]["faiss"]["base_directory"])
+        config["directory"] = str(base_directory.parent / "rerank_cache")
+    return config
+
+
+def normalize_query(query: str) -> str:
+    """全角/半角统一、转小写、合并空白，措辞相同的查询命中同一组分数"""
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+def score_key(namespace: str, query: str, item: Dict[str, Any]) -> bytes:
+    """分数缓存键：模型 + 规范化的查询 + 片段编号 + 片段内容"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (namespace, normalize_query(query), str(item.get("chunk_id", "")), item.get("content", "")):
+        digest.update(part.encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    return digest.digest()
+
+
+class RerankScoreCache:
+    """rerank 分数的 LRU 缓存，同一模型的 Reranker 共用一个实例，可选持久化"""
+
+    def __init__(self, max_entries: int, path: Optional[Path] = None):
+        self.max_entries = max(int(max_entries), 1)
+        self.path = Path(path) if path else None
+        self._entries: "OrderedDict[bytes, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._records = 0
+        self.counters = {"hits": 0, "misses": 0}
+        if self.path is not None:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                self._records = size // _RECORD.size
+                # 只读最近写入的 max_entries 条，同一个键以最后一次写入为准
+                start = max(self._records - self.max_entries, 0)
+                f.seek(start * _RECORD.size)
+                data = f.read((self._records - start) * _RECORD.size)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logging.warning(f"读取rerank分数缓存失败，不使用持久化缓存: {e}")
+            self.path = None
+            return
+        for key, score in _RECORD.iter_unpack(data):
+            self._entries[key] = score
+            self._entries.move_to_end(key)
+        if size % _RECORD.size:
+            # 上次写入中断留下的不完整记录
+            self._rewrite()
+        logging.info(f"加载rerank分数缓存 {len(self._entries)} 条: {self.path}")
+
+    def _rewrite(self):
+        """按内存中的条目重写持久化文件（先写临时文件再原子替换）"""
+        temp_path = self.path.with_suffix(".tmp")
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(b"".join(_RECORD.pack(key, score) for key, score in self._entries.items()))
+            os.replace(temp_path, self.path)
+            self._records = len(self._entries)
+        except OSError as e:
+            logging.warning(f"重写rerank分数缓存失败: {e}")
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[float]]:
+        with self._lock:
+            scores = []
+            for key in keys:
+                score = self._entries.get(key)
+                if score is not None:
+                    self._entries.move_to_end(key)
+                scores.append(score)
+            hits = sum(score is not None for score in scores)
+            self.counters["hits"] += hits
+            self.counters["misses"] += len(keys) - hits
+            return scores
+
+    def put_many(self, keys: List[bytes], scores: List[float]):
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._entries[key] = float(score)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self.path is None:
+                return
+            if self._records + len(keys) > 2 * self.max_entries:
+                self._rewrite()
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "ab") as f:
+                    f.write(b"".join(_RECORD.pack(key, float(score)) for key, score in zip(keys, scores)))
+                self._records += len(keys)
+            except OSError as e:
+                logging.warning(f"写入rerank分数缓存失败: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path is not None:
+                self._rewrite()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, **self.counters}
+
+
 class Reranker:
     """Reranker类，用于对检索结果进行重排序"""
-    
+
     def __init__(self, model_name: Optional[str] = None):
         """
         初始化Reranker
-        
+
         Args:
             model_name: rerank模型名称，默认从配置中获取
         """
-        self.model_name = model_name or RAG_CONFIG["rerank"]["default_model"]
-        self.rerank_config = RAG_CONFIG["rerank"]["models"].get(self.model_name, {})
+        rerank_settings = RAG_CONFIG["rerank"]
+        self.model_name = model_name or rerank_settings["default_model"]
+        self.rerank_config = rerank_settings["models"].get(self.model_name, {})
         # 修正API URL路径，添加正确的端点
         base_url = self.rerank_config.get("api_url", "http://localhost:8000/v1")
         self.api_url = f"{base_url}/rerank" if not base_url.endswith("/rerank") else base_url
         self.api_key = self.rerank_config.get("api_key", "")
-        self.enabled = RAG_CONFIG["rerank"].get("enabled", False)
-        
+        self.enabled = rerank_settings.get("enabled", False)
+
+        self.timeout = float(rerank_settings.get("timeout", 5))
+        self.connect_timeout = float(rerank_settings.get("connect_timeout", 1))
+        self.budget_ms = rerank_settings.get("budget_ms")
+        self.failure_threshold = int(rerank_settings.get("failure_threshold", 3))
+        self.cooldown = float(rerank_settings.get("cooldown", 30))
+        max_connections = int(rerank_settings.get("max_connections", 16))
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                   keepalive_expiry=60)
+        self.headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            self.headers["Authorization"] = f"Bearer {self.api_key}"
+
+        self.client = httpx.Client(headers=self.headers, limits=self.limits,
+                                   timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout))
+        # 异步客户端的连接池绑定事件循环，按循环分别创建
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        # 在途请求：请求键 -> 结果，相同的并发请求只发送一次；在途请求表、异步客户端与熔断状态由 _lock 保护
+        self._inflight: Dict[Tuple, "Future[Scores]"] = {}
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._paused_until = 0.0
+
+        # 分数只与模型、查询和片段有关，重复的查询只请求缓存中没有的片段
+        self.cache_namespace = f"{self.model_name}/{self.rerank_config.get('model', self.model_name)}"
+        cache_config = get_score_cache_config()
+        self.cache: Optional[RerankScoreCache] = None
+        if cache_config["enabled"]:
+            cache_path = None
+            if cache_config["persistent"]:
+                name = hashlib.blake2b(self.cache_namespace.encode("utf-8"), digest_size=8).hexdigest()
+                cache_path = Path(cache_config["directory"]) / f"{name}.bin"
+            self.cache = RerankScoreCache(cache_config["max_entries"], cache_path)
+
         logging.info(f"初始化Reranker: {self.model_name}, API URL: {self.api_url}")
-    
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # 已关闭的事件循环上的连接不能再使用，丢弃其客户端
+            for closed in [other for other in list(self._async_clients.keys()) if other.is_closed()]:
+                self._async_clients.pop(closed, None)
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(headers=self.headers, limits=self.limits,
+                                           timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout))
+                self._async_clients[loop] = client
+        return client
+
+    async def aclose(self):
+        """关闭当前事件循环的异步客户端"""
+        with self._lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        """关闭同步客户端；各事件循环的异步客户端在其仍在运行的循环中关闭，其余直接丢弃"""
+        self.client.close()
+        with self._lock:
+            clients = list(self._async_clients.items())
+            self._async_clients.clear()
+        for loop, client in clients:
+            if loop.is_running() and not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
     def is_enabled(self) -> bool:
         """检查rerank功能是否启用"""
         return self.enabled
-    
-    def rerank(self, query: str, context_list: List[Dict[str, Any]], top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+
+    @staticmethod
+    def _original(context_list: List[Dict[str, Any]], top_k: Optional[int]) -> List[Dict[str, Any]]:
+        return context_list[:top_k] if top_k else context_list
+
+    def _request_timeout(self, budget_ms: Optional[float]) -> Optional[float]:
+        """本次请求的超时秒数，暂停期间返回 None"""
+        with self._lock:
+            if time.monotonic() < self._paused_until:
+                return None
+        budget_ms = budget_ms if budget_ms is not None else self.budget_ms
+        return min(self.timeout, budget_ms / 1000) if budget_ms else self.timeout
+
+    def _record(self, success: bool, error: Optional[Exception] = None, timeout: Optional[float] = None):
+        """记录请求结果，更新连续失败计数"""
+        if not success and isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError)) \
+                and timeout is not None and timeout < self.timeout:
+            return
+        with self._lock:
+            if success:
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._failures < self.failure_threshold:
+                return
+            self._paused_until = time.monotonic() + self.cooldown
+            self._failures = 0
+        logging.warning(f"Rerank连续失败 {self.failure_threshold} 次，{self.cooldown:.0f} 秒内直接返回原始结果")
+
+    def _http_timeout(self, timeout: float) -> httpx.Timeout:
+        """本次请求的 httpx 超时：总体不超过 timeout，建立连接仍受 connect_timeout 限制"""
+        return httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout))
+
+    def _payload(self, query: str, documents: List[str], top_n: int) -> Dict[str, Any]:
+        return {
+            "model": self.rerank_config.get("model", self.model_name),
+            "query": query,
+            "documents": documents,
+            "top_n": top_n
+        }
+
+    @staticmethod
+    def _parse_response(response: httpx.Response) -> Scores:
+        if response.status_code != 200:
+            raise RuntimeError(f"Rerank API调用失败，状态码: {response.status_code}, 响应: {response.text[:500]}")
+        return [(item.get("index"), item.get("relevance_score", 0)) for item in response.json().get("results", [])]
+
+    def _join(self, key: Tuple) -> Tuple["Future[Scores]", bool]:
+        """返回 (请求结果, 是否由本调用方发送)；已有相同的在途请求时等待其结果"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _settle(self, key: Tuple, future: "Future[Scores]", scores: Optional[Scores], error: Optional[Exception]):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(scores)
+
+    @staticmethod
+    def _apply_scores(context_list: List[Dict[str, Any]], scores: Scores, top_k: Optional[int]) -> List[Dict[str, Any]]:
+        limit = top_k or len(context_list)
+        reranked_results = []
+        for index, score in scores:
+            if index is not None and 0 <= index < len(context_list):
+                # 复制原始结果并添加rerank分数
+                reranked_item = context_list[index].copy()
+                reranked_item["rerank_score"] = score
+                reranked_results.append(reranked_item)
+        reranked_results = reranked_results[:limit]
+
+        # 如果API返回的结果数量少于预期，补充原始结果
+        if len(reranked_results) < limit:
+            reranked_indices = {index for index, _ in scores}
+            for i, original_item in enumerate(context_list):
+                if i not in reranked_indices and len(reranked_results) < limit:
+                    reranked_item = original_item.copy()
+                    reranked_item["rerank_score"] = 0  # 未rerank的项分数为0
+                    reranked_results.append(reranked_item)
+        return reranked_results
+
+    def _plan(self, query: str, context_list: List[Dict[str, Any]], top_k: Optional[int]) -> Dict[str, Any]:
+        """查询分数缓存，确定需要请求分数的文档"""
+        documents = [item.get("content", "") for item in context_list]
+        keys, cached = None, [None] * len(documents)
+        if self.cache is not None:
+            keys = [score_key(self.cache_namespace, query, item) for item in context_list]
+            cached = self.cache.get_many(keys)
+        missing = [i for i, score in enumerate(cached) if score is None]
+        top_n = len(missing) if self.cache is not None else (top_k or len(documents))
+        request_documents = [documents[i] for i in missing]
+        return {"keys": keys, "cached": cached, "missing": missing, "documents": request_documents, "top_n": top_n,
+                "request_key": (query, tuple(request_documents), top_n)}
+
+    def _merge(self, plan: Dict[str, Any], fresh: Scores) -> Scores:
+        """把请求得到的分数（按请求文档编号）映射回原列表，写入缓存，与缓存命中的分数合并并按分数排序"""
+        missing = plan["missing"]
+        fresh = [(missing[index], score) for index, score in fresh if index is not None and 0 <= index < len(missing)]
+        if self.cache is not None and fresh:
+            self.cache.put_many([plan["keys"][i] for i, _ in fresh], [score for _, score in fresh])
+        scores = [(i, score) for i, score in enumerate(plan["cached"]) if score is not None] + fresh
+        scores.sort(key=lambda entry: -entry[1])
+        return scores
+
+    def _fetch(self, query: str, plan: Dict[str, Any], timeout: float) -> Scores:
+        """同步请求 plan 中的文档（相同的并发请求合并），失败时抛出异常"""
+        key = plan["request_key"]
+        future, owner = self._join(key)
+        if not owner:
+            return future.result(timeout=timeout)
+        # httpx 的超时按建立连接、读取等阶段分别计算，等待合并请求的调用方按总时长计算
+        try:
+            response = self.client.post(self.api_url, json=self._payload(query, plan["documents"], plan["top_n"]),
+                                        timeout=self._http_timeout(timeout))
+            scores = self._parse_response(response)
+        except Exception as e:
+            self._record(False, e, timeout)
+            self._settle(key, future, None, e)
+            raise
+        self._record(True)
+        self._settle(key, future, scores, None)
+        return scores
+
+    async def _afetch(self, query: str, plan: Dict[str, Any], timeout: float) -> Scores:
+        """_fetch 的异步版本"""
+        key = plan["request_key"]
+        future, owner = self._join(key)
+        if not owner:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        try:
+            response = await asyncio.wait_for(
+                self.async_client.post(self.api_url, json=self._payload(query, plan["documents"], plan["top_n"]),
+                                       timeout=self._http_timeout(timeout)),
+                timeout)
+            scores = self._parse_response(response)
+        except asyncio.CancelledError:
+            self._settle(key, future, None, RuntimeError("Rerank请求已取消"))
+            raise
+        except Exception as e:
+            self._record(False, e, timeout)
+            self._settle(key, future, None, e)
+            raise
+        self._record(True)
+        self._settle(key, future, scores, None)
+        return scores
+
+    def rerank(self, query: str, context_list: List[Dict[str, Any]], top_k: Optional[int] = None,
+               budget_ms: Optional[float] = None) -> List[Dict[str, Any]]:
         """
         对检索结果进行重排序
-        
+
         Args:
             query: 查询语句
-            context_list: 检索结果列表，每个元素包含"context"字段
+            context_list: 检索结果列表，每个元素包含"content"字段（及片段编号"chunk_id"）
             top_k: 返回前k个结果，默认返回所有结果
-            
+            budget_ms: 本次调用的延迟预算（毫秒），默认取配置的 budget_ms
+
         Returns:
-            重排序后的结果列表
+            重排序后的结果列表；未启用、超时或失败时为原始顺序
         """
         if not self.enabled:
             logging.info("Rerank功能未启用，返回原始结果")
-            return context_list[:top_k] if top_k else context_list
-        
+            return self._original(context_list, top_k)
+
         if not context_list:
             return []
-        
-        try:
-            # 准备rerank请求数据
-            documents = [item.get("content", "") for item in context_list]
-            
-            # 构建请求体
-            payload = {
-                "model": self.rerank_config.get("model", self.model_name),
-                "query": query,
-                "documents": documents,
-                "top_n": top_k or len(documents)
-            }
-            
-            # 设置请求头
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            if self.api_key:
-                headers["Authorization"] = f"Bearer {self.api_key}"
-            
-            # 发送rerank请求
-            logging.info(f"发送rerank请求到: {self.api_url}")
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=30  # 30秒超时
-            )
-            
-            # 检查响应状态
-            if response.status_code != 200:
-                logging.error(f"Rerank API调用失败，状态码: {response.status_code}, 响应: {response.text}")
-                # 返回原始结果
-                return context_list[:top_k] if top_k else context_list
-            
-            # 解析响应
-            result = response.json()
-            
-            # 重新排序结果
-            reranked_results = []
-            for item in result.get("results", []):
-                index = item.get("index")
-                if 0 <= index < len(context_list):
-                    # 复制原始结果并添加rerank分数
-                    reranked_item = context_list[index].copy()
-                    reranked_item["rerank_score"] = item.get("relevance_score", 0)
-                    reranked_results.append(reranked_item)
-            
-            # 如果API返回的结果数量少于预期，补充原始结果
-            if len(reranked_results) < (top_k or len(context_list)):
-                # 获取未被rerank的原始结果
-                reranked_indices = {item.get("index") for item in result.get("results", [])}
-                for i, original_item in enumerate(context_list):
-                    if i not in reranked_indices and len(reranked_results) < (top_k or len(context_list)):
-                        reranked_item = original_item.copy()
-                        reranked_item["rerank_score"] = 0  # 未rerank的项分数为0
-                        reranked_results.append(reranked_item)
-            
-            logging.info(f"Rerank完成，返回{len(reranked_results)}个结果")
-            return reranked_results
-            
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Rerank API请求异常: {str(e)}")
-            # 返回原始结果
-            return context_list[:top_k] if top_k else context_list
-        except Exception as e:
-            logging.error(f"Rerank处理异常: {str(e)}")
-            # 返回原始结果
-            return context_list[:top_k] if top_k else context_list
-    
-    def rerank_with_context(self, query: str, context_list: List[Dict[str, Any]], top_k: Optional[int] = None) -> Dict[str, Any]:
-        """
-        对检索结果进行重排序并返回格式化的上下文
-        
-        Args:
-            query: 查询语句
-            context_list: 检索结果列表
-            top_k: 返回前k个结果
-            
-        Returns:
-            包含重排序结果和格式化上下文的字典
-        """
-        # 执行rerank
-        reranked_results = self.rerank(query, context_list, top_k)
-        
-        # 构建格式化的上下文字符串
+
+        started = time.monotonic()
+        plan = self._plan(query, context_list, top_k)
+        fresh: Scores = []
+        if plan["missing"]:
+            timeout = self._request_timeout(budget_ms)
+            if timeout is None:
+                return self._original(context_list, top_k)
+            try:
+                fresh = self._fetch(query, plan, timeout)
+            except Exception as e:
+                logging.error(f"Rerank请求失败，返回原始结果: {e!r}")
+                return self._original(context_list, top_k)
+
+        reranked_results = self._apply_scores(context_list, self._merge(plan, fresh), top_k)
+        logging.debug(f"Rerank完成，返回{len(reranked_results)}个结果（请求 {len(plan['missing'])} 篇），"
+                      f"耗时 {(time.monotonic() - started) * 1000:.0f}ms")
+        return reranked_results
+
+    async def arerank(self, query: str, context_list: List[Dict[str, Any]], top_k: Optional[int] = None,
+                      budget_ms: Optional[float] = None) -> List[Dict[str, Any]]:
+        """rerank 的异步版本：请求走当前事件循环的连接池，等待期间不占用事件循环"""
+        if not self.enabled:
+            return self._original(context_list, top_k)
+        if not context_list:
+            return []
+
+        plan = self._plan(query, context_list, top_k)
+        fresh: Scores = []
+        if plan["missing"]:
+            timeout = self._request_timeout(budget_ms)
+            if timeout is None:
+                return self._original(context_list, top_k)
+            try:
+                fresh = await self._afetch(query, plan, timeout)
+            except Exception as e:
+                logging.error(f"Rerank请求失败，返回原始结果: {e!r}")
+                return self._original(context_list, top_k)
+        return self._apply_scores(context_list, self._merge(plan, fresh), top_k)
+
+    async def arerank_many(self, queries: List[str], context_lists: List[List[Dict[str, Any]]],
+                           top_k: Optional[int] = None, budget_ms: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """多个 query 各自重排并发发送，返回与 queries 对齐的结果"""
+        return list(await asyncio.gather(*(self.arerank(query, context_list, top_k, budget_ms)
+                                           for query, context_list in zip(queries, context_lists))))
+
+    @staticmethod
+    def format_context(reranked_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """构建与检索结果相同结构的返回值（含格式化的上下文字符串）"""
         context_parts = []
         for i, result in enumerate(reranked_results):
             text = result.get("content", "")
             source = result.get("source", "未知来源")
             score = result.get("rerank_score", result.get("score", 0))
-            
+
             context_parts.append(f"[来源: {source}, 相关性: {score:.4f}]\n{text}")
-        
+
         context = "\n\n".join(context_parts)
-        
+
         return {
             "success": True,
             "context": context,
@@ -155,52 +477,93 @@ class Reranker:
             "docs_count": len(reranked_results)
         }
 
-def apply_rerank_to_search_results(query: str, search_results: Dict[str, Any], top_k: Optional[int] = None, score_threshold: float = 0.3) -> Dict[str, Any]:
+    def rerank_with_context(self, query: str, context_list: List[Dict[str, Any]], top_k: Optional[int] = None,
+                            budget_ms: Optional[float] = None) -> Dict[str, Any]:
+        """
+        对检索结果进行重排序并返回格式化的上下文
+
+        Args:
+            query: 查询语句
+            context_list: 检索结果列表
+            top_k: 返回前k个结果
+            budget_ms: 延迟预算（毫秒）
+
+        Returns:
+            包含重排序结果和格式化上下文的字典
+        """
+        return self.format_context(self.rerank(query, context_list, top_k, budget_ms))
+
+    async def arerank_with_context(self, query: str, context_list: List[Dict[str, Any]], top_k: Optional[int] = None,
+                                   budget_ms: Optional[float] = None) -> Dict[str, Any]:
+        """rerank_with_context 的异步版本"""
+        return self.format_context(await self.arerank(query, context_list, top_k, budget_ms))
+
+
+_shared_rerankers: Dict[str, Reranker] = {}
+_shared_rerankers_lock = threading.Lock()
+
+
+def get_reranker(model_name: Optional[str] = None) -> Reranker:
+    """按模型返回进程内共享的 Reranker（连接池、在途请求与失败计数都按模型共享）"""
+    model_name = model_name or RAG_CONFIG["rerank"]["default_model"]
+    with _shared_rerankers_lock:
+        reranker = _shared_rerankers.get(model_name)
+        if reranker is None:
+            reranker = Reranker(model_name)
+            _shared_rerankers[model_name] = reranker
+        return reranker
+
+
+def _filter_search_results(search_results: Dict[str, Any], score_threshold: float) -> Optional[List[Dict[str, Any]]]:
+    """需要重排的结果；输入无效或未启用rerank时返回 None（调用方原样返回检索结果）"""
+    # 检查输入是否有效
+    if not isinstance(search_results, dict) or "context_list" not in search_results:
+        logging.warning("无效的搜索结果格式，跳过rerank")
+        return None
+    if not RAG_CONFIG["rerank"].get("enabled", False):
+        logging.info("Rerank功能未启用，返回原始结果")
+        return None
+    # 过滤掉低于分数阈值的结果
+    return [item for item in search_results.get("context_list", []) if item.get("score", 0) >= score_threshold]
+
+
+def apply_rerank_to_search_results(query: str, search_results: Dict[str, Any], top_k: Optional[int] = None,
+                                   score_threshold: float = 0.3, budget_ms: Optional[float] = None) -> Dict[str, Any]:
     """
     对搜索结果应用rerank
-    
+
     Args:
         query: 查询语句
         search_results: 搜索结果字典，应包含"context_list"字段
         top_k: 返回前k个结果
-        
+        budget_ms: 延迟预算（毫秒），默认取配置
+
     Returns:
         应用rerank后的结果
     """
     try:
-        # 检查输入是否有效
-        if not isinstance(search_results, dict) or "context_list" not in search_results:
-            logging.warning("无效的搜索结果格式，跳过rerank")
+        filtered_context_list = _filter_search_results(search_results, score_threshold)
+        if filtered_context_list is None:
             return search_results
-        
-        # 创建Reranker实例
-        reranker = Reranker()
-        
-        # 检查是否启用rerank
-        if not reranker.is_enabled():
-            logging.info("Rerank功能未启用，返回原始结果")
-            return search_results
-        
-        # 获取原始结果
-        context_list = search_results.get("context_list", [])
-        
-        # 过滤掉低于分数阈值的结果
-        filtered_context_list = [item for item in context_list if item.get("score", 0) >= score_threshold]
-        
         # 如果过滤后没有结果，返回空结果
         if not filtered_context_list:
-            return {
-                "success": True,
-                "context": "",
-                "context_list": [],
-                "docs_count": 0
-            }
-        
-        # 应用rerank
-        reranked_results = reranker.rerank_with_context(query, filtered_context_list, top_k)
-        
-        return reranked_results
-        
+            return Reranker.format_context([])
+        return get_reranker().rerank_with_context(query, filtered_context_list, top_k, budget_ms)
+    except Exception as e:
+        logging.error(f"应用rerank时发生错误: {str(e)}")
+        return search_results
+
+
+async def aapply_rerank_to_search_results(query: str, search_results: Dict[str, Any], top_k: Optional[int] = None,
+                                          score_threshold: float = 0.3, budget_ms: Optional[float] = None) -> Dict[str, Any]:
+    """apply_rerank_to_search_results 的异步版本"""
+    try:
+        filtered_context_list = _filter_search_results(search_results, score_threshold)
+        if filtered_context_list is None:
+            return search_results
+        if not filtered_context_list:
+            return Reranker.format_context([])
+        return await get_reranker().arerank_with_context(query, filtered_context_list, top_k, budget_ms)
     except Exception as e:
         logging.error(f"应用rerank时发生错误: {str(e)}")
         return search_results
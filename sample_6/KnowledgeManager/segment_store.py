@@ -0,0 +1,192 @@
+"""
+分段索引存储
+向量索引与BM25倒排按片段编号区间存为不可变的段，MANIFEST.json 为带校验和的提交点
+"""
+
+import os
+import json
+import math
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+import faiss  # pyright: ignore[reportMissingImports]
+
+from KnowledgeManager.bm25_index import BM25Index
+from KnowledgeManager.ingest_manifest import file_sha256
+
+MANIFEST_VERSION = 1
+
+
+class SegmentCorruptedError(RuntimeError):
+    """分段清单或段文件缺失、损坏"""
+
+
+class ManifestConflictError(RuntimeError):
+    """磁盘上的分段清单在本实例加载之后被其他进程替换"""
+
+
+class SegmentStore:
+    """分段清单与段文件读写；清单的修改（commit）由调用方在知识库文件锁与写锁内进行"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.manifest_file = self.directory / "MANIFEST.json"
+        self.generation = 0
+        self.rows = 0
+        self.dimension: Optional[int] = None
+        self.segments: List[Dict[str, Any]] = []
+        self._next_id = 0
+        self._id_lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return self.manifest_file.exists()
+
+    def has_segment_files(self) -> bool:
+        return self.directory.exists() and any(self.directory.glob("seg_*"))
+
+    @property
+    def sealed_rows(self) -> int:
+        """已封存进段的片段数，之后的片段属于可变段"""
+        return self.segments[-1]["end"] if self.segments else 0
+
+    def load(self):
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise SegmentCorruptedError(f"分段清单无法读取: {e}")
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise SegmentCorruptedError(f"不支持的分段清单版本: {manifest.get('version')}")
+        self.generation = manifest["generation"]
+        self.rows = manifest["rows"]
+        self.dimension = manifest["dimension"]
+        self.segments = manifest["segments"]
+        self._next_id = manifest["next_id"]
+
+    def read_generation(self) -> Optional[int]:
+        """磁盘上清单的当前版本号（用于判断加载期间清单是否被替换）"""
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get("generation")
+        except (OSError, ValueError):
+            return None
+
+    def _verify(self, file_name: str, size: int, sha256: str, verify_checksum: bool) -> Path:
+        file_path = self.directory / file_name
+        if not file_path.exists():
+            raise SegmentCorruptedError(f"段文件缺失: {file_name}")
+        if file_path.stat().st_size != size:
+            raise SegmentCorruptedError(f"段文件大小不一致: {file_name}")
+        if verify_checksum and file_sha256(str(file_path)) != sha256:
+            raise SegmentCorruptedError(f"段文件校验和不一致: {file_name}")
+        return file_path
+
+    def read_segment(self, segment: Dict[str, Any], verify_checksum: bool = True) -> Tuple[Any, Optional[BM25Index]]:
+        """读取并校验一个段，返回 (向量索引, BM25倒排)；分词器不一致时倒排为 None"""
+        index_path = self._verify(segment["index_file"], segment["index_bytes"], segment["index_sha256"], verify_checksum)
+        bm25_path = self._verify(segment["bm25_file"], segment["bm25_bytes"], segment["bm25_sha256"], verify_checksum)
+        try:
+            index = faiss.read_index(str(index_path))
+            bm25 = BM25Index.load(bm25_path)
+        except Exception as e:
+            raise SegmentCorruptedError(f"段 {segment['id']} 读取失败: {e}")
+        if index.ntotal != segment["vectors"]:
+            raise SegmentCorruptedError(f"段 {segment['id']} 向量数与清单不一致")
+        if bm25 is not None and bm25.num_docs != segment["end"] - segment["start"]:
+            raise SegmentCorruptedError(f"段 {segment['id']} BM25文档数与清单不一致")
+        return index, bm25
+
+    def write_segment(self, index: Any, bm25: BM25Index, start: int, end: int) -> Dict[str, Any]:
+        """写出覆盖片段编号 [start, end) 的新段文件，返回清单条目；提交清单之前不生效"""
+        with self._id_lock:
+            # 跳过中断或其他实例留下的同名文件，已有的段文件不会被覆盖
+            while (self.directory / f"seg_{self._next_id:06d}.faiss").exists():
+                self._next_id += 1
+            segment_id = self._next_id
+            self._next_id += 1
+        self.directory.mkdir(parents=True, exist_ok=True)
+        index_file = f"seg_{segment_id:06d}.faiss"
+        bm25_file = f"seg_{segment_id:06d}.bm25.npz"
+        tmp_path = self.directory / f"{index_file}.tmp"
+        faiss.write_index(index, str(tmp_path))
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.directory / index_file)
+        bm25.save(self.directory / bm25_file)
+        return {
+            "id": segment_id,
+            "start": start,
+            "end": end,
+            "vectors": int(index.ntotal),
+            "index_file": index_file,
+            "index_bytes": (self.directory / index_file).stat().st_size,
+            "index_sha256": file_sha256(str(self.directory / index_file)),
+            "bm25_file": bm25_file,
+            "bm25_bytes": (self.directory / bm25_file).stat().st_size,
+            "bm25_sha256": file_sha256(str(self.directory / bm25_file))
+        }
+
+    def discard(self, segment: Dict[str, Any]):
+        """删除未提交或已被替换的段文件"""
+        for file_name in (segment["index_file"], segment["bm25_file"]):
+            file_path = self.directory / file_name
+            if file_path.exists():
+                file_path.unlink()
+
+    def commit(self, rows: int, dimension: int, segments: Optional[List[Dict[str, Any]]] = None):
+        """原子替换清单，新清单生效后删除不再引用的旧段文件"""
+        if self.read_generation() != (self.generation or None):
+            raise ManifestConflictError(f"分段清单已被其他进程修改: {self.manifest_file}")
+        obsolete = []
+        if segments is not None:
+            keep = {segment["id"] for segment in segments}
+            obsolete = [segment for segment in self.segments if segment["id"] not in keep]
+            self.segments = list(segments)
+        self.rows = rows
+        self.dimension = dimension
+        self.generation += 1
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.directory / "MANIFEST.json.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "generation": self.generation,
+                "rows": self.rows,
+                "dimension": self.dimension,
+                "next_id": self._next_id,
+                "segments": self.segments
+            }, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.manifest_file)
+        for segment in obsolete:
+            self.discard(segment)
+
+    def pick_merge(self, segment_rows: int, merge_factor: int) -> Optional[Tuple[int, int]]:
+        """尺寸分层合并策略，返回需要合并的段区间 [i, j)，无需合并时返回 None"""
+        def level(segment: Dict[str, Any]) -> int:
+            size = max(segment["end"] - segment["start"], 1)
+            return int(math.log(max(size / segment_rows, 1), merge_factor))
+
+        if len(self.segments) < merge_factor:
+            return None
+        last = level(self.segments[-1])
+        start = len(self.segments)
+        while start > 0 and level(self.segments[start - 1]) == last:
+            start -= 1
+        if len(self.segments) - start < merge_factor:
+            return None
+        return start, len(self.segments)
+
+    def clear(self):
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        self.generation = 0
+        self.rows = 0
+        self.dimension = None
+        self.segments = []
+        self._next_id = 0
+        logging.info(f"已清空分段存储: {self.directory}")
@@ -0,0 +1,79 @@
+"""
+全精度向量磁盘存储
+float32 行存储追加写入、内存映射读取，用于精确重排、索引训练与召回率评估
+"""
+
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np  # pyright: ignore[reportMissingImports]
+
+
+class RawVectorStore:
+    """行号即向量在索引中的编号"""
+
+    def __init__(self, file_path: Path, dimension: int):
+        self.file_path = Path(file_path)
+        self.dimension = dimension
+        self._mmap = None
+        self._mmap_rows = 0
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dimension * 4
+
+    def __len__(self) -> int:
+        if not self.file_path.exists():
+            return 0
+        return self.file_path.stat().st_size // self.row_bytes
+
+    def _view(self) -> np.ndarray:
+        rows = len(self)
+        if self._mmap is None or self._mmap_rows != rows:
+            if rows == 0:
+                self._mmap = np.empty((0, self.dimension), dtype=np.float32)
+            else:
+                self._mmap = np.memmap(self.file_path, dtype=np.float32, mode='r', shape=(rows, self.dimension))
+            self._mmap_rows = rows
+        return self._mmap
+
+    def append(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(f"向量维度 {vectors.shape[1]} 与存储维度 {self.dimension} 不一致")
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.file_path, 'ab') as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def put(self, ids: np.ndarray, vectors: np.ndarray):
+        """按编号覆盖写入已存在的行（用于回填缺失的向量）"""
+        self._mmap = None
+        view = np.memmap(self.file_path, dtype=np.float32, mode='r+', shape=(len(self), self.dimension))
+        view[np.asarray(ids, dtype=np.int64)] = vectors
+        view.flush()
+        del view
+
+    def get(self, ids: np.ndarray) -> np.ndarray:
+        """按编号读取向量（只触及对应的页）"""
+        return np.asarray(self._view()[np.asarray(ids, dtype=np.int64)])
+
+    def iter_batches(self, batch_size: int = 10000, start: int = 0, stop: Optional[int] = None) -> Iterator[np.ndarray]:
+        """分批顺序读取 [start, stop) 行"""
+        view = self._view()
+        stop = len(view) if stop is None else min(stop, len(view))
+        for begin in range(start, stop, batch_size):
+            yield np.asarray(view[begin:min(begin + batch_size, stop)])
+
+    def truncate(self, rows: int):
+        """截断到指定行数（用于丢弃写入索引前中断留下的多余向量）"""
+        self._mmap = None
+        with open(self.file_path, 'r+b') as f:
+            f.truncate(rows * self.row_bytes)
+
+    def clear(self):
+        self._mmap = None
+        if self.file_path.exists():
+            os.remove(self.file_path)
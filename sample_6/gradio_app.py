@@ -128,9 +128,11 @@ async def predict(message, history, model_selector, task_context, session_id, fi
         "task_id" : session_id
     }
     
-    # 添加知识库配置
-    if knowledge_base:
-        input_state["knowledge_base"] = knowledge_base
+    # 添加知识库配置（多选时联合检索）
+    knowledge_bases = [knowledge_base] if isinstance(knowledge_base, str) else list(knowledge_base or [])
+    if knowledge_bases:
+        input_state["knowledge_base"] = knowledge_bases[0]
+        input_state["knowledge_bases"] = knowledge_bases
     
     if file_obj is not None:
         input_state["files"] = [file_obj.name]
@@ -246,9 +248,10 @@ def main_page():
             from KnowledgeManager.FAISSKnowledgeManager import FAISSKnowledgeManager
             kb_list = FAISSKnowledgeManager.list_knowledge_bases()
             knowledge_base_selector = gr.Dropdown(
-                label="知识库选择", 
+                label="知识库选择（可多选，联合检索）", 
                 choices=kb_list,
-                value=kb_list[0] if kb_list else None,
+                value=kb_list[:1],
+                multiselect=True,
                 allow_custom_value=True
             )
 
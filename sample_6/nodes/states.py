@@ -29,11 +29,15 @@ class WritingState(TypedDict, total=False):
     knowledge_content: str
     chapter_knowledge: List[str]
     knowledge_base: str
+    knowledge_bases: List[str]  # 联合检索的多个知识库，设置时优先于 knowledge_base
+    prefetch_knowledge: bool  # 大纲生成后一次性批量检索全部章节的背景知识（默认关闭，逐章检索）
     search_mode: str
     search_k: int
     score_threshold: float
     vector_weight: float
     keyword_weight: float
+    hybrid_fusion: str  # 混合检索融合方式: weighted / rrf
+    search_filters: Dict[str, Any]  # 检索元数据过滤，如 {"filename": ["a.pdf"], "tags": "财务"}
 
     chapters: List[str] 
     chapter_details: List[Dict[str, str]]  # 存储章节详细信息：title 和 content
@@ -69,11 +73,15 @@ class Main_state(TypedDict, total=False):
     knowledge_content: str
     chapter_knowledge: List[str]
     knowledge_base: str
+    knowledge_bases: List[str]  # 联合检索的多个知识库，设置时优先于 knowledge_base
+    prefetch_knowledge: bool  # 大纲生成后一次性批量检索全部章节的背景知识（默认关闭，逐章检索）
     search_mode: str
     search_k: int
     score_threshold: float
     vector_weight: float
     keyword_weight: float
+    hybrid_fusion: str  # 混合检索融合方式: weighted / rrf
+    search_filters: Dict[str, Any]  # 检索元数据过滤，如 {"filename": ["a.pdf"], "tags": "财务"}
     search_results: List[Dict[str, Any]]
     summary_text: str
     merged_article: str  # 合并后的完整文章（Markdown格式）
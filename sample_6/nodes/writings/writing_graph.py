@@ -1,12 +1,19 @@
 from langgraph.graph import StateGraph, END, START
 from nodes.states import WritingState 
-from nodes.writings.writing_nodes import outline_node, plan_node, retrieval_node, generate_chapter_node, merge_article_node
+from nodes.writings.writing_nodes import outline_node, plan_node, retrieval_node, prefetch_knowledge_node, generate_chapter_node, merge_article_node
 import logging
 # def generate_outline(state: WritingState):
 #     # 根据 topic 生成大纲的逻辑
 #     return {"outline": "Generated Outline..."}
 
 
+def retrieval_router(state: WritingState):
+    """大纲生成后：预取模式一次性检索全部章节，否则逐章检索"""
+    if state.get("prefetch_knowledge", False):
+        return "prefetch"
+    return "per_chapter"
+
+
 def writing_router(state: WritingState):
     """
     控制循环逻辑：
@@ -18,6 +25,9 @@ def writing_router(state: WritingState):
     if curr_idx < total_count:
         # 如果还没写完，返回执行检索的节点名
         logging.info(f"Continue writing chapter {curr_idx + 1} of {total_count}...")
+        # 预取模式下各章背景知识已在 chapter_knowledge 中，直接生成下一章
+        if state.get("prefetch_knowledge", False):
+            return "continue_prefetched"
         return "continue_writing"
     else:
         # 如果写完了，流向结束或保存节点
@@ -31,6 +41,7 @@ writing_builder = StateGraph(WritingState)
 writing_builder.add_node("outline_node", outline_node)
 writing_builder.add_node("plan_node", plan_node)
 writing_builder.add_node("retrieval_node", retrieval_node)
+writing_builder.add_node("prefetch_knowledge_node", prefetch_knowledge_node)
 writing_builder.add_node("generate_chapter_node", generate_chapter_node)
 writing_builder.add_node("merge_article_node", merge_article_node)  # 添加合并节点
 # writing_builder.set_entry_point("plan_node")
@@ -38,7 +49,15 @@ writing_builder.add_node("merge_article_node", merge_article_node)  # 添加合
 writing_builder.add_edge(START, "plan_node")      # 从检索开始
 
 writing_builder.add_edge("plan_node", "outline_node")
-writing_builder.add_edge("outline_node", "retrieval_node")
+writing_builder.add_conditional_edges(
+    "outline_node",
+    retrieval_router,
+    {
+        "prefetch": "prefetch_knowledge_node",   # 一次性检索全部章节
+        "per_chapter": "retrieval_node"          # 逐章检索
+    }
+)
+writing_builder.add_edge("prefetch_knowledge_node", "generate_chapter_node")
 writing_builder.add_edge("retrieval_node", "generate_chapter_node")
 
 # 4. 关键：设置条件循环
@@ -47,6 +66,7 @@ writing_builder.add_conditional_edges(
     writing_router,       # 调用上面的路由函数
     {
         "continue_writing": "retrieval_node", # 如果路由说继续，回到 retrieval 开启下一章
+        "continue_prefetched": "generate_chapter_node",  # 已预取知识，直接生成下一章
         "finish": "merge_article_node"                   # 如果路由说结束，去合并节点
     }
 )
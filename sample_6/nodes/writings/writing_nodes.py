@@ -232,69 +232,87 @@ async def plan_node(state, config: RunnableConfig):
 #     }
 
 
+def _knowledge_bases(state) -> List[str]:
+    """多个知识库时联合检索，只有 knowledge_base 时检索单个库"""
+    return state.get("knowledge_bases") or ([state["knowledge_base"]] if state.get("knowledge_base") else [])
+
+
+def _chapter_query(state, idx: int):
+    """返回第 idx 章的 (标题, 检索查询语句)"""
+    outline = state.get("outline", [])
+    chapter_info = outline[idx] if idx < len(outline) else {}
+    chapter_title = chapter_info.get("title", f"第{idx + 1}章")
+    chapter_description = chapter_info.get("description", "")
+    return chapter_title, f"{state.get('topic', '')} {chapter_title} {chapter_description}"
+
+
+async def _search_knowledge(state, queries: List[str]) -> List[Dict[str, Any]]:
+    """按 state 中的检索配置联合检索全部知识库，全部失败时抛出异常"""
+    from KnowledgeManager.KnowledgeManagerFactory import KnowledgeManagerFactory
+    
+    knowledge_bases = _knowledge_bases(state)
+    search_mode = state.get('search_mode', 'hybrid')
+    logging.info(f"正在使用知识库 {knowledge_bases} 进行 {search_mode} 检索，共 {len(queries)} 个查询...")
+    # 全部查询一次批量向量化，各知识库并行做一次批量检索，按分数合并为全局 top-k；
+    # 首次使用或磁盘更新时在线程中加载索引，已加载的知识库直接复用
+    search_results = await KnowledgeManagerFactory.asearch_many_federated(
+        knowledge_bases,
+        queries,
+        k=state.get('search_k', 5),
+        search_mode=search_mode if search_mode in ("bm25", "hybrid") else "vector",
+        # 元数据过滤，例如 {"filename": [...]} 只引用用户指定的文件
+        filters=state.get('search_filters') or None,
+        score_threshold=state.get('score_threshold', 0.3),
+        vector_weight=state.get('vector_weight', 0.7),
+        keyword_weight=state.get('keyword_weight', 0.3),
+        fusion=state.get('hybrid_fusion')
+    )
+    for search_result in search_results:
+        if not search_result.get("success"):
+            raise RuntimeError(search_result.get("message", "知识库检索失败"))
+    for kb, message in search_results[0].get("failed", {}).items():
+        logging.warning(f"知识库 '{kb}' 检索失败: {message}")
+    return search_results
+
+
+def _knowledge_text(search_result: Dict[str, Any]) -> str:
+    """提取用于写作的上下文文本"""
+    knowledge_content = search_result.get("context", "")
+    if not knowledge_content and "context_list" in search_result:
+        # 如果 context 字段为空，尝试从列表拼接
+        knowledge_content = "\n".join([r.get("content", "") for r in search_result.get("context_list", [])])
+    return knowledge_content
+
+
+def _search_record(idx: int, chapter_title: str, search_result: Dict[str, Any]) -> Dict[str, Any]:
+    """检索历史记录"""
+    return {
+        "chapter": idx + 1,
+        "title": chapter_title,
+        "results_count": len(search_result.get("context_list", [])),
+        "sources": [r.get("metadata", {}).get("filename", "未知来源") for r in search_result.get("context_list", [])],
+        "knowledge_bases": [r.get("knowledge_base") for r in search_result.get("context_list", [])],
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
 async def retrieval_node(state, config: RunnableConfig):
     """知识检索节点：根据大纲和当前进度从知识库中检索相关内容"""
     logging.info(f"--- 🔍 [Retrieval Node] 检索第 {state.get('current_chapter', 0) + 1} 章相关知识 ---")
     
-    # 1. 提取基础参数
-    use_knowledge = state.get("use_knowledge", False)
-    knowledge_base = state.get("knowledge_base")
     curr_idx = state.get("current_chapter", 0)
-    outline = state.get("outline", [])
-    topic = state.get("topic", "")
-    
     # 如果不使用知识库或未指定知识库，直接跳过
-    if not use_knowledge or not knowledge_base:
+    if not state.get("use_knowledge", False) or not _knowledge_bases(state):
         logging.info("未使用知识库或未指定知识库，跳过检索环节")
         return {
             "knowledge_content": "",
             "last_successful_step": "retrieval_skipped"
         }
 
-    # 2. 准备检索信息
-    chapter_info = outline[curr_idx] if curr_idx < len(outline) else {}
-    chapter_title = chapter_info.get("title", f"第{curr_idx + 1}章")
-    chapter_description = chapter_info.get("description", "")
-    
-    # 构造检索查询语句
-    search_query = f"{topic} {chapter_title} {chapter_description}"
-    
-    # 获取检索配置参数（从 state 中获取，或者使用默认值）
-    search_mode = state.get('search_mode', 'hybrid')
-    search_k = state.get('search_k', 5)
-    score_threshold = state.get('score_threshold', 0.3)
-    
+    chapter_title, search_query = _chapter_query(state, curr_idx)
     try:
-        # 3. 动态导入知识库管理器
-        # 注意：这里假设 KnowledgeManager 文件夹已存在于项目中
-        from KnowledgeManager.KnowledgeManagerFactory import KnowledgeManagerFactory
-        
-        logging.info(f"正在使用知识库 '{knowledge_base}' 进行 {search_mode} 检索...")
-        km = KnowledgeManagerFactory.create_knowledge_manager(knowledge_base_name=knowledge_base)
-        
-        # 根据不同的搜索模式执行检索
-        if search_mode == "bm25":
-            search_result = km.search_bm25(search_query, k=search_k, score_threshold=score_threshold)
-        elif search_mode == "hybrid":
-            vector_weight = state.get('vector_weight', 0.7)
-            keyword_weight = state.get('keyword_weight', 0.3)
-            search_result = km.search_hybrid(
-                search_query, 
-                k=search_k, 
-                vector_weight=vector_weight, 
-                keyword_weight=keyword_weight,
-                score_threshold=score_threshold
-            )
-        else:
-            # 默认使用向量检索
-            search_result = km.search_with_details(search_query, k=search_k, score_threshold=score_threshold)
-        
-        # 4. 处理检索结果
-        # 提取用于写作的上下文文本
-        knowledge_content = search_result.get("context", "")
-        if not knowledge_content and "context_list" in search_result:
-             # 如果 context 字段为空，尝试从列表拼接
-             knowledge_content = "\n".join([r.get("content", "") for r in search_result.get("context_list", [])])
+        search_result = (await _search_knowledge(state, [search_query]))[0]
+        knowledge_content = _knowledge_text(search_result)
 
         # 按章节索引保存检索到的背景知识
         chapter_knowledge = state.get("chapter_knowledge", [])
@@ -302,15 +320,7 @@ async def retrieval_node(state, config: RunnableConfig):
             chapter_knowledge.append("")
         chapter_knowledge[curr_idx] = knowledge_content
 
-        # 记录检索历史记录
-        new_result_entry = {
-            "chapter": curr_idx + 1,
-            "title": chapter_title,
-            "results_count": len(search_result.get("context_list", [])),
-            "sources": [r.get("metadata", {}).get("filename", "未知来源") for r in search_result.get("context_list", [])],
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
+        new_result_entry = _search_record(curr_idx, chapter_title, search_result)
         search_results = state.get("search_results", [])
         search_results.append(new_result_entry)
         
@@ -333,6 +343,40 @@ async def retrieval_node(state, config: RunnableConfig):
             "last_successful_step": "retrieval_error"
         }
 
+
+async def prefetch_knowledge_node(state, config: RunnableConfig):
+    """知识预取节点：大纲生成后一次性为全部章节检索背景知识"""
+    chapter_count = max(len(state.get("outline", [])), state.get("chapter_count", 3))
+    logging.info(f"--- 🔍 [Prefetch Node] 预取全部 {chapter_count} 章相关知识 ---")
+    
+    if not state.get("use_knowledge", False) or not _knowledge_bases(state):
+        logging.info("未使用知识库或未指定知识库，跳过检索环节")
+        return {
+            "knowledge_content": "",
+            "last_successful_step": "retrieval_skipped"
+        }
+
+    chapters = [_chapter_query(state, idx) for idx in range(chapter_count)]
+    try:
+        search_results = await _search_knowledge(state, [query for _, query in chapters])
+    except Exception as e:
+        logging.error(f"知识检索过程出错: {str(e)}")
+        return {
+            "knowledge_content": "",
+            "chapter_knowledge": [""] * chapter_count,
+            "messages": [AIMessage(content=f"知识检索失败: {str(e)}，将基于模型自身知识写作。")],
+            "last_successful_step": "retrieval_error"
+        }
+    
+    records = [_search_record(idx, title, result) for idx, ((title, _), result) in enumerate(zip(chapters, search_results))]
+    logging.info(f"预取完成，各章分别找到 {[record['results_count'] for record in records]} 条相关记录")
+    return {
+        "chapter_knowledge": [_knowledge_text(result) for result in search_results],
+        "search_results": state.get("search_results", []) + records,
+        "messages": [AIMessage(content=f"已为全部 {chapter_count} 章检索到相关背景知识。")],
+        "last_successful_step": "retrieval"
+    }
+
 async def generate_chapter_node(state, config: RunnableConfig):
     """手动管理列表的生成节点"""
     logging.info(f"--- ✍️ 生成第 {state.get('current_chapter', 0) + 1} 章正文 ---")
@@ -25,6 +25,12 @@ def render_knowledge_page():
             
             with gr.Accordion("管理操作", open=False):
                 new_kb_name = gr.Textbox(label="新知识库名称", placeholder="输入名称后点击创建")
+                new_kb_encoding = gr.Dropdown(
+                    label="向量存储精度",
+                    choices=["fp32", "fp16", "sq8", "pq"],
+                    value="fp32",
+                    info="fp16/sq8/pq 压缩向量以节省内存，检索时用全精度向量精确重排"
+                )
                 create_kb_btn = gr.Button("创建新知识库", variant="secondary", size="sm")
                 gr.Markdown("---")
                 delete_kb_btn = gr.Button("删除选中知识库", variant="stop", size="sm")
@@ -58,11 +64,15 @@ def render_knowledge_page():
                             )
                     
                     use_hybrid_splitter = gr.Checkbox(label="使用混合标题分割器", value=True)
+                    upload_tags = gr.Textbox(label="标签 (可选，逗号分隔)", placeholder="例如: 财务, 2024年报")
                     
                     upload_btn = gr.Button("开始解析并入库", variant="primary")
                     
                     gr.Markdown("---")
                     gr.Markdown("#### 危险操作")
+                    with gr.Row():
+                        remove_source = gr.Textbox(label="按来源删除 (文件名或路径，支持 * 通配符)", placeholder="例如: a.pdf 或 *.docx", scale=3)
+                        remove_source_btn = gr.Button("删除匹配片段", variant="stop", scale=1)
                     clear_kb_btn = gr.Button("清空当前知识库内容", variant="stop")
 
                 # Tab 2: 检索测试
@@ -82,6 +92,10 @@ def render_knowledge_page():
                             minimum=0.0, maximum=1.0, value=0.3, step=0.05, label="相似度阈值"
                         )
                     
+                    with gr.Row():
+                        filter_files = gr.Textbox(label="限定来源文件 (可选，逗号分隔)", placeholder="例如: a.pdf, b.docx")
+                        filter_tags = gr.Textbox(label="限定标签 (可选，逗号分隔)")
+                    
                     search_btn = gr.Button("执行检索", variant="primary")
                     
                     gr.Markdown("#### 检索结果")
@@ -94,12 +108,11 @@ def render_knowledge_page():
         kbs = FAISSKnowledgeManager.list_knowledge_bases()
         return gr.update(choices=kbs)
 
-    def handle_create_kb(name):
+    def handle_create_kb(name, encoding):
         if not name:
             return "状态: <span style='color:red'>请输入知识库名称</span>", gr.update()
         try:
-            km = KnowledgeManagerFactory.create_knowledge_manager(knowledge_base_name=name)
-            km.initialize()
+            km = KnowledgeManagerFactory.create_knowledge_manager(knowledge_base_name=name, vector_encoding=encoding)
             return f"状态: <span style='color:green'>知识库 '{name}' 创建成功</span>", gr.update(choices=FAISSKnowledgeManager.list_knowledge_bases(), value=name)
         except Exception as e:
             return f"状态: <span style='color:red'>创建失败: {str(e)}</span>", gr.update()
@@ -108,7 +121,7 @@ def render_knowledge_page():
         if not name:
             return "状态: <span style='color:red'>请先选择知识库</span>", gr.update()
         try:
-            res = FAISSKnowledgeManager.delete_knowledge_base_by_name(name)
+            res = KnowledgeManagerFactory.delete_knowledge_base(name)
             if res.get("success"):
                 kbs = FAISSKnowledgeManager.list_knowledge_bases()
                 new_val = kbs[0] if kbs else None
@@ -123,7 +136,6 @@ def render_knowledge_page():
             return {"error": "未选择知识库"}
         try:
             km = KnowledgeManagerFactory.create_knowledge_manager(knowledge_base_name=name)
-            km.initialize()
             return km.get_stats()
         except Exception as e:
             return {"error": str(e)}
@@ -133,76 +145,57 @@ def render_knowledge_page():
             return "状态: <span style='color:red'>请先选择知识库</span>"
         try:
             km = KnowledgeManagerFactory.create_knowledge_manager(knowledge_base_name=name)
-            km.initialize()
             km.clear_knowledge_base()
             return f"状态: <span style='color:green'>知识库 '{name}' 已清空</span>"
         except Exception as e:
             return f"状态: <span style='color:red'>清空失败: {str(e)}</span>"
 
-    def handle_upload(files, kb_name, c_size, c_overlap, use_hybrid):
+    def handle_remove_source(name, pattern):
+        if not name:
+            return "状态: <span style='color:red'>请先选择知识库</span>"
+        if not pattern or not pattern.strip():
+            return "状态: <span style='color:red'>请输入要删除的来源</span>"
+        try:
+            km = KnowledgeManagerFactory.create_knowledge_manager(knowledge_base_name=name)
+            res = km.remove_by_source(pattern.strip())
+            if res.get("success"):
+                return f"状态: <span style='color:green'>{res['message']}</span>"
+            return f"状态: <span style='color:red'>{res.get('message')}</span>"
+        except Exception as e:
+            return f"状态: <span style='color:red'>删除失败: {str(e)}</span>"
+
+    def _split_csv(text):
+        return [item.strip() for item in (text or "").replace("，", ",").split(",") if item.strip()]
+
+    def handle_upload(files, kb_name, c_size, c_overlap, use_hybrid, tags_text):
         if not kb_name:
             return "状态: <span style='color:red'>请先选择或创建知识库</span>", {}
         if not files:
             return "状态: <span style='color:red'>未上传文件</span>", {}
         
         try:
-            km = KnowledgeManagerFactory.create_knowledge_manager(
-                knowledge_base_name=kb_name,
-                chunk_size=c_size,
-                chunk_overlap=c_overlap,
-                use_hybrid_splitter=use_hybrid
-            )
-            km.initialize()
-            
-            from KnowledgeManager.knowledge_extractor import knowledge_extractor
-            import numpy as np
-            import faiss
-            
-            all_chunks = []
-            all_metadata = []
+            km = KnowledgeManagerFactory.create_knowledge_manager(knowledge_base_name=kb_name)
             
+            files_info = []
             for file_obj in files:
-                # Gradio 的 file_obj.name 是临时路径
-                doc = knowledge_extractor.extract_from_file(file_obj.name)
-                if doc:
-                    # 修正 doc 中的文件名，原始 filename 在 file_obj.name 路径最后
-                    original_name = Path(file_obj.orig_name if hasattr(file_obj, 'orig_name') else file_obj.name).name
-                    doc["filename"] = original_name
-                    
-                    chunks = km.text_splitter.split_text(doc["content"])
-                    for chunk in chunks:
-                        if len(chunk) >= 3:
-                            all_chunks.append(chunk)
-                            all_metadata.append({
-                                "source": original_name,
-                                "filename": original_name,
-                                "format": doc["format"],
-                                "knowledge_base": kb_name,
-                            })
+                # Gradio 的 file_obj.name 是临时路径，原始文件名作为来源标识，重新上传同名文件时按内容哈希判断是否需要更新
+                original_name = Path(file_obj.orig_name if hasattr(file_obj, 'orig_name') else file_obj.name).name
+                files_info.append({"path": file_obj.name, "source": original_name, "filename": original_name})
             
-            if not all_chunks:
+            res = km.ingest_files(files_info, _split_csv(tags_text), chunk_size=c_size, chunk_overlap=c_overlap,
+                                  use_hybrid_splitter=use_hybrid)
+            if not res.get("success"):
+                return f"状态: <span style='color:red'>入库失败: {res.get('message')}</span>", {}
+            if res["chunks_count"] == 0 and res["skipped"] == 0:
                 return "状态: <span style='color:orange'>未从上传文件中提取到有效内容</span>", {}
-                
-            embeddings = km.embeddings.embed_documents(all_chunks)
-            embeddings_array = np.array(embeddings, dtype=np.float32)
-            faiss.normalize_L2(embeddings_array)
-            
-            if km.index.ntotal == 0 and embeddings_array.shape[1] != km.dimension:
-                km.dimension = embeddings_array.shape[1]
-                km.index = faiss.IndexFlatIP(km.dimension)
-
-            km.index.add(embeddings_array)
-            km.texts.extend(all_chunks)
-            km.metadata.extend(all_metadata)
-            km._save_index()
             
             stats = km.get_stats()
-            return f"状态: <span style='color:green'>成功入库 {len(all_chunks)} 个片段</span>", stats
+            return f"状态: <span style='color:green'>{res['message']}</span>", stats
         except Exception as e:
             logging.error(f"入库失败: {str(e)}")
             return f"状态: <span style='color:red'>入库失败: {str(e)}</span>", {}
 
-    def handle_search(kb_name, query, k, mode, threshold):
+    def handle_search(kb_name, query, k, mode, threshold, files_text, tags_text):
         if not kb_name:
             return "请选择知识库", {}
         if not query:
@@ -210,13 +203,19 @@ def render_knowledge_page():
             
         try:
             km = KnowledgeManagerFactory.create_knowledge_manager(knowledge_base_name=kb_name)
+            filters = {}
+            if _split_csv(files_text):
+                filters["filename"] = _split_csv(files_text)
+            if _split_csv(tags_text):
+                filters["tags"] = _split_csv(tags_text)
+            filters = filters or None
             
             if mode == "bm25":
-                res = km.search_bm25(query, k=k, score_threshold=threshold)
+                res = km.search_bm25(query, k=k, filters=filters, score_threshold=threshold)
             elif mode == "hybrid":
-                res = km.search_hybrid(query, k=k, score_threshold=threshold)
+                res = km.search_hybrid(query, k=k, filters=filters, score_threshold=threshold)
             else:
-                res = km.search_with_details(query, k=k, score_threshold=threshold)
+                res = km.search_with_details(query, k=k, filters=filters, score_threshold=threshold)
                 
             if not res.get("success"):
                 return f"搜索失败: {res.get('message', '未知错误')}", res
@@ -239,7 +238,7 @@ def render_knowledge_page():
     
     create_kb_btn.click(
         handle_create_kb, 
-        inputs=new_kb_name, 
+        inputs=[new_kb_name, new_kb_encoding], 
         outputs=[status_box, kb_selector]
     )
     
@@ -256,14 +255,18 @@ def render_knowledge_page():
         handle_get_stats, inputs=kb_selector, outputs=kb_stats_json
     )
     
+    remove_source_btn.click(handle_remove_source, inputs=[kb_selector, remove_source], outputs=status_box).then(
+        handle_get_stats, inputs=kb_selector, outputs=kb_stats_json
+    )
+    
     upload_btn.click(
         handle_upload, 
-        inputs=[file_input, kb_selector, chunk_size_slider, chunk_overlap_slider, use_hybrid_splitter], 
+        inputs=[file_input, kb_selector, chunk_size_slider, chunk_overlap_slider, use_hybrid_splitter, upload_tags], 
         outputs=[status_box, kb_stats_json]
     )
     
     search_btn.click(
         handle_search, 
-        inputs=[kb_selector, search_query, search_k_slider, search_mode, score_threshold], 
+        inputs=[kb_selector, search_query, search_k_slider, search_mode, score_threshold, filter_files, filter_tags], 
         outputs=[search_output, search_details]
     )
@@ -0,0 +1,84 @@
+import sys
+import time
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from Config.model_config import RAG_CONFIG  # noqa: E402
+
+EMBED_MODEL = "test-embed"
+DIMENSION = 32
+
+
+class FakeEmbeddings:
+    """按文本哈希生成确定的随机单位向量，相同文本得到相同向量"""
+
+    def __init__(self, dimension: int = DIMENSION):
+        self.dimension = dimension
+        self.calls = 0
+
+    def _vector(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return self._vector(text)
+
+    def cache_stats(self):
+        return None
+
+
+@pytest.fixture
+def rag_config(tmp_path, monkeypatch):
+    """知识库目录指向临时目录，注册测试用 embedding 模型，索引配置可在用例中修改"""
+    faiss_config = dict(RAG_CONFIG["vector_store"].get("faiss", {}))
+    faiss_config.update({"base_directory": str(tmp_path / "kb"), "index_prefix": "index_",
+                         "metadata_prefix": "meta_", "index": {}})
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "faiss", faiss_config)
+    monkeypatch.setitem(RAG_CONFIG["embeddings"], "models", {
+        **RAG_CONFIG["embeddings"].get("models", {}),
+        EMBED_MODEL: {"base_url": "http://127.0.0.1:9/v1", "api_key": "test", "model": EMBED_MODEL,
+                      "dimension": DIMENSION}
+    })
+    monkeypatch.setitem(RAG_CONFIG["embeddings"], "cache", {"enabled": False})
+    monkeypatch.setitem(RAG_CONFIG, "ingestion", dict(RAG_CONFIG.get("ingestion", {})))
+    # 解析在当前进程中进行，工作进程看不到用例对配置的修改
+    from KnowledgeManager import extraction_pool
+    monkeypatch.setattr(extraction_pool, "EXTRACTION_CONFIG", {"workers": 1})
+    return RAG_CONFIG
+
+
+@pytest.fixture
+def make_kb(rag_config):
+    """创建使用 FakeEmbeddings 的 FAISS 知识库"""
+    from KnowledgeManager.FAISSKnowledgeManager import FAISSKnowledgeManager
+
+    def make(name: str = "kb", **kwargs):
+        manager = FAISSKnowledgeManager(name, embedding_model=EMBED_MODEL, **kwargs)
+        manager.embeddings = FakeEmbeddings()
+        manager.initialize()
+        return manager
+    return make
+
+
+def wait_for_maintenance(manager, timeout: float = 30):
+    """等待后台封存、合并、压缩完成"""
+    deadline = time.monotonic() + timeout
+    while manager._maintenance_thread is not None and manager._maintenance_thread.is_alive():
+        assert time.monotonic() < deadline, "后台维护超时"
+        time.sleep(0.02)
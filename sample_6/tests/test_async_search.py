@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def manager(make_kb):
+    manager = make_kb()
+    texts = [f"异步 检索 第{i}段 关键词{i}" for i in range(120)]
+    manager.add_chunks(texts, [{"source": f"s{i % 2}.txt", "filename": f"s{i % 2}.txt"} for i in range(120)])
+    return manager
+
+
+def _ids(result):
+    assert result["success"], result
+    return [item["chunk_id"] for item in result["context_list"]]
+
+
+def test_async_search_matches_sync(manager):
+    query = "异步 检索 第42段 关键词42"
+
+    def no_sync_embedding(text):
+        raise AssertionError("异步检索不应调用同步 embedding")
+
+    sync_vector = _ids(manager.search(query, k=5, score_threshold=0, filters={"source": "s0.txt"}))
+    sync_hybrid = _ids(manager.search_hybrid(query, k=5, score_threshold=0))
+    manager.embeddings.embed_query = no_sync_embedding
+
+    async def run():
+        return await asyncio.gather(
+            manager.asearch(query, k=5, score_threshold=0, filters={"source": "s0.txt"}),
+            manager.asearch_hybrid(query, k=5, score_threshold=0),
+            manager.asearch_bm25("关键词42", k=5, score_threshold=0),
+        )
+
+    vector, hybrid, bm25 = asyncio.run(run())
+    assert _ids(vector) == sync_vector
+    assert _ids(hybrid) == sync_hybrid
+    assert _ids(bm25)[0] == "kb:42"
+
+
+def test_async_search_reports_errors(manager):
+    async def failing(text):
+        raise RuntimeError("embedding 服务不可用")
+
+    manager.embeddings.aembed_query = failing
+    result = asyncio.run(manager.asearch("任意", k=3))
+    assert result == {"success": False, "message": "embedding 服务不可用"}
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from KnowledgeManager.bm25_index import BM25Index, search_segments, tokenize
+
+DOCS = [
+    "apple banana cherry",
+    "banana cherry durian",
+    "cherry durian elder",
+    "durian elder fig",
+]
+
+
+def _index(texts=DOCS) -> BM25Index:
+    index = BM25Index()
+    index.add_documents(list(texts))
+    return index
+
+
+def test_tokenize_mixes_cjk_and_latin():
+    tokens = tokenize("FAISS 索引 v1.2")
+    assert "faiss" in tokens and "v1.2" in tokens
+    assert any("索引" in token or token in ("索", "引") for token in tokens)
+
+
+def test_scores_are_normalized_and_ranked():
+    hits = _index().search("apple", k=4)
+    # 平均长度的文档出现一次全部查询词记为 1 / (k1 + 1)
+    assert hits == [(0, pytest.approx(1 / 2.5))]
+    hits = _index().search("banana durian", k=4)
+    assert hits[0][0] == 1
+    assert all(0 < score <= 1 for _, score in hits)
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+
+
+def test_term_frequency_keeps_strict_order():
+    index = _index(["apple pie", "apple apple apple pie", "apple apple pie", "cherry pie", "cherry tart"])
+    hits = index.search("apple", k=5)
+    assert [doc for doc, _ in hits] == [1, 2, 0]
+    scores = [score for _, score in hits]
+    assert scores[0] > scores[1] > scores[2]
+    assert all(0 < score < 1 for score in scores)
+
+
+def test_mask_excludes_documents():
+    mask = np.array([True, False, True, True])
+    assert [doc for doc, _ in _index().search("banana", k=4, mask=mask)] == [0]
+
+
+def test_save_load_roundtrip(tmp_path):
+    index = _index()
+    index.save(tmp_path / "bm25.npz")
+    loaded = BM25Index.load(tmp_path / "bm25.npz")
+    for query in ("cherry", "durian fig", "apple elder"):
+        assert loaded.search(query, k=4) == index.search(query, k=4)
+
+
+def test_extended_does_not_modify_original():
+    index = _index(DOCS[:2])
+    extended = index.extended(DOCS[2:])
+    assert index.num_docs == 2 and extended.num_docs == 4
+    assert index.search("fig", k=4) == []
+    assert extended.search("fig", k=4)[0][0] == 3
+
+
+def test_concat_and_segment_search_match_single_index():
+    whole = _index()
+    parts = [_index(DOCS[:2]), _index(DOCS[2:])]
+    assert BM25Index.concat(parts).search("cherry durian", k=4) == whole.search("cherry durian", k=4)
+    segmented = search_segments([(0, parts[0]), (2, parts[1])], "cherry durian", k=4)
+    assert [doc for doc, _ in segmented] == [doc for doc, _ in whole.search("cherry durian", k=4)]
+
+
+def test_search_bm25_persists_with_knowledge_base(make_kb):
+    manager = make_kb()
+    manager.add_chunks(DOCS, [{"source": f"d{i}.txt", "filename": f"d{i}.txt"} for i in range(len(DOCS))])
+    expected = manager.search_bm25("apple", k=2, score_threshold=0)["context_list"]
+    assert expected[0]["source"] == "d0.txt"
+
+    reloaded = make_kb()
+    assert reloaded.search_bm25("apple", k=2, score_threshold=0)["context_list"] == expected
@@ -0,0 +1,44 @@
+from KnowledgeManager.chunk_store import ChunkStore
+
+
+def test_append_and_reopen_round_trip(tmp_path):
+    store = ChunkStore(tmp_path / "chunks")
+    store.append(["第一段", "second"], [{"source": "a.md", "tags": ["x", "y"]}, {"source": "b.md"}])
+    store.append(["第三段"], [{"source": "a.md", "page_start": 3}])
+
+    reopened = ChunkStore(tmp_path / "chunks")
+    assert len(reopened) == 3
+    assert list(reopened.iter_texts()) == ["第一段", "second", "第三段"]
+    assert list(reopened.iter_texts(1, 2)) == ["second"]
+    assert reopened.get_metadata(0) == {"source": "a.md", "tags": ["x", "y"]}
+    # 后增加的列为历史片段回填为缺失
+    assert reopened.get_metadata(1) == {"source": "b.md"}
+    assert reopened.get_metadata(2) == {"source": "a.md", "page_start": 3}
+    assert reopened.column_values("source") == ["a.md", "b.md"]
+    assert reopened.column_codes("source").tolist() == [0, 1, 0]
+    assert reopened.column_codes("missing") is None
+
+
+def test_truncate_then_append_discards_stale_bytes(tmp_path):
+    store = ChunkStore(tmp_path / "chunks")
+    store.append(["aaa", "bbb", "ccc"], [{"source": "a"}, {"source": "b"}, {"source": "c"}])
+    store.truncate(1)
+    store.append(["ddd"], [{"source": "d"}])
+
+    reopened = ChunkStore(tmp_path / "chunks")
+    assert list(reopened.iter_texts()) == ["aaa", "ddd"]
+    assert [reopened.get_metadata(i)["source"] for i in range(2)] == ["a", "d"]
+    assert (tmp_path / "chunks" / "text.bin").stat().st_size == reopened.text_bytes
+
+
+def test_uncommitted_append_is_ignored(tmp_path):
+    store = ChunkStore(tmp_path / "chunks")
+    store.append(["aaa"], [{"source": "a"}])
+    # 模拟写入中断：数据已追加但 columns.json 未提交
+    with open(store.text_file, 'ab') as f:
+        f.write("残留".encode('utf-8'))
+
+    reopened = ChunkStore(tmp_path / "chunks")
+    assert len(reopened) == 1
+    reopened.append(["bbb"], [{"source": "b"}])
+    assert list(reopened.iter_texts()) == ["aaa", "bbb"]
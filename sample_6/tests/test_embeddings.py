@@ -0,0 +1,195 @@
+import asyncio
+import threading
+
+import httpx
+import numpy as np
+import openai
+import pytest
+
+from conftest import EMBED_MODEL
+from KnowledgeManager.Dependencies.Embeddings import LocalEmbeddings
+
+REQUEST = httpx.Request("POST", "http://127.0.0.1:9/v1/embeddings")
+
+
+class _Data:
+    def __init__(self, index, embedding):
+        self.index = index
+        self.embedding = embedding
+
+
+class _Response:
+    def __init__(self, texts):
+        self.data = [_Data(i, [float(len(text)), 1.0]) for i, text in enumerate(texts)]
+
+
+class FlakyClient:
+    """按顺序抛出给定的错误，之后正常返回"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+        self.embeddings = self
+
+    def create(self, input, model):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return _Response(input)
+
+
+def _status_error(cls, status):
+    return cls("error", response=httpx.Response(status, request=REQUEST), body=None)
+
+
+@pytest.fixture
+def embeddings(rag_config, monkeypatch):
+    monkeypatch.setitem(rag_config["embeddings"], "retry_backoff", 0)
+    return LocalEmbeddings(EMBED_MODEL)
+
+
+def test_permanent_errors_are_not_retried(embeddings):
+    embeddings.client = FlakyClient([_status_error(openai.AuthenticationError, 401)])
+    with pytest.raises(openai.AuthenticationError):
+        embeddings.embed_documents(["a"])
+    assert embeddings.client.calls == 1
+
+
+@pytest.mark.parametrize("error", [
+    _status_error(openai.RateLimitError, 429),
+    _status_error(openai.InternalServerError, 503),
+    openai.APIConnectionError(request=REQUEST),
+    openai.APITimeoutError(request=REQUEST),
+])
+def test_transient_errors_are_retried(embeddings, error):
+    embeddings.client = FlakyClient([error])
+    assert embeddings.embed_documents(["ab"]) == [[2.0, 1.0]]
+    assert embeddings.client.calls == 2
+
+
+def test_async_cache_io_runs_off_the_event_loop(embeddings):
+    loop_threads = set()
+    io_threads = []
+
+    class RecordingCache:
+        def get_many(self, texts):
+            io_threads.append(threading.current_thread())
+            return [None] * len(texts), [text.encode() for text in texts]
+
+        def put_many(self, keys, vectors):
+            io_threads.append(threading.current_thread())
+
+    class AsyncClient:
+        def __init__(self):
+            self.embeddings = self
+
+        async def create(self, input, model):
+            return _Response(input)
+
+    embeddings.cache = RecordingCache()
+    embeddings._async_clients = {}
+
+    async def run():
+        loop_threads.add(threading.current_thread())
+        embeddings._async_clients[asyncio.get_running_loop()] = AsyncClient()
+        return await embeddings.aembed_documents(["a", "bb"])
+
+    assert asyncio.run(run()) == [[1.0, 1.0], [2.0, 1.0]]
+    assert len(io_threads) == 2
+    assert not loop_threads & set(io_threads)
+
+
+def test_batches_respect_count_and_token_budget(embeddings):
+    embeddings.batch_size = 3
+    embeddings.max_batch_tokens = 10
+    embeddings.count_tokens = len
+    texts = ["aaaa", "bbbb", "c", "dd", "e", "ffffffffffff", "g"]
+    assert embeddings._plan_batches(texts) == [(0, 3), (3, 5), (5, 6), (6, 7)]
+
+
+def test_concurrent_batches_keep_input_order(embeddings):
+    class ShuffledClient:
+        """乱序返回 data，并记录每批的大小"""
+
+        def __init__(self):
+            self.embeddings = self
+            self.sizes = []
+            self.lock = threading.Lock()
+
+        def create(self, input, model):
+            with self.lock:
+                self.sizes.append(len(input))
+            response = _Response(input)
+            response.data.reverse()
+            return response
+
+    embeddings.batch_size = 4
+    embeddings.max_concurrency = 3
+    embeddings.client = ShuffledClient()
+    texts = ["x" * n for n in range(1, 12)]
+    assert embeddings.embed_documents(texts) == [[float(n), 1.0] for n in range(1, 12)]
+    assert sorted(embeddings.client.sizes) == [3, 4, 4]
+
+
+
+def test_async_sessions_share_the_model_inflight_limit(embeddings, monkeypatch):
+    from KnowledgeManager.Dependencies import Embeddings
+
+    monkeypatch.setattr(Embeddings, "_inflight_limits", {})
+    state = {"active": 0, "peak": 0}
+
+    class SlowAsyncClient:
+        def __init__(self):
+            self.embeddings = self
+
+        async def create(self, input, model):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.02)
+            state["active"] -= 1
+            return _Response(input)
+
+    embeddings.batch_size = 1
+    embeddings.max_concurrency = 2
+    embeddings._async_clients = {}
+
+    async def session(texts):
+        embeddings._async_clients[asyncio.get_running_loop()] = SlowAsyncClient()
+        return await embeddings.aembed_documents(texts)
+
+    async def run():
+        # 多个并发会话各自调用，合计的在途请求数仍不超过模型的上限
+        return await asyncio.gather(*(session([f"{i}-{j}" for j in range(4)]) for i in range(3)))
+
+    results = asyncio.run(run())
+    assert [len(result) for result in results] == [4, 4, 4]
+    assert state["peak"] == 2
+
+
+def test_cache_rows_stay_aligned_across_processes(tmp_path):
+    from KnowledgeManager.Dependencies.embedding_cache import EmbeddingCache, text_key
+
+    # 两个实例模拟两个进程共用同一缓存目录
+    first = EmbeddingCache(tmp_path, memory_items=1)
+    second = EmbeddingCache(tmp_path, memory_items=1)
+    first.put_many([text_key("alpha")], [[1.0, 0.0]])
+    second.put_many([text_key("beta")], [[0.0, 1.0]])
+    second.put_many([text_key("gamma")], [[0.5, 0.5]])
+
+    vectors, _ = second.get_many(["beta", "alpha"])
+    assert vectors[0].tolist() == [0.0, 1.0]
+    assert vectors[1] is None
+
+    reopened = EmbeddingCache(tmp_path)
+    vectors, _ = reopened.get_many(["alpha", "beta", "gamma"])
+    assert [vector.tolist() for vector in vectors] == [[1.0, 0.0], [0.0, 1.0], [0.5, 0.5]]
+
+
+def test_cache_ignores_rows_whose_key_does_not_match(tmp_path):
+    from KnowledgeManager.Dependencies.embedding_cache import EmbeddingCache, text_key
+
+    cache = EmbeddingCache(tmp_path, memory_items=1)
+    cache.put_many([text_key("alpha"), text_key("beta")], [[1.0, 0.0], [0.0, 1.0]])
+    cache._recent[text_key("gamma")] = 0
+    vectors, _ = cache.get_many(["gamma"])
+    assert vectors == [None]
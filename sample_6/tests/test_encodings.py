@@ -0,0 +1,42 @@
+import pytest
+
+from conftest import wait_for_maintenance
+
+
+def _fill(manager, rows: int, batch: int = 100):
+    for start in range(0, rows, batch):
+        texts = [f"编码 {i} 文本 token{i}" for i in range(start, start + batch)]
+        manager.add_chunks(texts, [{"source": "a.txt", "filename": "a.txt"}] * batch)
+        wait_for_maintenance(manager)
+
+
+@pytest.mark.parametrize("encoding", ["fp16", "sq8", "pq"])
+def test_compressed_encoding_rescores_with_full_precision(make_kb, rag_config, encoding):
+    rag_config["vector_store"]["faiss"]["index"].update({
+        "type": "ivf_flat", "segment_rows": 100, "promote_threshold": 300, "nlist": 8, "pq_m": 8, "pq_nbits": 4
+    })
+    manager = make_kb(vector_encoding=encoding)
+    _fill(manager, 600)
+
+    stats = manager.get_stats()
+    assert stats["vector_encoding"] == encoding
+    assert stats["compression_ratio"] > 1
+    assert stats["recall_at_10_rescored"] >= stats["recall_at_10"]
+    for row in (0, 250, 599):
+        text = f"编码 {row} 文本 token{row}"
+        top = manager.search(text, k=5, score_threshold=0)["context_list"][0]
+        assert top["chunk_id"] == f"kb:{row}"
+        assert top["score"] == pytest.approx(1.0, abs=1e-4)
+
+
+def test_encoding_is_fixed_at_creation(make_kb, rag_config):
+    manager = make_kb(vector_encoding="sq8")
+    _fill(manager, 100)
+
+    reopened = make_kb(vector_encoding="fp16")
+    assert reopened.index_config["encoding"] == "sq8"
+
+
+def test_unknown_encoding_is_rejected(make_kb):
+    with pytest.raises(ValueError):
+        make_kb(vector_encoding="int4")
@@ -0,0 +1,65 @@
+import os
+
+from KnowledgeManager import knowledge_extractor as extractor_module
+from KnowledgeManager.extraction_cache import ExtractionCache
+from KnowledgeManager.knowledge_extractor import KnowledgeExtractor
+
+
+def _cache(tmp_path, max_bytes: int = 2 ** 20) -> ExtractionCache:
+    return ExtractionCache(tmp_path / "cache", max_bytes, [".html", ".pdf"])
+
+
+def test_entries_are_keyed_by_hash_extension_and_version(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("ab" * 32, ".PDF", 2, {"content": "正文", "pages": [[1, 0]]})
+
+    assert cache.get("ab" * 32, ".pdf", 2) == {"content": "正文", "pages": [[1, 0]]}
+    assert cache.get("ab" * 32, ".pdf", 3) is None
+    assert cache.get("ab" * 32, ".html", 2) is None
+    assert cache.counters == {"hits": 1, "misses": 2}
+    assert cache.accepts(".HTML") and not cache.accepts(".txt")
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("cd" * 32, ".html", 1, {"content": "x"})
+    cache._path("cd" * 32, ".html", 1).write_bytes(b"not zlib")
+    assert cache.get("cd" * 32, ".html", 1) is None
+
+
+def test_prune_removes_least_recently_used_entries(tmp_path):
+    cache = _cache(tmp_path, max_bytes=4000)
+    payload = {"content": os.urandom(600).hex()}
+    keys = [f"{i:02d}" * 32 for i in range(6)]
+    for age, key in enumerate(keys):
+        cache.put(key, ".html", 1, payload)
+        mtime = 1_000_000 + age
+        os.utime(cache._path(key, ".html", 1), (mtime, mtime))
+    cache._prune()
+
+    remaining = [key for key in keys if cache._path(key, ".html", 1).exists()]
+    assert 0 < len(remaining) < len(keys)
+    assert remaining == keys[-len(remaining):]
+    assert sum(cache._path(key, ".html", 1).stat().st_size for key in remaining) <= 4000
+
+
+def test_extractor_reuses_cached_text(tmp_path, monkeypatch):
+    cache = _cache(tmp_path)
+    monkeypatch.setattr(extractor_module, "get_extraction_cache", lambda: cache)
+    page = tmp_path / "page.html"
+    page.write_text("<html><body><p>缓存的正文</p></body></html>", encoding="utf-8")
+    extractor = KnowledgeExtractor()
+
+    first = extractor.extract_from_file(str(page))
+    assert first["content"] == "缓存的正文"
+
+    def no_parse(file_path):
+        raise AssertionError("命中缓存时不应重新解析")
+
+    extractor.supported_formats[".html"] = no_parse
+    assert extractor.extract_from_file(str(page)) == first
+    assert cache.counters == {"hits": 1, "misses": 1}
+
+    page.write_text("<p>新内容</p>", encoding="utf-8")
+    extractor.supported_formats[".html"] = KnowledgeExtractor()._extract_html
+    assert extractor.extract_from_file(str(page))["content"] == "新内容"
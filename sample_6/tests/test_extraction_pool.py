@@ -0,0 +1,25 @@
+from KnowledgeManager.extraction_pool import ExtractionPool
+
+
+def _tasks(tmp_path, count: int):
+    tasks = []
+    for i in range(count):
+        path = tmp_path / f"doc{i}.txt"
+        path.write_text(f"文档 {i} 的内容。" * 20, encoding="utf-8")
+        tasks.append((i, {"file_path": str(path), "compute_hash": True}))
+    return tasks
+
+
+def test_single_file_is_parsed_in_process(rag_config, tmp_path):
+    with ExtractionPool(workers=4) as pool:
+        results = list(pool.imap(_tasks(tmp_path, 1)))
+        assert pool._workers == []
+    assert results[0][1]["document"]["content"].startswith("文档 0")
+
+
+def test_workers_are_capped_at_task_count(rag_config, tmp_path):
+    with ExtractionPool(workers=4) as pool:
+        results = list(pool.imap(iter(_tasks(tmp_path, 2)), ordered=True))
+        assert len(pool._workers) == 2
+    assert [key for key, _ in results] == [0, 1]
+    assert all(result["error"] is None for _, result in results)
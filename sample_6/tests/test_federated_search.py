@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from conftest import FakeEmbeddings
+from KnowledgeManager import federated_search
+from KnowledgeManager.federated_search import merge_results
+
+
+def _item(score, content):
+    return {"score": score, "content": content, "metadata": {"filename": f"{content}.txt"}}
+
+
+def test_merge_results_takes_global_top_k():
+    merged = merge_results([
+        ("a", {"success": True, "context_list": [_item(0.9, "a1"), _item(0.5, "a2")]}),
+        ("b", {"success": True, "context_list": [_item(0.8, "b1"), _item(0.7, "b2")]}),
+        ("c", {"success": False, "message": "加载失败"}),
+    ], k=3)
+    assert merged["success"]
+    assert [(item["knowledge_base"], item["content"]) for item in merged["context_list"]] == [
+        ("a", "a1"), ("b", "b1"), ("b", "b2")]
+    assert merged["failed"] == {"c": "加载失败"}
+
+    all_failed = merge_results([("a", {"success": False, "message": "x"})], k=3)
+    assert not all_failed["success"] and all_failed["failed"] == {"a": "x"}
+
+
+@pytest.fixture
+def loader(make_kb, monkeypatch):
+    shared = FakeEmbeddings()
+    monkeypatch.setattr(federated_search, "get_local_embeddings", lambda model=None: shared)
+    managers = {}
+    for name in ("alpha", "beta"):
+        manager = make_kb(name)
+        texts = [f"{name} 文档 第{i}段 主题{i}" for i in range(30)]
+        manager.add_chunks(texts, [{"source": f"{name}.txt", "filename": f"{name}.txt"}] * 30)
+        managers[name] = manager
+
+    def load(name):
+        if name not in managers:
+            raise ValueError(f"知识库不存在: {name}")
+        return managers[name]
+    load.embeddings = shared
+    return load
+
+
+@pytest.mark.parametrize("search_mode", ["vector", "hybrid"])
+def test_federated_search_merges_kbs_and_embeds_once(loader, search_mode):
+    queries = ["alpha 文档 第3段 主题3", "beta 文档 第7段 主题7"]
+    results = federated_search.search_many_federated(
+        loader, ["alpha", "beta", "alpha", "missing"], queries, k=4, search_mode=search_mode, score_threshold=0)
+
+    assert len(results) == 2
+    assert loader.embeddings.calls == 1
+    for result, (kb, chunk) in zip(results, [("alpha", "alpha:3"), ("beta", "beta:7")]):
+        assert result["success"]
+        assert len(result["context_list"]) == 4
+        top = result["context_list"][0]
+        assert (top["knowledge_base"], top["chunk_id"]) == (kb, chunk)
+        scores = [item["score"] for item in result["context_list"]]
+        assert scores == sorted(scores, reverse=True)
+        assert set(result["failed"]) == {"missing"}
+
+
+def test_async_federated_search_matches_sync(loader):
+    queries = ["beta 文档 第12段 主题12"]
+    sync = federated_search.search_many_federated(loader, ["alpha", "beta"], queries, k=5, score_threshold=0)
+    result = asyncio.run(federated_search.asearch_many_federated(loader, ["alpha", "beta"], queries, k=5,
+                                                                 score_threshold=0))
+    assert [item["chunk_id"] for item in result[0]["context_list"]] == \
+        [item["chunk_id"] for item in sync[0]["context_list"]]
+
+
+def test_unknown_search_mode_fails_every_query(loader):
+    results = federated_search.search_many_federated(loader, ["alpha"], ["q1", "q2"], search_mode="fuzzy")
+    assert [result["success"] for result in results] == [False, False]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from KnowledgeManager.chunk_store import ChunkStore
+from KnowledgeManager.metadata_index import MetadataIndex
+
+
+def test_build_mask_semantics(tmp_path):
+    store = ChunkStore(tmp_path / "chunks")
+    store.append(["a", "b", "c", "d"], [
+        {"filename": "a.pdf", "tags": ["财务", "年报"]},
+        {"filename": "b.docx", "tags": ["技术"]},
+        {"filename": "a.pdf"},
+        {"filename": "c.md", "tags": ["财务"]},
+    ])
+    index = MetadataIndex(store)
+
+    assert index.build_mask(None) is None
+    assert index.build_mask({"filename": "a.pdf"}).tolist() == [True, False, True, False]
+    assert index.build_mask({"filename": ["a.pdf", "c.md"]}).tolist() == [True, False, True, True]
+    assert index.build_mask({"tags": "财务"}).tolist() == [True, False, False, True]
+    assert index.build_mask({"filename": "a.pdf", "tags": "财务"}).tolist() == [True, False, False, False]
+    assert not index.build_mask({"filename": "missing.txt"}).any()
+
+
+@pytest.mark.parametrize("index_type,encoding", [("flat", "fp32"), ("hnsw", "fp32"), ("flat", "pq")])
+def test_filters_are_applied_to_vector_and_bm25_search(make_kb, rag_config, index_type, encoding):
+    rag_config["vector_store"]["faiss"]["index"].update({"type": index_type, "pq_m": 8, "pq_nbits": 4})
+    manager = make_kb(vector_encoding=encoding)
+    texts = [f"季度 报告 第{i}节 收入 token{i}" for i in range(300)]
+    manager.add_chunks(texts, [{"source": f"s{i % 3}.txt", "filename": f"s{i % 3}.txt",
+                                "tags": ["财务"] if i % 5 == 0 else []} for i in range(300)])
+
+    query = texts[7]
+    unfiltered = manager.search(query, k=5, score_threshold=0)["context_list"]
+    assert unfiltered[0]["chunk_id"] == "kb:7"
+
+    filtered = manager.search(query, k=5, score_threshold=0, filters={"source": "s0.txt"})["context_list"]
+    assert len(filtered) == 5
+    assert all(item["source"] == "s0.txt" for item in filtered)
+
+    tagged = manager.search(query, k=10, score_threshold=0, filters={"source": "s0.txt", "tags": "财务"})["context_list"]
+    assert tagged
+    assert all(int(item["chunk_id"].split(":")[1]) % 15 == 0 for item in tagged)
+
+    bm25 = manager.search_bm25("收入 token7", k=5, score_threshold=0, filters={"source": "s2.txt"})["context_list"]
+    assert bm25
+    assert all(item["source"] == "s2.txt" for item in bm25)
+    assert "kb:7" not in {item["chunk_id"] for item in bm25}
+
+    empty = manager.search(query, k=5, score_threshold=0, filters={"source": "none.txt"})
+    assert empty["success"] and empty["context_list"] == []
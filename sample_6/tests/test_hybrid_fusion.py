@@ -0,0 +1,47 @@
+import pytest
+
+from KnowledgeManager.bm25_index import BM25Index
+from KnowledgeManager.hybrid_fusion import fuse_results
+
+
+def test_weighted_fusion_combines_both_legs():
+    fused = fuse_results([(1, 0.9), (2, 0.7), (4, 0.5)], [(2, 12.0), (3, 8.0), (4, 4.0)], k=4,
+                         vector_weight=0.5, keyword_weight=0.5)
+    assert [idx for idx, _, _ in fused] == [2, 1, 3, 4]
+    assert fused[0][1] == pytest.approx(0.75)
+    assert fused[0][2] == {"vector_score": 0.7, "vector_rank": 2, "keyword_score": 12.0, "keyword_rank": 1}
+
+
+def test_weighted_fusion_normalizes_each_leg():
+    # 向量分数相同时融合结果按关键词一路的排序，而不是给命中关键词的候选加同样的分
+    vector_hits = [(0, 0.8), (1, 0.8), (2, 0.8)]
+    keyword_hits = BM25Index().extended(["apple pie", "apple apple apple pie", "apple apple pie"]).search("apple", k=3)
+    fused = fuse_results(vector_hits, keyword_hits, k=3, vector_weight=0.7, keyword_weight=0.3)
+    assert [idx for idx, _, _ in fused] == [idx for idx, _ in keyword_hits] == [1, 2, 0]
+    assert fused[0][1] > fused[1][1] > fused[2][1]
+    assert fused[0][1] == pytest.approx(1.0)
+
+
+def test_rrf_is_normalized_and_rank_based():
+    fused = fuse_results([(1, 0.9), (2, 0.1)], [(1, 0.2), (3, 0.1)], k=3, method="rrf")
+    assert fused[0][0] == 1 and fused[0][1] == pytest.approx(1.0)
+    assert all(0 < score <= 1 for _, score, _ in fused)
+
+
+def test_invalid_arguments_raise():
+    with pytest.raises(ValueError):
+        fuse_results([], [], k=1, method="max")
+    with pytest.raises(ValueError):
+        fuse_results([], [], k=1, vector_weight=0, keyword_weight=0)
+
+
+def test_search_hybrid_finds_keyword_only_match(make_kb):
+    manager = make_kb()
+    texts = ["向量检索使用内积", "关键词 zebra 出现在这里", "无关的内容"]
+    manager.add_chunks(texts, [{"source": f"{i}.txt", "filename": f"{i}.txt"} for i in range(3)])
+    for fusion in ("weighted", "rrf"):
+        result = manager.search_hybrid("zebra", k=3, score_threshold=0, fusion=fusion, keyword_weight=0.5,
+                                       vector_weight=0.5)
+        matches = [item for item in result["context_list"] if "keyword_score" in item]
+        assert [item["source"] for item in matches] == ["1.txt"]
+        assert result["context_list"].index(matches[0]) <= 1
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from conftest import wait_for_maintenance
+from KnowledgeManager.index_factory import (
+    DEFAULT_INDEX_CONFIG, build_factory_string, get_index_config, reservoir_sample
+)
+
+
+def test_factory_strings():
+    config = dict(DEFAULT_INDEX_CONFIG, nlist=64, pq_m=16)
+    assert build_factory_string("flat", 128, 1000, config) == "Flat"
+    assert build_factory_string("ivf_flat", 128, 1000, config) == "IVF64,Flat"
+    assert build_factory_string("ivf_pq", 128, 1000, config) == "IVF64,PQ16x8"
+    assert build_factory_string("hnsw", 128, 1000, dict(config, encoding="sq8")) == "HNSW32_SQ8"
+
+
+def test_unknown_index_type_is_rejected(rag_config):
+    rag_config["vector_store"]["faiss"]["index"]["type"] = "lsh"
+    with pytest.raises(ValueError):
+        get_index_config()
+
+
+def test_reservoir_sample_is_bounded_and_deterministic():
+    batches = [np.full((100, 2), i, dtype=np.float32) for i in range(10)]
+    first = reservoir_sample(iter(batches), 50)
+    assert first.shape == (50, 2)
+    assert np.array_equal(first, reservoir_sample(iter(batches), 50))
+    # 后到的批次也有机会进入样本
+    assert first[:, 0].max() > 0
+    assert reservoir_sample(iter(batches[:1]), 500).shape == (100, 2)
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "hnsw"])
+def test_flat_index_is_promoted_after_threshold(make_kb, rag_config, index_type):
+    rag_config["vector_store"]["faiss"]["index"].update({"type": index_type, "promote_threshold": 200, "nlist": 8})
+    manager = make_kb()
+    texts = [f"条目 {i} value{i}" for i in range(300)]
+    manager.add_chunks(texts[:150], [{"source": "a.txt"}] * 150)
+    wait_for_maintenance(manager)
+    assert manager.get_stats()["index_type"] == "flat"
+
+    manager.add_chunks(texts[150:], [{"source": "a.txt"}] * 150)
+    wait_for_maintenance(manager)
+    assert manager.get_stats()["index_type"] == index_type
+    for i in (0, 199, 299):
+        assert manager.search(texts[i], k=1, score_threshold=0)["context_list"][0]["content"] == texts[i]
@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+
+from KnowledgeManager.ingest_manifest import IngestManifest, settings_fingerprint
+from KnowledgeManager.ingest_pipeline import background
+
+
+def _write(tmp_path, name: str, text: str) -> dict:
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return {"path": str(path), "source": name, "filename": name}
+
+
+def test_ingest_splitter_settings_do_not_change_shared_instance(make_kb, tmp_path):
+    manager = make_kb()
+    default_splitter, default_settings = manager.text_splitter, manager.get_ingest_settings()
+    file_info = _write(tmp_path, "a.txt", "第一段内容。" * 200)
+
+    result = manager.ingest_files([file_info], chunk_size=120, chunk_overlap=10)
+    assert result["success"] and result["added"] == 1
+
+    assert manager.text_splitter is default_splitter
+    assert manager.get_ingest_settings() == default_settings
+    _, settings = manager.build_text_splitter(120, 10, True)
+    entry = IngestManifest(manager.manifest_file).get("a.txt")
+    assert entry["settings"] == settings_fingerprint(settings)
+    assert all(len(manager.chunk_store.get_text(i)) <= 120 for i in range(len(manager.chunk_store)))
+
+
+def test_unchanged_files_are_skipped_and_changed_files_replaced(make_kb, tmp_path):
+    manager = make_kb()
+    file_info = _write(tmp_path, "a.txt", "旧版本的内容，苹果。")
+    assert manager.ingest_files([file_info])["added"] == 1
+
+    embed_calls = manager.embeddings.calls
+    result = manager.ingest_files([file_info])
+    assert result["skipped"] == 1 and result["chunks_count"] == 0
+    assert manager.embeddings.calls == embed_calls
+
+    file_info = _write(tmp_path, "a.txt", "新版本的内容，香蕉。")
+    result = manager.ingest_files([file_info])
+    assert result["updated"] == 1
+    assert manager.search_bm25("苹果", k=5, score_threshold=0)["context_list"] == []
+    assert manager.search_bm25("香蕉", k=5, score_threshold=0)["context_list"][0]["source"] == "a.txt"
+
+
+def test_changed_settings_reingest_unchanged_files(make_kb, tmp_path):
+    manager = make_kb()
+    file_info = _write(tmp_path, "a.txt", "内容。" * 100)
+    manager.ingest_files([file_info])
+    assert manager.ingest_files([file_info], chunk_size=80, chunk_overlap=8)["updated"] == 1
+
+
+def test_interrupted_folder_ingest_resumes_after_last_commit(make_kb, tmp_path, monkeypatch):
+    from KnowledgeManager import FAISSKnowledgeManager as module
+    monkeypatch.setattr(module, "INGESTION_CONFIG", {"batch_chunks": 1, "queue_size": 1})
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    for i in range(5):
+        (folder / f"f{i}.txt").write_text(f"文件{i}的内容，关键词{i}。", encoding="utf-8")
+    manager = make_kb()
+
+    append_chunks, commits = manager._append_chunks, []
+
+    def failing_append(chunks, *args, **kwargs):
+        if len(commits) == 2:
+            raise RuntimeError("磁盘已满")
+        commits.append(chunks)
+        return append_chunks(chunks, *args, **kwargs)
+
+    manager._append_chunks = failing_append
+    result = manager.load_from_folder(str(folder))
+    assert not result["success"] and result["added"] == 2
+    assert manager.cursor_file.exists()
+
+    extracted = []
+    extract_stage = manager._extract_stage
+
+    def recording_extract(files, *args, **kwargs):
+        extracted.extend(file_info["filename"] for file_info in files)
+        return extract_stage(files, *args, **kwargs)
+
+    manager._append_chunks = append_chunks
+    manager._extract_stage = recording_extract
+    result = manager.load_from_folder(str(folder))
+    assert result["success"] and result["added"] == 5
+    assert extracted == ["f2.txt", "f3.txt", "f4.txt"]
+    assert not manager.cursor_file.exists()
+    assert manager.get_stats()["total_texts"] == 5
+
+
+def test_background_stage_propagates_errors_and_stops_upstream():
+
+    produced, closed = [], threading.Event()
+
+    def source():
+        try:
+            for i in range(1000):
+                produced.append(i)
+                yield i
+        finally:
+            closed.set()
+
+    stage = background(source(), queue_size=2)
+    assert [next(stage) for _ in range(3)] == [0, 1, 2]
+    stage.close()
+    assert closed.wait(5)
+    assert len(produced) < 10
+
+    def broken():
+        yield 1
+        raise ValueError("解析失败")
+
+    stage = background(broken(), queue_size=2)
+    assert next(stage) == 1
+    with pytest.raises(ValueError, match="解析失败"):
+        next(stage)
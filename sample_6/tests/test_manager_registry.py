@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from KnowledgeManager.manager_registry import KnowledgeManagerRegistry
+
+
+class StubManager:
+    def __init__(self, size: int):
+        self.size = size
+        self.busy = False
+        self.stale = False
+
+    def initialize(self):
+        pass
+
+    def is_stale(self):
+        return self.stale
+
+    def is_busy(self):
+        return self.busy
+
+    def memory_bytes(self):
+        return self.size
+
+
+def test_busy_manager_is_not_evicted():
+    registry = KnowledgeManagerRegistry(memory_budget_bytes=150)
+    first = registry.get(("a", "m"), lambda: StubManager(100))
+    first.busy = True
+    registry.get(("b", "m"), lambda: StubManager(100))
+    assert registry.counters["evictions"] == 0
+    assert registry.stats()["loaded"] == ["a", "b"]
+
+    first.busy = False
+    registry.get(("c", "m"), lambda: StubManager(10))
+    assert "a" not in registry.stats()["loaded"]
+
+
+def test_evicted_manager_still_in_use_is_reused():
+    registry = KnowledgeManagerRegistry(memory_budget_bytes=150)
+    first = registry.get(("a", "m"), lambda: StubManager(100))
+    registry.get(("b", "m"), lambda: StubManager(100))
+    assert registry.counters["evictions"] == 1
+    assert "a" not in registry.stats()["loaded"]
+
+    # 调用方仍持有被淘汰的实例，再次请求时不创建第二个实例
+    assert registry.get(("a", "m"), lambda: StubManager(100)) is first
+    assert registry.counters["loads"] == 2
+
+
+def test_stale_manager_is_reloaded():
+    registry = KnowledgeManagerRegistry(memory_budget_bytes=1000)
+    first = registry.get(("a", "m"), lambda: StubManager(10))
+    first.stale = True
+    second = registry.get(("a", "m"), lambda: StubManager(10))
+    assert second is not first
+    assert registry.counters["reloads"] == 1
+
+
+def test_concurrent_hits_are_counted():
+    registry = KnowledgeManagerRegistry(memory_budget_bytes=1000)
+    registry.get(("a", "m"), lambda: StubManager(10))
+
+    def hit():
+        for _ in range(500):
+            registry.get(("a", "m"), lambda: StubManager(10))
+    threads = [threading.Thread(target=hit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert registry.counters["hits"] == 4000
+    assert registry.counters["loads"] == 1
+
+
+def test_factory_rejects_splitter_settings_and_unknown_kwargs(rag_config):
+    from KnowledgeManager.KnowledgeManagerFactory import KnowledgeManagerFactory
+
+    with pytest.raises(TypeError, match="ingest_files"):
+        KnowledgeManagerFactory.create_knowledge_manager("kb", chunk_size=500)
+    with pytest.raises(TypeError, match="colour"):
+        KnowledgeManagerFactory.create_knowledge_manager("kb", colour="blue")
@@ -0,0 +1,56 @@
+from KnowledgeManager.markdown_hybrid_splitter import MarkdownHybridSplitter
+
+DOCUMENT = """# 安装
+
+安装步骤说明。""" + "下载并解压安装包。" * 20 + """
+
+## 配置
+
+```bash
+# 这不是标题
+export KEY=value
+```
+
+配置说明。""" + "修改配置文件中的参数。" * 15 + """
+
+# 使用
+
+使用方法。""" + "运行命令并查看输出。" * 5 + "\n"
+
+
+def test_spans_are_trimmed_offsets_with_heading_paths():
+    splitter = MarkdownHybridSplitter(chunk_size=80, chunk_overlap=10, min_chunk_size=20)
+    spans = splitter.split_spans(DOCUMENT)
+
+    assert splitter.split_text(DOCUMENT) == [DOCUMENT[start:end] for start, end, _ in spans]
+    for start, end, _ in spans:
+        chunk = DOCUMENT[start:end]
+        assert chunk == chunk.strip()
+        assert len(chunk) <= 80
+    assert [start for start, _, _ in spans] == sorted(start for start, _, _ in spans)
+
+    paths = {headings for _, _, headings in spans}
+    assert paths == {("安装",), ("安装", "配置"), ("使用",)}
+    fenced = next(headings for start, end, headings in spans if "这不是标题" in DOCUMENT[start:end])
+    assert fenced == ("安装", "配置")
+
+
+def test_length_function_bounds_chunk_size():
+    def two_per_char(text):
+        return 2 * len(text)
+
+    splitter = MarkdownHybridSplitter(chunk_size=60, chunk_overlap=6, min_chunk_size=10, length_function=two_per_char)
+    for start, end, _ in splitter.split_spans(DOCUMENT):
+        assert two_per_char(DOCUMENT[start:end]) <= 60
+
+
+def test_outline_continues_heading_paths_across_windows():
+    splitter = MarkdownHybridSplitter(chunk_size=80, chunk_overlap=0, min_chunk_size=10)
+    cut = DOCUMENT.index("配置说明")
+    outline = splitter.outline_at(DOCUMENT, cut)
+    assert outline == ((1, "安装"), (2, "配置"))
+
+    rest = splitter.split_spans(DOCUMENT[cut:], outline)
+    assert rest[0][2] == ("安装", "配置")
+    assert rest[-1][2] == ("使用",)
+    assert splitter.outline_at(DOCUMENT, DOCUMENT.index("## 配置")) == ((1, "安装"),)
@@ -0,0 +1,55 @@
+import numpy as np
+
+from KnowledgeManager.near_duplicate import SignatureIndex, hamming, max_distance, simhash
+
+BASE = "本合同自双方签字盖章之日起生效，有效期三年。任何一方违约，应向守约方支付合同总金额百分之二十的违约金。"
+
+
+def _write(tmp_path, name: str, text: str) -> dict:
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return {"path": str(path), "source": name, "filename": name}
+
+
+def test_simhash_separates_near_duplicates_from_unrelated_text():
+    distance = max_distance(0.9)
+    edited = BASE.replace("三年", "五年")
+    unrelated = "向量检索使用内积度量，查询向量与文档向量在入库时都做 L2 归一化，分数范围为负一到一。" * 2
+    assert hamming(np.array([simhash(edited)], dtype=np.uint64), simhash(BASE))[0] <= distance
+    assert hamming(np.array([simhash(unrelated)], dtype=np.uint64), simhash(BASE))[0] > distance
+
+
+def test_signature_index_matches_brute_force():
+    rng = np.random.default_rng(7)
+    signatures = rng.integers(0, 2 ** 63, size=20000, dtype=np.uint64)
+    index = SignatureIndex(distance=6)
+    index.add(signatures[:15000], np.arange(15000))
+    index.add(signatures[15000:], np.arange(15000, 20000))
+    for probe in signatures[[3, 14999, 19999]]:
+        # 翻转 3 位，仍在阈值内
+        noisy = int(probe) ^ 0b10010001
+        expected = np.flatnonzero(hamming(signatures, noisy) <= 6)
+        assert sorted(index.find(noisy).tolist()) == expected.tolist()
+
+
+def test_dedup_is_off_by_default(make_kb, tmp_path):
+    manager = make_kb()
+    files = [_write(tmp_path, "a.txt", BASE), _write(tmp_path, "b.txt", BASE)]
+    result = manager.ingest_files(files)
+    assert result["duplicates"] == 0
+    assert len(manager.chunk_store) == 2
+
+
+def test_dedup_skips_near_duplicates_when_enabled(make_kb, rag_config, tmp_path):
+    rag_config["ingestion"]["dedup"] = {"enabled": True}
+    manager = make_kb()
+    files = [_write(tmp_path, "a.txt", BASE), _write(tmp_path, "b.txt", BASE.replace("三年", "五年"))]
+    result = manager.ingest_files(files)
+    assert result["duplicates"] == 1
+    assert len(manager.chunk_store) == 1
+
+    # 保留片段的来源被删除后，链接到它的文件重新入库时完整处理
+    manager.remove_by_source("a.txt")
+    result = manager.ingest_files(files[1:])
+    assert result["duplicates"] == 0 and result["added"] + result["updated"] == 1
+    assert manager.search_bm25("五年", k=1, score_threshold=0)["context_list"][0]["source"] == "b.txt"
@@ -0,0 +1,68 @@
+import re
+
+import pytest
+
+from KnowledgeManager.markdown_hybrid_splitter import MarkdownHybridSplitter
+from KnowledgeManager.page_splitter import split_pages, _locate
+
+
+class PlainSplitter:
+    """只提供 split_text 的分割器：按句切分后合并到 chunk_size，片段去掉首尾空白"""
+
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+
+    def split_text(self, text):
+        chunks, current = [], ""
+        for sentence in re.findall(r"[^。]*。|[^。]+$", text):
+            if current and len(current) + len(sentence) > self.chunk_size:
+                chunks.append(current.strip())
+                current = ""
+            current += sentence
+        if current.strip():
+            chunks.append(current.strip())
+        return chunks
+
+
+def _pages(count: int = 12):
+    return [(number, "".join(f"第{number}页第{i}句。" for i in range(12)) + "\n") for number in range(1, count + 1)]
+
+
+def _page_numbers(chunk: str):
+    return {int(number) for number in re.findall(r"第(\d+)页", chunk)}
+
+
+@pytest.mark.parametrize("splitter", [PlainSplitter(60), MarkdownHybridSplitter(chunk_size=60, chunk_overlap=0,
+                                                                                  min_chunk_size=10)])
+def test_chunks_record_the_pages_they_span(splitter):
+    pages = _pages()
+    results = list(split_pages(splitter, iter(pages), window_chars=200))
+
+    full_text = "".join(text for _, text in pages)
+    assert "".join(chunk for chunk, _ in results).replace("\n", "") == full_text.replace("\n", "")
+    for chunk, metadata in results:
+        numbers = _page_numbers(chunk)
+        assert metadata["page_start"] == min(numbers)
+        assert metadata["page_end"] == max(numbers)
+    assert results[-1][1]["page_end"] == 12
+
+
+def test_span_splitters_report_offsets_in_full_text():
+    pages = [(1, "# 概述\n" + "概述内容。" * 30 + "\n"), (2, "## 细节\n" + "细节内容。" * 30 + "\n")]
+    splitter = MarkdownHybridSplitter(chunk_size=50, chunk_overlap=0, min_chunk_size=10)
+    full_text = "".join(text for _, text in pages)
+
+    results = list(split_pages(splitter, iter(pages), window_chars=80))
+    for chunk, metadata in results:
+        assert full_text[metadata["char_start"]:metadata["char_end"]] == chunk
+    assert results[0][1]["section"] == "概述"
+    assert results[-1][1]["section"] == "概述 > 细节"
+    assert results[-1][1]["page_start"] == 2
+
+
+def test_locate_tolerates_chunks_that_are_not_substrings():
+    text = "alpha beta\n\ngamma delta\n\nepsilon"
+    spans = _locate(text, ["alpha beta", "gamma  delta", "epsilon"])
+    assert spans[0] == (0, 10)
+    assert text[spans[2][0]:spans[2][1]] == "epsilon"
+    assert spans[0][0] < spans[1][0] < spans[2][0]
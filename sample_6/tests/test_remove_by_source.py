@@ -0,0 +1,59 @@
+import pytest
+
+from conftest import wait_for_maintenance
+
+
+def _add(manager, source: str, count: int):
+    texts = [f"{source} 第{i}段 内容" for i in range(count)]
+    manager.add_chunks(texts, [{"source": f"/data/{source}", "filename": source}] * count)
+    return texts
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+def test_removed_chunks_disappear_and_ids_stay_stable(make_kb, rag_config, index_type):
+    rag_config["vector_store"]["faiss"]["index"].update({
+        "type": index_type, "segment_rows": 100, "promote_threshold": 200, "nlist": 8, "compaction_threshold": 0.2
+    })
+    manager = make_kb()
+    keep = _add(manager, "keep.md", 200)
+    drop = _add(manager, "drop.pdf", 100)
+    wait_for_maintenance(manager)
+
+    result = manager.remove_by_source("*.pdf")
+    assert result["success"] and result["removed_count"] == 100
+    wait_for_maintenance(manager)
+
+    stats = manager.get_stats()
+    assert stats["total_texts"] == 200
+    # 删除比例超过 compaction_threshold，后台压缩已清除已删除的向量
+    assert stats["total_vectors"] == 200
+    assert stats["pending_compaction"] == 0
+
+    hits = manager.search(drop[5], k=10, score_threshold=0)["context_list"]
+    assert all(item["source"] == "keep.md" for item in hits)
+    assert manager.search_bm25("drop.pdf", k=10, score_threshold=0)["context_list"] == []
+    # 保留的片段编号不变
+    top = manager.search(keep[150], k=1, score_threshold=0)["context_list"][0]
+    assert top["chunk_id"] == "kb:150"
+
+    reopened = make_kb()
+    assert reopened.get_stats()["total_texts"] == 200
+    assert reopened.search(keep[150], k=1, score_threshold=0)["context_list"][0]["chunk_id"] == "kb:150"
+
+
+def test_small_removal_is_tombstoned_without_compaction(make_kb, rag_config):
+    rag_config["vector_store"]["faiss"]["index"].update({"compaction_threshold": 0.5})
+    manager = make_kb()
+    _add(manager, "a.txt", 90)
+    drop = _add(manager, "b.txt", 10)
+
+    assert manager.remove_by_source("/data/b.txt")["removed_count"] == 10
+    wait_for_maintenance(manager)
+    stats = manager.get_stats()
+    assert stats["total_texts"] == 90
+    assert stats["pending_compaction"] == 10
+    assert all(item["source"] == "a.txt"
+               for item in manager.search(drop[0], k=5, score_threshold=0)["context_list"])
+
+    again = manager.remove_by_source("b.txt")
+    assert not again["success"]
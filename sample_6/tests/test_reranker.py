@@ -0,0 +1,225 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from KnowledgeManager.reranker import Reranker
+
+RERANK_MODEL = "test-rerank"
+
+
+class RerankServer:
+    """本地 rerank 服务：按文档长度给分，可设置延迟与失败"""
+
+    def __init__(self):
+        self.requests = []
+        self.connections = set()
+        self.delay = 0.0
+        self.fail = False
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.requests.append(body)
+                server.connections.add(self.client_address)
+                time.sleep(server.delay)
+                if server.fail:
+                    data = b"boom"
+                    self.send_response(500)
+                else:
+                    results = sorted(({"index": i, "relevance_score": len(doc) / 100}
+                                      for i, doc in enumerate(body["documents"])),
+                                     key=lambda item: -item["relevance_score"])[:body["top_n"]]
+                    data = json.dumps({"results": results}).encode()
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}/v1"
+
+
+@pytest.fixture
+def server():
+    server = RerankServer()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+@pytest.fixture
+def make_reranker(rag_config, server, monkeypatch):
+    def make(cache=None, **settings):
+        monkeypatch.setitem(rag_config, "rerank", {
+            "enabled": True, "default_model": RERANK_MODEL, "timeout": 5,
+            "models": {RERANK_MODEL: {"api_url": server.url, "model": "bge-reranker"}},
+            "cache": cache or {"enabled": False}, **settings
+        })
+        return Reranker(RERANK_MODEL)
+    return make
+
+
+CONTEXT = [{"content": "a" * n, "score": 0.9, "source": f"s{n}", "chunk_id": f"kb:{n}"} for n in (5, 50, 20)]
+
+
+def _sources(results):
+    return [item["source"] for item in results]
+
+
+def test_rerank_orders_by_score_and_reuses_connections(make_reranker, server):
+    reranker = make_reranker()
+    for _ in range(5):
+        results = reranker.rerank("q", CONTEXT, top_k=2)
+    assert _sources(results) == ["s50", "s20"]
+    assert results[0]["rerank_score"] == pytest.approx(0.5)
+    assert len(server.requests) == 5
+    assert len(server.connections) == 1
+    assert server.requests[0]["model"] == "bge-reranker" and server.requests[0]["top_n"] == 2
+
+
+def test_identical_concurrent_requests_are_coalesced(make_reranker, server):
+    reranker = make_reranker()
+    server.delay = 0.2
+
+    async def run():
+        return await asyncio.gather(*(reranker.arerank("same", CONTEXT, 2) for _ in range(8)))
+
+    results = asyncio.run(run())
+    assert len(server.requests) == 1
+    assert all(_sources(result) == ["s50", "s20"] for result in results)
+
+    server.requests.clear()
+    results = asyncio.run(reranker.arerank_many([f"q{i}" for i in range(4)], [CONTEXT] * 4, top_k=1))
+    assert len(server.requests) == 4
+    assert [_sources(result) for result in results] == [["s50"]] * 4
+
+
+def test_budget_returns_original_order_without_tripping_breaker(make_reranker, server):
+    reranker = make_reranker(failure_threshold=1)
+    server.delay = 1.0
+
+    started = time.monotonic()
+    results = reranker.rerank("slow", CONTEXT, top_k=2, budget_ms=100)
+    assert time.monotonic() - started < 0.8
+    assert _sources(results) == ["s5", "s50"]
+    assert asyncio.run(reranker.arerank("slow async", CONTEXT, budget_ms=100)) == CONTEXT
+
+    server.delay = 0
+    assert _sources(reranker.rerank("fast", CONTEXT, top_k=1)) == ["s50"]
+
+
+def test_breaker_pauses_after_consecutive_failures(make_reranker, server):
+    reranker = make_reranker(failure_threshold=2, cooldown=30)
+    server.fail = True
+    for i in range(5):
+        assert reranker.rerank(f"f{i}", CONTEXT) == CONTEXT
+    assert len(server.requests) == 2
+
+    server.fail = False
+    reranker._paused_until = 0
+    assert _sources(reranker.rerank("recovered", CONTEXT, top_k=1)) == ["s50"]
+
+
+def test_disabled_reranker_returns_original(make_reranker, server):
+    reranker = make_reranker(enabled=False)
+    assert reranker.rerank("q", CONTEXT, top_k=2) == CONTEXT[:2]
+    assert server.requests == []
+
+
+def test_repeat_query_is_served_from_score_cache(make_reranker, server):
+    reranker = make_reranker(cache={"enabled": True})
+    first = reranker.rerank("Query  ONE", CONTEXT, top_k=2)
+    assert server.requests[0]["top_n"] == 3
+
+    server.fail = True
+    assert reranker.rerank("query one", CONTEXT, top_k=2) == first
+    assert len(server.requests) == 1
+    assert reranker.cache.stats()["hits"] == 3
+
+
+def test_partial_hits_request_only_missing_chunks(make_reranker, server):
+    reranker = make_reranker(cache={"enabled": True})
+    reranker.rerank("q", CONTEXT[:2])
+    extra = {"content": "b" * 80, "score": 0.9, "source": "s80", "chunk_id": "kb:80"}
+
+    results = reranker.rerank("q", CONTEXT + [extra], top_k=2)
+    assert server.requests[-1]["documents"] == [CONTEXT[2]["content"], extra["content"]]
+    assert _sources(results) == ["s80", "s50"]
+
+    # 同一编号的内容变化后不复用旧分数
+    changed = [dict(CONTEXT[0], content="c" * 90)]
+    reranker.rerank("q", changed)
+    assert server.requests[-1]["documents"] == ["c" * 90]
+
+
+def test_persistent_cache_survives_restart(make_reranker, server, tmp_path):
+    cache = {"enabled": True, "persistent": True, "directory": str(tmp_path / "rerank_cache")}
+    make_reranker(cache=cache).rerank("q", CONTEXT)
+    assert len(server.requests) == 1
+
+    restarted = make_reranker(cache=cache)
+    assert _sources(restarted.rerank("q", CONTEXT)) == ["s50", "s20", "s5"]
+    assert len(server.requests) == 1
+
+
+def test_cached_scores_are_used_while_paused(make_reranker, server):
+    reranker = make_reranker(cache={"enabled": True}, failure_threshold=1)
+    reranker.rerank("q", CONTEXT)
+    server.fail = True
+    reranker.rerank("other", CONTEXT)
+    assert reranker._paused_until > time.monotonic()
+    assert _sources(reranker.rerank("q", CONTEXT, top_k=1)) == ["s50"]
+
+
+def test_requests_keep_connect_timeout(make_reranker, server, monkeypatch):
+    reranker = make_reranker(connect_timeout=0.5, timeout=5)
+    timeouts = []
+    post = reranker.client.post
+
+    def recording_post(*args, **kwargs):
+        timeouts.append(kwargs["timeout"])
+        return post(*args, **kwargs)
+
+    monkeypatch.setattr(reranker.client, "post", recording_post)
+    reranker.rerank("q", CONTEXT, top_k=1)
+    reranker.rerank("tight", CONTEXT, top_k=1, budget_ms=200)
+    assert [(t.connect, t.read) for t in timeouts] == [(0.5, 5), (0.2, 0.2)]
+
+
+def test_async_clients_are_closed_and_dropped_with_their_loop(make_reranker, server):
+    reranker = make_reranker()
+
+    async def run():
+        await reranker.arerank("q", CONTEXT, top_k=1)
+        return reranker.async_client
+
+    first = asyncio.run(run())
+    second = asyncio.run(run())
+    assert first is not second
+    assert list(reranker._async_clients.values()) == [second]
+
+    async def run_and_close():
+        await reranker.arerank("q", CONTEXT, top_k=1)
+        client = reranker.async_client
+        await reranker.aclose()
+        return client
+
+    closed = asyncio.run(run_and_close())
+    assert closed.is_closed
+    assert closed not in list(reranker._async_clients.values())
+    reranker.close()
+    assert reranker.client.is_closed
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def manager(make_kb):
+    manager = make_kb()
+    texts = [f"批量 检索 第{i}段 词{i}" for i in range(60)]
+    manager.add_chunks(texts, [{"source": f"s{i % 2}.txt", "filename": f"s{i % 2}.txt"} for i in range(60)])
+    manager.embeddings.calls = 0
+    return manager
+
+
+QUERIES = ["批量 检索 第4段 词4", "批量 检索 第17段 词17", "批量 检索 第33段 词33"]
+
+
+def _ids(result):
+    assert result["success"], result
+    return [item["chunk_id"] for item in result["context_list"]]
+
+
+@pytest.mark.parametrize("search_mode,single", [
+    ("vector", "search"), ("bm25", "search_bm25"), ("hybrid", "search_hybrid")])
+def test_search_many_matches_single_searches(manager, search_mode, single):
+    filters = {"source": "s1.txt"}
+    batch = manager.search_many(QUERIES, k=4, filters=filters, score_threshold=0, search_mode=search_mode)
+    expected = [getattr(manager, single)(query, k=4, filters=filters, score_threshold=0) for query in QUERIES]
+    assert [_ids(result) for result in batch] == [_ids(result) for result in expected]
+
+
+def test_search_many_embeds_all_queries_in_one_request(manager):
+    results = manager.search_many(QUERIES, k=1, score_threshold=0)
+    assert manager.embeddings.calls == 1
+    assert [_ids(result) for result in results] == [["kb:4"], ["kb:17"], ["kb:33"]]
+
+    manager.embeddings.calls = 0
+    embeddings = [manager.embeddings.embed_query(query) for query in QUERIES]
+    manager.search_many(QUERIES, k=1, score_threshold=0, query_embeddings=embeddings)
+    assert manager.embeddings.calls == 0
+
+
+def test_async_search_many_and_errors(manager):
+    results = asyncio.run(manager.asearch_many(QUERIES, k=1, score_threshold=0, search_mode="hybrid"))
+    assert [_ids(result) for result in results] == [["kb:4"], ["kb:17"], ["kb:33"]]
+    assert manager.search_many([], k=3) == []
+    failed = manager.search_many(QUERIES[:2], search_mode="fuzzy")
+    assert [result["success"] for result in failed] == [False, False]
@@ -0,0 +1,68 @@
+import faiss
+import numpy as np
+import pytest
+
+from conftest import wait_for_maintenance
+from KnowledgeManager.index_factory import DEFAULT_INDEX_CONFIG, create_index, merge_into
+
+
+def _fill(manager, rows: int, batch: int = 50):
+    for start in range(0, rows, batch):
+        texts = [f"片段 {i} 内容 token{i}" for i in range(start, start + batch)]
+        manager.add_chunks(texts, [{"source": f"f{i % 7}.txt", "filename": f"f{i % 7}.txt"} for i in range(start, start + batch)])
+        wait_for_maintenance(manager)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "ivf_pq", "hnsw"])
+def test_merged_segments_keep_chunk_ids(make_kb, rag_config, index_type):
+    rag_config["vector_store"]["faiss"]["index"].update({
+        "type": index_type, "segment_rows": 100, "promote_threshold": 300, "nlist": 8, "pq_m": 8
+    })
+    manager = make_kb()
+    _fill(manager, 800)
+
+    segments = manager.segment_store.segments
+    assert any(segment["end"] - segment["start"] > 100 for segment in segments), "没有发生段合并"
+    assert manager.get_stats()["index_type"] == index_type
+
+    for row in (0, 150, 400, 555, 700, 799):
+        text = f"片段 {row} 内容 token{row}"
+        results = manager.search(text, k=10, score_threshold=0)["context_list"]
+        assert results[0]["chunk_id"] == f"kb:{row}"
+        assert results[0]["content"] == text
+
+    filtered = manager.search("片段 400 内容 token400", k=5, score_threshold=0, filters={"source": "f1.txt"})
+    assert filtered["context_list"]
+    assert all(item["source"] == "f1.txt" for item in filtered["context_list"])
+
+
+def test_reload_after_merge_returns_same_results(make_kb, rag_config):
+    rag_config["vector_store"]["faiss"]["index"].update({
+        "type": "ivf_flat", "segment_rows": 100, "promote_threshold": 300, "nlist": 8
+    })
+    manager = make_kb()
+    _fill(manager, 600)
+    reloaded = make_kb()
+
+    query = "片段 420 内容 token420"
+    before = [item["chunk_id"] for item in manager.search(query, k=5, score_threshold=0)["context_list"]]
+    after = [item["chunk_id"] for item in reloaded.search(query, k=5, score_threshold=0)["context_list"]]
+    assert before == after
+    assert before[0] == "kb:420"
+
+
+@pytest.mark.parametrize("index_type", ["ivf_flat", "ivf_pq"])
+def test_merge_into_keeps_external_ids(index_type):
+    config = dict(DEFAULT_INDEX_CONFIG, nlist=8, pq_m=8)
+    vectors = np.random.default_rng(0).standard_normal((600, 32)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    template = create_index(index_type, 32, len(vectors), config)
+    template.train(vectors)
+    first, second = faiss.clone_index(template), faiss.clone_index(template)
+    first.add_with_ids(vectors[:300], np.arange(0, 300, dtype=np.int64))
+    second.add_with_ids(vectors[300:], np.arange(300, 600, dtype=np.int64))
+
+    merge_into(first, second)
+    params = faiss.SearchParametersIVF(nprobe=8)
+    _, ids = first.search(vectors[[10, 320, 599]], 1, params=params)
+    assert ids[:, 0].tolist() == [10, 320, 599]
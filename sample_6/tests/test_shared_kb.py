@@ -0,0 +1,69 @@
+import multiprocessing
+import time
+
+from conftest import wait_for_maintenance
+from KnowledgeManager.Dependencies.file_lock import FileLock
+
+
+def _add(manager, start: int, count: int):
+    texts = [f"共享 第{i}段 token{i}" for i in range(start, start + count)]
+    manager.add_chunks(texts, [{"source": f"s{start}.txt", "filename": f"s{start}.txt"}] * count)
+    wait_for_maintenance(manager)
+    return texts
+
+
+def _assert_loads(make_kb, rows: int, samples):
+    fresh = make_kb()
+    assert fresh._current_snapshot().rows == rows
+    for i, text in samples:
+        assert fresh.search(text, k=3, score_threshold=0)["context_list"][0]["chunk_id"] == f"kb:{i}"
+
+
+def test_reader_does_not_run_maintenance(make_kb, rag_config):
+    rag_config["vector_store"]["faiss"]["index"].update({"segment_rows": 1000})
+    writer = make_kb()
+    _add(writer, 0, 150)
+    # 只加载知识库的实例即使有可封存的尾部片段也不启动后台维护，不会用过时的状态覆盖清单
+    rag_config["vector_store"]["faiss"]["index"].update({"segment_rows": 100})
+    reader = make_kb()
+    texts = _add(writer, 150, 150)
+
+    assert reader._maintenance_thread is None
+    assert reader.segment_store.sealed_rows == 0
+    _assert_loads(make_kb, 300, [(160, texts[10]), (299, texts[149])])
+
+
+def test_writers_rebase_on_each_other(make_kb, rag_config):
+    rag_config["vector_store"]["faiss"]["index"].update({"segment_rows": 100})
+    first = make_kb()
+    a = _add(first, 0, 150)
+    second = make_kb()
+    b = _add(second, 150, 10)
+    c = _add(first, 160, 150)
+    d = _add(second, 310, 100)
+
+    assert second._current_snapshot().rows == 410
+    assert second.segment_store.sealed_rows == 410
+    _assert_loads(make_kb, 410, [(5, a[5]), (155, b[5]), (200, c[40]), (400, d[90])])
+    # 先前的写入方同样能在最新状态上继续写入
+    e = _add(first, 410, 5)
+    _assert_loads(make_kb, 415, [(300, c[140]), (412, e[2])])
+
+
+def _hold_lock(path, locked, seconds):
+    with FileLock(path):
+        locked.set()
+        time.sleep(seconds)
+
+
+def test_file_lock_excludes_other_processes(tmp_path):
+    context = multiprocessing.get_context("fork")
+    locked = context.Event()
+    child = context.Process(target=_hold_lock, args=(tmp_path / "kb.lock", locked, 0.5))
+    child.start()
+    assert locked.wait(10)
+    started = time.monotonic()
+    with FileLock(tmp_path / "kb.lock"):
+        waited = time.monotonic() - started
+    child.join()
+    assert waited >= 0.3
@@ -0,0 +1,79 @@
+import threading
+
+import numpy as np
+
+from conftest import wait_for_maintenance
+
+
+def _add(manager, start: int, count: int, source: str = "a.txt"):
+    texts = [f"快照 第{i}段 token{i}" for i in range(start, start + count)]
+    manager.add_chunks(texts, [{"source": source, "filename": source}] * count)
+    return texts
+
+
+def test_old_snapshot_is_unaffected_by_later_writes(make_kb, rag_config):
+    rag_config["vector_store"]["faiss"]["index"].update({"segment_rows": 50})
+    manager = make_kb()
+    texts = _add(manager, 0, 80)
+    wait_for_maintenance(manager)
+    old = manager._current_snapshot()
+    old_segments, old_tombstones = old.segments, old.tombstones.copy()
+
+    _add(manager, 80, 120, source="b.txt")
+    manager.remove_by_source("a.txt")
+    wait_for_maintenance(manager)
+
+    new = manager._current_snapshot()
+    assert new is not old
+    assert new.rows == 200 and new.deleted_count == 80
+    assert old.rows == 80 and old.deleted_count == 0
+    assert old.segments == old_segments
+    assert np.array_equal(old.tombstones, old_tombstones)
+
+    # 旧快照仍能检索到此后被删除的片段，且看不到此后新增的片段
+    query = np.array([manager.embeddings.embed_query(texts[10])], dtype=np.float32)
+    hits = manager._search_vectors(old, query, 5)[0]
+    assert hits[0][0] == 10
+    assert all(idx < 80 for idx, _ in hits)
+    result = manager._build_search_result(old, hits, 0)
+    assert result["context_list"][0]["content"] == texts[10]
+    assert all(item["source"] == "b.txt" for item in manager.search(texts[10], k=5, score_threshold=0)["context_list"])
+
+
+def test_search_does_not_wait_for_the_write_lock(make_kb):
+    manager = make_kb()
+    texts = _add(manager, 0, 20)
+    results = []
+
+    with manager._write_lock:
+        searcher = threading.Thread(target=lambda: results.append(manager.search(texts[3], k=1, score_threshold=0)))
+        searcher.start()
+        searcher.join(timeout=10)
+        assert not searcher.is_alive(), "写锁被持有时检索被阻塞"
+    assert results[0]["context_list"][0]["chunk_id"] == "kb:3"
+
+
+def test_concurrent_searches_during_ingestion(make_kb, rag_config):
+    rag_config["vector_store"]["faiss"]["index"].update({"segment_rows": 40})
+    manager = make_kb()
+    _add(manager, 0, 40)
+    errors = []
+    done = threading.Event()
+
+    def search_loop():
+        while not done.is_set():
+            result = manager.search_hybrid("快照 第5段 token5", k=3, score_threshold=0)
+            if not result["success"] or result["context_list"][0]["chunk_id"] != "kb:5":
+                errors.append(result)
+
+    searchers = [threading.Thread(target=search_loop) for _ in range(3)]
+    for thread in searchers:
+        thread.start()
+    for start in range(40, 400, 40):
+        _add(manager, start, 40)
+    wait_for_maintenance(manager)
+    done.set()
+    for thread in searchers:
+        thread.join()
+    assert errors == []
+    assert manager.get_stats()["total_texts"] == 400
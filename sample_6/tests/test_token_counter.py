@@ -0,0 +1,50 @@
+import pickle
+
+from conftest import EMBED_MODEL
+from KnowledgeManager.Dependencies import token_counter as token_module
+from KnowledgeManager.Dependencies.token_counter import TokenCounter, estimate_tokens
+
+
+def test_estimate_counts_cjk_per_character():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("中文文本") == 4
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("中文abcd，") == 4
+
+
+def test_counter_memoizes_and_survives_pickling():
+    counter = TokenCounter("estimate", cache_size=8)
+    assert counter.cache_info() is None
+    assert counter("重复的文本") == counter("重复的文本") == 5
+    assert counter.cache_info().hits == 1
+
+    clone = pickle.loads(pickle.dumps(counter))
+    assert clone.cache_info() is None
+    assert clone("重复的文本") == 5
+
+
+def test_long_texts_bypass_the_cache():
+    counter = TokenCounter("estimate")
+    counter("预热")
+    counter("字" * (token_module._MAX_CACHED_CHARS + 1))
+    assert counter.cache_info().currsize == 1
+
+
+def test_unavailable_tokenizer_falls_back_to_estimate():
+    counter = TokenCounter("nosuch:tokenizer")
+    assert counter("中文abcd") == estimate_tokens("中文abcd")
+
+
+def test_token_sized_splitter_respects_max_input_tokens(make_kb, rag_config, monkeypatch):
+    model_config = dict(rag_config["embeddings"]["models"][EMBED_MODEL],
+                        tokenizer="estimate", max_input_tokens=64, chunk_tokens=200)
+    monkeypatch.setitem(rag_config["embeddings"]["models"], EMBED_MODEL, model_config)
+    monkeypatch.setattr(token_module, "_counters", {})
+    manager = make_kb()
+
+    splitter, settings = manager.build_text_splitter()
+    assert settings["chunk_size"] == 64 and settings["tokenizer"] == "estimate"
+    chunks = splitter.split_text("中文内容，用于按 token 计的切分。" * 60)
+    assert chunks
+    assert all(estimate_tokens(chunk) <= 64 for chunk in chunks)
+    assert max(estimate_tokens(chunk) for chunk in chunks) > 32
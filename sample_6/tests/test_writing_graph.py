@@ -0,0 +1,17 @@
+import pytest
+
+pytest.importorskip("langgraph")
+
+from nodes.writings.writing_graph import retrieval_router, writing_router  # noqa: E402
+
+
+def test_prefetch_is_opt_in():
+    assert retrieval_router({}) == "per_chapter"
+    assert writing_router({"current_chapter": 1, "chapter_count": 3}) == "continue_writing"
+
+
+def test_prefetch_routes_when_enabled():
+    state = {"prefetch_knowledge": True, "current_chapter": 1, "chapter_count": 3}
+    assert retrieval_router(state) == "prefetch"
+    assert writing_router(state) == "continue_prefetched"
+    assert writing_router({**state, "current_chapter": 3}) == "finish"